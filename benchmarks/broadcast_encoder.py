@@ -0,0 +1,38 @@
+"""
+Compares the byte-level BroadcastEncoder with str(BroadcasterMessage).encode() as the robot count grows,
+after checking that both give the same bytes. Robots beyond the message's 16 slots are truncated by both,
+so the time at 64 robots includes skipping them.
+
+Usage: python -m benchmarks.broadcast_encoder [--iterations 20000]
+"""
+from jhockey.BroadcastEncoder import BroadcastEncoder
+from jhockey.types import BroadcasterMessage, RobotState
+import argparse
+import logging
+import timeit
+import sys
+
+
+def message(n_robots: int) -> BroadcasterMessage:
+    robots = {4 + i: RobotState(x=(37 * i) % 1000, y=(101 * i) % 1000) for i in range(n_robots)}
+    return BroadcasterMessage(time_dsec=1234, robots=robots, enabled=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000, help="Encodes per measurement. Defaults to 20000.")
+    args = parser.parse_args()
+    # both encoders warn about truncated robots on every message
+    logging.disable(logging.WARNING)
+
+    encoder = BroadcastEncoder()
+    print(f"{'robots':>6} {'bytes':>5} {'str us':>7} {'encoder us':>10} {'speedup':>7}")
+    for n_robots in (4, 16, 64):
+        msg = message(n_robots)
+        expected = str(msg).encode()
+        if bytes(encoder.encode(msg)) != expected:
+            print(f"FAIL: encodings differ at {n_robots} robots")
+            sys.exit(1)
+        str_us = 1e6 * min(timeit.repeat(lambda: str(msg).encode(), number=args.iterations, repeat=3)) / args.iterations
+        encoder_us = 1e6 * min(timeit.repeat(lambda: encoder.encode(msg), number=args.iterations, repeat=3)) / args.iterations
+        print(f"{n_robots:>6} {len(expected):>5} {str_us:>7.2f} {encoder_us:>10.2f} {str_us / encoder_us:>6.1f}x")
@@ -0,0 +1,49 @@
+"""
+Measures per-robot update rates of the fragmented round-robin broadcast as the robot count grows.
+Fragments are paced by the real scheduler and decoded as a receiver would, so the rates include encoding cost.
+
+Usage: python -m benchmarks.broadcast_fragments [--duration 2] [--airtime_budget 0.25]
+"""
+from jhockey.types import BroadcasterMessage, RobotState
+from jhockey.XBeeBroadcaster import RoundRobinScheduler
+from collections import Counter
+import argparse
+import time
+
+
+def decode_ids(frame: str) -> list[int]:
+    robots = frame[10:-3]
+    return [int(robots[i : i + 3]) for i in range(0, len(robots), 9)]
+
+
+def measure(n_robots: int, duration: float, airtime_budget: float) -> tuple[int, int, float, float, float]:
+    robots = {4 + i: RobotState(x=i % 700, y=(7 * i) % 900) for i in range(n_robots)}
+    msg = BroadcasterMessage(time_dsec=1800, robots=robots, enabled=True)
+    scheduler = RoundRobinScheduler(airtime_budget)
+    updates = Counter()
+    last_seq = None
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        frame = scheduler.next_fragment(msg)
+        seq = int(frame[6:8], 16)
+        # a receiver only accepts fragments newer than the last one it saw
+        if last_seq is None or (seq - last_seq) % 256 < 128:
+            updates.update(decode_ids(frame))
+            last_seq = seq
+        scheduler.pace(len(frame))
+    elapsed = time.perf_counter() - start
+    # robots beyond the last fragment are never sent, so the rates cover the broadcast ones
+    rates = [updates[tag] / elapsed for tag in robots if updates[tag]]
+    return msg.fragment_count(), msg.dropped_robots(), min(rates), sum(rates) / len(rates), scheduler.min_update_rate(msg)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds to measure per robot count. Defaults to 2.")
+    parser.add_argument("--airtime_budget", type=float, default=0.25, help="Fraction of the radio channel. Defaults to 0.25.")
+    args = parser.parse_args()
+
+    print(f"{'robots':>6} {'fragments':>9} {'dropped':>7} {'min Hz':>8} {'mean Hz':>8} {'guaranteed Hz':>13}")
+    for n_robots in (4, 8, 16, 32, 64, 100, 150, 200):
+        fragments, dropped, min_rate, mean_rate, guaranteed = measure(n_robots, args.duration, args.airtime_budget)
+        print(f"{n_robots:>6} {fragments:>9} {dropped:>7} {min_rate:>8.1f} {mean_rate:>8.1f} {guaranteed:>13.1f}")
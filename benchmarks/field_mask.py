@@ -0,0 +1,113 @@
+"""
+Compares ArUco detection on full camera frames with detection on frames cropped and masked to the field.
+Renders a synthetic frame with the field tags, --robots robot tags on the field in perspective, and clutter
+around it (checkered noise and stray tags, standing in for crowd and benches). The field homography is
+fitted from a full frame detection, then both paths detect on the same frame. Reports the time per frame,
+the rejected candidates and the tags found, and fails (exit code 1) if the masked path loses a field tag or
+robot, or finds a stray tag.
+
+Usage: python -m benchmarks.field_mask [--robots 8] [--frames 50] [--margin 0.05] [--padding 24]
+"""
+from jhockey.CameraArucoDetector import CameraArucoDetector
+from jhockey.FieldHomography import FieldHomography
+from jhockey.FieldMask import FieldMask, load_field_boundary
+from jhockey.TagRegistry import TagRegistry
+import numpy as np
+import cv2 as cv
+import argparse
+import time
+import sys
+
+WIDTH, HEIGHT = 1280, 720
+TAG_PX = 36
+STRAY_TAGS = [40, 41, 42, 43, 44, 45]
+
+
+def draw_tag(frame: np.ndarray, dictionary, tag_id: int, x: float, y: float):
+    marker = cv.aruco.generateImageMarker(dictionary, tag_id, TAG_PX)
+    # a white quiet zone around the marker
+    tile = np.full((TAG_PX + 12, TAG_PX + 12), 255, dtype=np.uint8)
+    tile[6:-6, 6:-6] = marker
+    x0, y0 = int(x) - tile.shape[1] // 2, int(y) - tile.shape[0] // 2
+    frame[y0 : y0 + tile.shape[0], x0 : x0 + tile.shape[1]] = tile[:, :, None]
+
+
+def render(config: str, n_robots: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    dictionary = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_50)
+    # clutter everywhere, the field is drawn over it
+    blocks = rng.integers(0, 2, (HEIGHT // 8, WIDTH // 8), dtype=np.uint8) * 255
+    frame = np.repeat(np.repeat(blocks, 8, axis=0), 8, axis=1)[:, :, None].repeat(3, axis=2)
+    # the field in perspective, narrower at the far end
+    boundary = load_field_boundary(config)
+    (x_min, y_min), (x_max, y_max) = boundary.min(axis=0), boundary.max(axis=0)
+    field = np.float32([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]])
+    image = np.float32([[470, 120], [810, 120], [900, 620], [380, 620]])
+    H_inv = cv.getPerspectiveTransform(field, image)
+    cv.fillPoly(frame, [image.astype(np.int32)], (90, 140, 90))
+    to_px = lambda x, y: cv.perspectiveTransform(np.float32([[[x, y]]]), H_inv)[0, 0]
+    for tag_id, (x, y) in TagRegistry(config).field_positions.items():
+        draw_tag(frame, dictionary, tag_id, *to_px(x, y))
+    for i in range(n_robots):
+        x = x_min + (x_max - x_min) * (0.2 + 0.6 * ((i % 4) / 3))
+        y = y_min + (y_max - y_min) * (0.25 + 0.5 * ((i // 4) / max(1, (n_robots - 1) // 4)))
+        draw_tag(frame, dictionary, 4 + i, *to_px(x, y))
+    for i, tag_id in enumerate(STRAY_TAGS):
+        draw_tag(frame, dictionary, tag_id, 120 + 190 * (i % 2) + 900 * (i // 3), 150 + 200 * (i % 3))
+    return frame
+
+
+def detect(detector: CameraArucoDetector, frame: np.ndarray, frames: int) -> tuple[float, int, set[int]]:
+    start = time.perf_counter()
+    for _ in range(frames):
+        detector.detect(frame)
+    elapsed = (time.perf_counter() - start) / frames
+    # the rejected candidates of the last frame, detected again to get them
+    image = frame if detector.field_mask is None else detector.field_mask.apply(frame)[0]
+    _, _, rejected = detector.detector.detectMarkers(image)
+    _, detected, _ = detector.detection
+    ids = set() if detected is None else {int(i) for i in detected.reshape(-1)}
+    return elapsed, len(rejected), ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=8, help="Number of robot tags. Defaults to 8.")
+    parser.add_argument("--frames", type=int, default=50, help="Frames to time per path. Defaults to 50.")
+    parser.add_argument("--margin", type=float, default=0.05, help="Field mask margin as a fraction of the field. Defaults to 0.05.")
+    parser.add_argument("--padding", type=int, default=24, help="Field mask padding in pixels. Defaults to 24.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    args = parser.parse_args()
+
+    frame = render(args.config, args.robots)
+    homography = FieldHomography(param_file=args.config)
+    full = CameraArucoDetector()
+    full.detect(frame)
+    homography.find_homography(full.get())
+    if homography.H is None:
+        print("FAIL: field tags not found")
+        sys.exit(1)
+    masked = CameraArucoDetector(
+        field_mask=FieldMask(homography, field_config=args.config, margin=args.margin, padding=args.padding, full_frame_interval=0)
+    )
+
+    print(f"{'path':>8} {'ms/frame':>8} {'rejected':>8} {'tags':>4} {'stray':>5}")
+    results = {}
+    for name, detector in (("full", full), ("masked", masked)):
+        elapsed, rejected, ids = detect(detector, frame, args.frames)
+        results[name] = ids
+        print(f"{name:>8} {1000 * elapsed:>8.2f} {rejected:>8} {len(ids - set(STRAY_TAGS)):>4} {len(ids & set(STRAY_TAGS)):>5}")
+    fraction = masked.field_mask._fraction.value
+    print(f"masked pixels: {100 * fraction:.1f}% of the frame")
+    expected = set(range(4 + args.robots)) | set(TagRegistry(args.config).field_positions)
+    if not expected <= results["masked"] or results["masked"] & set(STRAY_TAGS):
+        print(f"FAIL: masked detection differs, missing {sorted(expected - results['masked'])}")
+        sys.exit(1)
+    # positions are in full frame pixels either way
+    full_tags = {tag.id: (tag.center.x, tag.center.y) for tag in full.get()}
+    for tag in masked.get():
+        x, y = full_tags[tag.id]
+        if abs(tag.center.x - x) > 0.5 or abs(tag.center.y - y) > 0.5:
+            print(f"FAIL: tag {tag.id} moved by the crop")
+            sys.exit(1)
+    print("PASS")
@@ -0,0 +1,101 @@
+"""
+Measures the frame rate each JeVois output format achieves over the serial link as the tag count grows.
+The simulator emits frames as fast as the emulated baud rate allows and switches format on the detector's
+setpar command, like the JeVois module; the detector decodes them in its own thread. Decode time is measured
+separately on frames replayed from memory, so it excludes waiting on the link.
+
+Usage: python -m benchmarks.jevois_formats [--duration 2] [--baudrate 115200]
+"""
+from jhockey.JeVoisArucoDetector import JeVoisArucoDetector
+from jhockey.JeVoisSimulator import JeVoisSimulator
+from jhockey.JeVoisFormat import OUTPUT_MODES
+import argparse
+import logging
+import io
+import time
+
+
+class ReplaySerial(io.BytesIO):
+    """
+    Serial port stand-in that replays recorded frames in a loop.
+    """
+
+    def __init__(self, frames: list[bytes]):
+        super().__init__(b"".join(frames))
+        self.size = len(self.getbuffer())
+
+    def rewind(self):
+        if self.tell() == self.size:
+            self.seek(0)
+
+    def readline(self, *args) -> bytes:
+        self.rewind()
+        return super().readline()
+
+    def read(self, n: int = -1) -> bytes:
+        self.rewind()
+        return super().read(n)
+
+    def read_until(self, expected: bytes) -> bytes:
+        self.rewind()
+        data = self.getbuffer()[self.tell() :].tobytes()
+        end = data.find(expected)
+        end = len(data) if end < 0 else end + len(expected)
+        self.seek(self.tell() + end)
+        return data[:end]
+
+
+def decode_time(mode: str, n_robots: int, n_frames: int = 200) -> float:
+    """
+    Returns the mean seconds to decode one frame.
+    """
+    simulator = JeVoisSimulator(n_robots=n_robots, output_mode=mode)
+    frames = [simulator.frame(i / simulator.fps) for i in range(n_frames)]
+    simulator.stop()
+    detector = JeVoisArucoDetector(output_mode=mode)
+    ser = ReplaySerial(frames)
+    detector.detect(ser)
+    start = time.perf_counter()
+    for _ in range(n_frames):
+        detector.detect(ser)
+    return (time.perf_counter() - start) / n_frames
+
+
+def measure(mode: str, n_robots: int, duration: float, baudrate: int) -> tuple[float, float, int]:
+    """
+    Returns the frames per second decoded, the bytes per frame and the tags in the last frame.
+    """
+    # the simulator starts in the normal format, the detector selects its own when it connects
+    simulator = JeVoisSimulator(n_robots=n_robots, fps=1000, baudrate=baudrate).start()
+    detector = JeVoisArucoDetector(port=simulator.port, baudrate=baudrate, output_mode=mode)
+    detector.connect()
+    detector.start()
+    time.sleep(0.5)
+    frames, sent_frames, sent_bytes = detector.frame_count, simulator.frames_sent, simulator.bytes_sent
+    time.sleep(duration)
+    fps = (detector.frame_count - frames) / duration
+    bytes_per_frame = (simulator.bytes_sent - sent_bytes) / max(1, simulator.frames_sent - sent_frames)
+    n_tags = len(detector.get())
+    detector.stop()
+    # closing the pty ends the detector's read, after which the port can be closed
+    simulator.stop()
+    time.sleep(0.1)
+    detector.disconnect()
+    return fps, bytes_per_frame, n_tags
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds to measure per format and tag count. Defaults to 2.")
+    parser.add_argument("--baudrate", type=int, default=115200, help="Emulated baud rate. Defaults to 115200.")
+    args = parser.parse_args()
+    # every run ends by closing the simulator under the detector
+    logging.basicConfig(level=logging.CRITICAL)
+
+    print(f"{'format':>8} {'tags':>5} {'bytes/frame':>11} {'fps':>7} {'link fps':>8} {'decode us':>9}")
+    for mode in OUTPUT_MODES:
+        for n_robots in (4, 12, 28, 60, 124):
+            fps, bytes_per_frame, n_tags = measure(mode, n_robots, args.duration, args.baudrate)
+            link_fps = args.baudrate / 10 / bytes_per_frame
+            decode_us = 1e6 * decode_time(mode, n_robots)
+            print(f"{mode:>8} {n_tags:>5} {bytes_per_frame:>11.0f} {fps:>7.1f} {link_fps:>8.1f} {decode_us:>9.1f}")
@@ -0,0 +1,146 @@
+"""
+Checks that the steady-state game loop does not allocate.
+Runs GameManager.step() in-process on recorded JeVois frames (replayed from memory, so no serial I/O)
+with the real detector parser, field homography, robot tracker and broadcast encoding, and counts the
+memory blocks allocated under the loop with tracemalloc after a warm-up. Fails (exit code 1) when the
+loop retains more than --max-blocks per iteration, or when more than --max-transient bytes of short-lived
+garbage are live at once during an iteration.
+
+Usage: python -m benchmarks.loop_allocations [--robots 8] [--iterations 1000] [--max-blocks 0.05] [--max-transient 1536]
+"""
+from jhockey.JeVoisArucoDetector import JeVoisArucoDetector
+from jhockey.JeVoisSimulator import JeVoisSimulator
+from jhockey.FieldHomography import FieldHomography
+from jhockey.RobotTracker import RobotTracker
+from jhockey.GameManager import GameManager
+from jhockey.TagRegistry import TagRegistry
+from jhockey.HeadlessGUI import HeadlessGUI
+from jhockey.PausableTimer import PausableTimer
+from jhockey.XBeeBroadcaster import XBeeBroadcaster
+from jhockey.types import GameState
+import jhockey.GameManager
+import jhockey.types
+import argparse
+import tracemalloc
+import time
+import gc
+import sys
+
+FRAMES = 64
+
+
+class ReplaySerial:
+    """
+    Serial port stand-in that replays recorded JeVois frames in a loop without allocating.
+    """
+
+    def __init__(self, frames: list[bytes]):
+        self.lines = [line + b"\n" for frame in frames for line in frame.splitlines()]
+        self.index = 0
+
+    def readline(self) -> bytes:
+        line = self.lines[self.index]
+        self.index = (self.index + 1) % len(self.lines)
+        return line
+
+
+def build(n_robots: int, n_frames: int, config: str) -> tuple[GameManager, XBeeBroadcaster]:
+    simulator = JeVoisSimulator(n_robots=n_robots)
+    frames = [simulator.frame(i / simulator.fps) for i in range(n_frames)]
+    simulator.stop()
+    detector = JeVoisArucoDetector()
+    detector.ser_port = ReplaySerial(frames)
+    detector.connected = True
+    tag_registry = TagRegistry(aruco_config=config)
+    homography = FieldHomography(param_file=config, tag_registry=tag_registry)
+    # the broadcaster is never connected, so messages are only encoded below
+    broadcaster = XBeeBroadcaster(port="/dev/null")
+    gm = GameManager(
+        match_length_sec=1 << 20,
+        broadcaster=broadcaster,
+        robot_tracker=RobotTracker(aruco_config=config, field_homography=homography, tag_registry=tag_registry),
+        field_homography=homography,
+        aruco_detector=detector,
+        gui=HeadlessGUI(),
+        timer=PausableTimer(),
+        tag_registry=tag_registry,
+    )
+    return gm, broadcaster
+
+
+def iterate(gm: GameManager, broadcaster: XBeeBroadcaster, n: int):
+    for _ in range(n):
+        gm.step()
+        broadcaster.encoder.encode(broadcaster.message)
+
+
+def transient_peak(gm: GameManager, broadcaster: XBeeBroadcaster, n: int) -> tuple[float, int]:
+    """
+    Returns the mean and max bytes live at once during an iteration on top of what was allocated before it,
+    which counts short-lived garbage that a snapshot comparison cannot see.
+    """
+    total, largest = 0, 0
+    for _ in range(n):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        iterate(gm, broadcaster, 1)
+        peak = tracemalloc.get_traced_memory()[1] - current
+        total += peak
+        largest = max(largest, peak)
+    return total / n, largest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=8, help="Number of robots. Defaults to 8.")
+    parser.add_argument("--iterations", type=int, default=1000, help="Measured loop iterations. Defaults to 1000.")
+    parser.add_argument("--warmup", type=int, default=500, help="Loop iterations before measuring. Defaults to 500.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    parser.add_argument("--max-blocks", type=float, default=0.05, help="Fail above this many retained blocks per iteration. Defaults to 0.05.")
+    parser.add_argument("--max-transient", type=int, default=1536, help="Fail above this many transient bytes per iteration. Defaults to 1536.")
+    args = parser.parse_args()
+
+    gm, broadcaster = build(args.robots, FRAMES, args.config)
+    gm.state = GameState.RUNNING
+    iterate(gm, broadcaster, args.warmup)
+    if gm.state != GameState.RUNNING:
+        sys.exit("The match did not start")
+
+    # count the blocks allocated anywhere below the loop, including the detector and tracker
+    tracemalloc.start(32)
+    loop_only = [
+        tracemalloc.Filter(True, jhockey.GameManager.__file__, all_frames=True),
+        tracemalloc.Filter(True, jhockey.types.__file__, all_frames=True),
+    ]
+    # one pass over the recorded frames, so values first seen while tracing are not counted
+    iterate(gm, broadcaster, FRAMES)
+    # filtering compiles the patterns, which should not count towards the loop
+    tracemalloc.take_snapshot().filter_traces(loop_only)
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    # interpreter free lists (i.e. for lists and floats) hold on to up to ~80 blocks after the first snapshot,
+    # so retained memory is taken as the growth between a first and a second run of the loop
+    iterate(gm, broadcaster, args.iterations)
+    before = tracemalloc.take_snapshot().filter_traces(loop_only)
+    start = time.perf_counter()
+    iterate(gm, broadcaster, args.iterations)
+    elapsed = time.perf_counter() - start
+    after = tracemalloc.take_snapshot().filter_traces(loop_only)
+    collections = gc.get_stats()[0]["collections"] - collections
+    mean_peak, max_peak = transient_peak(gm, broadcaster, args.iterations)
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "lineno")
+    blocks = sum(stat.count_diff for stat in stats) / args.iterations
+    size = sum(stat.size_diff for stat in stats) / args.iterations
+    print(f"{args.robots} robots, {args.iterations} iterations, {1e6 * elapsed / args.iterations:.0f} us per iteration (traced)")
+    print(f"retained per iteration: {blocks:.3f} blocks, {size:.1f} bytes")
+    print(f"transient per iteration: {mean_peak:.0f} bytes mean, {max_peak} bytes max")
+    print(f"gen0 collections: {collections}")
+    for stat in stats[:10]:
+        if stat.count_diff != 0:
+            print(f"  {stat.count_diff:+6d} blocks {stat.size_diff:+8d} B  {stat.traceback[0]}")
+    if blocks > args.max_blocks or mean_peak > args.max_transient:
+        print("FAIL")
+        sys.exit(1)
+    print("PASS")
@@ -0,0 +1,218 @@
+"""
+Soak test: runs the full main.py pipeline headless for a long time and checks that it stays stable.
+Tags come from the JeVois simulator and broadcasts go to the XBee stand-in from benchmarks.xbee_loopback,
+while matches are played back to back. Every --interval seconds the RSS, per-thread CPU, stage latencies
+and GC pauses are sampled (optionally written to --csv); after the run the tracemalloc top allocators are
+listed and the summary fails (exit code 1) when a threshold is exceeded.
+
+Drift is measured between the first and the last quarter of the samples after the warm-up.
+
+Usage: python -m benchmarks.soak [--duration 3600] [--interval 10] [--warmup 60] [--robots 8] [-- main.py arguments]
+"""
+from benchmarks.xbee_loopback import XBeeStandIn
+from jhockey.Metrics import metrics, thread_cpu_seconds
+from dataclasses import dataclass
+from threading import Thread
+import numpy as np
+import argparse
+import tracemalloc
+import runpy
+import time
+import gc
+import os
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class GCMonitor:
+    """
+    Times every garbage collection through gc.callbacks.
+    """
+
+    def __init__(self):
+        self.max_pause = 0.0  # longest pause since the last sample
+        self.collections = 0
+        self._start = None
+        self._pauses = {generation: metrics.histogram("gc_pause_seconds", generation=str(generation)) for generation in range(3)}
+
+    def start(self) -> "GCMonitor":
+        gc.callbacks.append(self.on_gc)
+        return self
+
+    def on_gc(self, phase: str, info: dict):
+        if phase == "start":
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            pause = time.perf_counter() - self._start
+            self._start = None
+            self._pauses[info["generation"]].observe(pause)
+            self.max_pause = max(self.max_pause, pause)
+            self.collections += 1
+
+    def take_max_pause(self) -> float:
+        pause, self.max_pause = self.max_pause, 0.0
+        return pause
+
+
+@dataclass
+class Sample:
+    t: float
+    rss: int
+    gc_max_pause: float
+    gc_collections: int
+    frames_sent: int
+    thread_cpu: dict[str, float]
+    stages: dict[str, tuple[int, float]]  # name: (iterations, total latency)
+
+
+def take_sample(start: float, gc_monitor: GCMonitor, radio: XBeeStandIn) -> Sample:
+    return Sample(
+        t=time.perf_counter() - start,
+        rss=rss_bytes(),
+        gc_max_pause=gc_monitor.take_max_pause(),
+        gc_collections=gc_monitor.collections,
+        frames_sent=radio.frames_received,
+        thread_cpu=thread_cpu_seconds(),
+        stages={name: (stage.latency.count, stage.latency.sum) for name, stage in metrics.stages().items()},
+    )
+
+
+def mean_latency(first: Sample, last: Sample, stage: str) -> float | None:
+    count0, sum0 = first.stages.get(stage, (0, 0.0))
+    count1, sum1 = last.stages.get(stage, (0, 0.0))
+    return (sum1 - sum0) / (count1 - count0) if count1 > count0 else None
+
+
+def cpu_percent(first: Sample, last: Sample, thread: str) -> float:
+    return 100 * (last.thread_cpu.get(thread, 0.0) - first.thread_cpu.get(thread, 0.0)) / (last.t - first.t)
+
+
+def run_pipeline(argv: list[str]):
+    sys.argv = [MAIN, *argv]
+    runpy.run_path(MAIN, run_name="__main__")
+
+
+if __name__ == "__main__":
+    # everything after "--" is passed to main.py
+    argv = sys.argv[1:]
+    main_args = argv[argv.index("--") + 1 :] if "--" in argv else []
+    argv = argv[: argv.index("--")] if "--" in argv else argv
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=3600.0, help="Seconds to run. Defaults to 3600.")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between samples. Defaults to 10.")
+    parser.add_argument("--warmup", type=float, default=60.0, help="Seconds before the baseline is taken. Defaults to 60.")
+    parser.add_argument("--robots", type=int, default=8, help="Number of simulated robots. Defaults to 8.")
+    parser.add_argument("--match-length", type=int, default=60, help="Match length in seconds. Defaults to 60.")
+    parser.add_argument("--csv", type=str, default=None, help="Write the samples to this CSV file.")
+    parser.add_argument("--top", type=int, default=10, help="Number of top allocators to list. Defaults to 10.")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Do not trace allocations (lower overhead).")
+    parser.add_argument("--max-rss-growth", type=float, default=20.0, help="Fail above this RSS growth after warm-up, in MB. Defaults to 20.")
+    parser.add_argument("--max-gc-pause", type=float, default=50.0, help="Fail above this GC pause, in ms. Defaults to 50.")
+    parser.add_argument("--max-latency-drift", type=float, default=1.5, help="Fail when a stage's mean latency grows by this factor. Defaults to 1.5.")
+    parser.add_argument("--latency-floor", type=float, default=1.0, help="Ignore latency drift smaller than this, in ms. Defaults to 1.")
+    parser.add_argument("--max-cpu-drift", type=float, default=10.0, help="Fail when a thread's CPU use grows by this many percentage points. Defaults to 10.")
+    args = parser.parse_args(argv)
+    if args.warmup + 2 * args.interval > args.duration:
+        parser.error("--duration must leave at least two samples after --warmup")
+
+    radio = XBeeStandIn(baudrate=115200, radio_latency=0.005).start()
+    main_args = ["--headless", "--match-length", str(args.match_length), *main_args]
+    if "--camera" not in main_args and "--jevois_port" not in main_args:
+        main_args += ["--simulate", str(args.robots)]
+    if "--radio_port" not in main_args:
+        main_args += ["--radio_port", radio.port]
+    print("main.py " + " ".join(main_args))
+
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    gc_monitor = GCMonitor().start()
+    Thread(target=run_pipeline, args=(main_args,), name="Pipeline", daemon=True).start()
+
+    start = time.perf_counter()
+    samples: list[Sample] = []
+    baseline_snapshot = None
+    csv = open(args.csv, "w") if args.csv is not None else None
+    if csv is not None:
+        csv.write("t,rss_mb,gc_max_pause_ms,gc_collections,frames_sent,game_manager_hz\n")
+    while time.perf_counter() - start < args.duration:
+        time.sleep(args.interval)
+        sample = take_sample(start, gc_monitor, radio)
+        samples.append(sample)
+        if baseline_snapshot is None and sample.t >= args.warmup and not args.no_tracemalloc:
+            baseline_snapshot = tracemalloc.take_snapshot()
+        loop_rate = 0.0
+        if len(samples) > 1:
+            previous = samples[-2]
+            loop_rate = (sample.stages.get("game_manager", (0, 0))[0] - previous.stages.get("game_manager", (0, 0))[0]) / (sample.t - previous.t)
+        line = (
+            f"{sample.t:.0f},{sample.rss / 2**20:.1f},{1e3 * sample.gc_max_pause:.2f},"
+            f"{sample.gc_collections},{sample.frames_sent},{loop_rate:.1f}"
+        )
+        if csv is not None:
+            csv.write(line + "\n")
+            csv.flush()
+        print(
+            f"t={sample.t:6.0f} s  rss={sample.rss / 2**20:7.1f} MB  gc max={1e3 * sample.gc_max_pause:6.2f} ms  "
+            f"frames={sample.frames_sent:7d}  loop={loop_rate:5.1f} Hz"
+        )
+    if csv is not None:
+        csv.close()
+
+    steady = [sample for sample in samples if sample.t >= args.warmup]
+    quarter = max(1, len(steady) // 4)
+    early, late = steady[: quarter + 1], steady[-quarter - 1 :]
+    failures = []
+
+    print("\nMemory")
+    growth = (steady[-1].rss - steady[0].rss) / 2**20
+    t = np.array([sample.t for sample in steady])
+    rss = np.array([sample.rss for sample in steady]) / 2**20
+    slope = np.polyfit(t, rss, 1)[0] * 3600 if len(steady) > 1 else 0.0
+    print(f"  RSS {steady[0].rss / 2**20:.1f} -> {steady[-1].rss / 2**20:.1f} MB ({growth:+.1f} MB, trend {slope:+.1f} MB/h)")
+    if growth > args.max_rss_growth:
+        failures.append(f"RSS grew by {growth:.1f} MB (limit {args.max_rss_growth:g} MB)")
+
+    max_pause = 1e3 * max(sample.gc_max_pause for sample in steady)
+    print(f"  GC collections {steady[-1].gc_collections - steady[0].gc_collections}, longest pause {max_pause:.2f} ms")
+    if max_pause > args.max_gc_pause:
+        failures.append(f"GC paused for {max_pause:.1f} ms (limit {args.max_gc_pause:g} ms)")
+
+    if baseline_snapshot is not None:
+        print(f"  Top allocators since warm-up")
+        for stat in tracemalloc.take_snapshot().compare_to(baseline_snapshot, "lineno")[: args.top]:
+            print(f"    {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {stat.traceback[0]}")
+
+    print("\nStage latency (mean, early -> late)")
+    for stage in sorted(late[-1].stages):
+        before, after = mean_latency(early[0], early[-1], stage), mean_latency(late[0], late[-1], stage)
+        if before is None or after is None:
+            print(f"  {stage:<24} stalled" if before is not None else f"  {stage:<24} idle")
+            if before is not None:
+                failures.append(f"stage {stage} stopped running")
+            continue
+        print(f"  {stage:<24} {1e3 * before:8.3f} -> {1e3 * after:8.3f} ms")
+        if after > args.max_latency_drift * before and 1e3 * (after - before) > args.latency_floor:
+            failures.append(f"stage {stage} latency grew from {1e3 * before:.2f} to {1e3 * after:.2f} ms")
+
+    print("\nThread CPU (early -> late)")
+    for thread in sorted(late[-1].thread_cpu):
+        before, after = cpu_percent(early[0], early[-1], thread), cpu_percent(late[0], late[-1], thread)
+        print(f"  {thread:<32} {before:6.1f} -> {after:6.1f} %")
+        if after - before > args.max_cpu_drift:
+            failures.append(f"thread {thread} CPU grew from {before:.1f} to {after:.1f} %")
+
+    if late[-1].frames_sent == late[0].frames_sent:
+        failures.append("no frames were broadcast at the end of the run")
+
+    print()
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("PASS")
@@ -0,0 +1,161 @@
+"""
+Injects pipeline stalls and measures how the watchdog handles them.
+Runs the JeVois simulator, a threaded JeVois detector under a DeviceSupervisor, the robot tracker and the game
+loop with a headless GUI on the wall clock, then:
+- hangs the camera: the simulator stays connected but stops sending, until it is resumed after --hold seconds
+- kills the detector thread with an exception
+- hangs the game loop, so only the watchdog can take the robots out of the broadcast
+For each fault it reports when the GUI showed the stall, whether every robot was marked not found and left
+out of the broadcast meanwhile, and when tracking recovered. Fails (exit code 1) if a stall takes more than a
+second to show up, robots stay found, or the pipeline does not recover.
+
+Usage: python -m benchmarks.stall_recovery [--budget 0.5] [--hold 2] [--robots 4]
+"""
+from jhockey.JeVoisSimulator import JeVoisSimulator
+from jhockey.JeVoisArucoDetector import JeVoisArucoDetector
+from jhockey.DeviceSupervisor import DeviceSupervisor
+from jhockey.FieldHomography import FieldHomography
+from jhockey.RobotTracker import RobotTracker
+from jhockey.GameManager import GameManager
+from jhockey.HeadlessGUI import HeadlessGUI
+from jhockey.PausableTimer import PausableTimer
+from jhockey.TagRegistry import TagRegistry
+from jhockey.Watchdog import Watchdog, restart
+from jhockey.XBeeBroadcaster import XBeeBroadcaster
+from jhockey.Metrics import metrics
+from jhockey.types import StageState
+import threading
+import argparse
+import logging
+import time
+import sys
+
+
+def wait_for(condition, timeout: float) -> float | None:
+    """
+    Returns the seconds until condition() held, or None after timeout.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter() - start
+        time.sleep(0.005)
+    return None
+
+
+def crash(detector: JeVoisArucoDetector):
+    read_frame = detector._read_frame
+
+    def fail(ser):
+        detector._read_frame = read_frame
+        raise RuntimeError("injected detector crash")
+
+    detector._read_frame = fail
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=0.5, help="Stall budget in seconds. Defaults to 0.5.")
+    parser.add_argument("--hold", type=float, default=2.0, help="Seconds the camera hangs. Defaults to 2.")
+    parser.add_argument("--robots", type=int, default=4, help="Number of simulated robots. Defaults to 4.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    # the injected crash is expected
+    threading.excepthook = lambda hook_args: None
+
+    simulator = JeVoisSimulator(n_robots=args.robots).start()
+    detector = JeVoisArucoDetector(port=simulator.port)
+    supervisor = DeviceSupervisor().add(detector).start()
+    detector.start()
+    tag_registry = TagRegistry(aruco_config=args.config)
+    homography = FieldHomography(param_file=args.config, tag_registry=tag_registry)
+    tracker = RobotTracker(aruco_config=args.config, field_homography=homography, tag_registry=tag_registry)
+    gui = HeadlessGUI(autoplay=False)
+    # never connected, the broadcast message is only built
+    broadcaster = XBeeBroadcaster(port="/dev/null")
+    watchdog = Watchdog(robot_tracker=tracker, broadcaster=broadcaster)
+    watchdog.add_listener(gui.on_stage_state)
+    watchdog.watch(
+        detector.name,
+        lambda: detector.frame_count,
+        args.budget,
+        restart(detector.name, start=detector.start, device=detector),
+        tracking=True,
+    )
+    game_loop = metrics.stage("game_manager")
+    watchdog.watch("Game Manager", lambda: game_loop.rate.count, args.budget, tracking=True)
+    gm = GameManager(
+        match_length_sec=180,
+        broadcaster=broadcaster,
+        robot_tracker=tracker,
+        field_homography=homography,
+        aruco_detector=detector,
+        gui=gui,
+        timer=PausableTimer(),
+        tag_registry=tag_registry,
+        watchdog=watchdog,
+    )
+    # stepped here rather than by gm.start(), so the loop is stopped before the interpreter exits
+    running = True
+    hung = threading.Event()
+
+    def game_loop_thread():
+        while running:
+            if hung.is_set():
+                time.sleep(0.005)
+                continue
+            gm.step()
+
+    loop = threading.Thread(target=game_loop_thread, name="Game Manager", daemon=True)
+    loop.start()
+    watchdog.start()
+
+    def tracking() -> bool:
+        robots = gm.robot_states or {}
+        return len(robots) == args.robots and all(robot.found for robot in robots.values()) and len(broadcaster.message.robots) > 0
+
+    def stalled() -> bool:
+        return StageState.STALLED in gui.stage_states.values()
+
+    def not_found() -> bool:
+        robots = gm.robot_states or {}
+        return len(broadcaster.message.robots) == 0 and not any(robot.found for robot in robots.values())
+
+    failed = False
+    if wait_for(tracking, 10.0) is None:
+        print("FAIL: the pipeline did not start tracking")
+        failed = True
+
+    faults = [] if failed else [
+        ("camera hang", lambda: setattr(simulator, "paused", True), lambda: setattr(simulator, "paused", False)),
+        ("detector crash", lambda: crash(detector), None),
+        ("game loop hang", hung.set, hung.clear),
+    ]
+    print(f"{'fault':>14} {'shown after s':>13} {'robots dropped':>14} {'recovered after s':>17}")
+    for name, inject, resolve in faults:
+        inject()
+        shown = wait_for(stalled, 5.0)
+        dropped = shown is not None and wait_for(not_found, 0.5) is not None
+        if resolve is not None:
+            time.sleep(max(0.0, args.hold - (shown or 0.0)))
+            resolve()
+        recovered = wait_for(lambda: not stalled() and tracking(), 15.0)
+        print(
+            f"{name:>14} {'-' if shown is None else f'{shown:.2f}':>13} {str(dropped):>14} "
+            f"{'-' if recovered is None else f'{recovered:.2f}':>17}"
+        )
+        if shown is None or shown > 1.0 or not dropped or recovered is None:
+            failed = True
+    recoveries = sum(counter.value for key, counter in metrics._counters.items() if "stage_recoveries" in str(key))
+    print(f"recovery attempts: {recoveries:.0f}")
+    running = False
+    loop.join()
+    watchdog.stop()
+    supervisor.stop()
+    detector.stop()
+    simulator.stop()
+    if failed:
+        print("FAIL")
+        sys.exit(1)
+    print("PASS")
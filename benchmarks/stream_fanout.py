@@ -0,0 +1,104 @@
+"""
+Measures the cost of the state stream as the number of WebSocket clients grows.
+A publisher thread publishes snapshots of --robots robots at --rate Hz to a StateStream served by uvicorn in
+its own thread; every client subscribes to all robots, or with --subset to one of four fixed robot pairs.
+Reports the server thread's CPU use, encodes per snapshot (one per distinct subscription, however many
+clients there are) and the frames each client received.
+
+Usage: python -m benchmarks.stream_fanout [--duration 3] [--robots 16] [--rate 30] [--subset]
+"""
+from jhockey.StateStream import StateStream, add_stream_route, decode_snapshot
+from jhockey.Metrics import metrics, thread_cpu_seconds
+from jhockey.types import GameState, Team, RobotState
+from threading import Thread
+import argparse
+import asyncio
+import logging
+import socket
+import math
+import json
+import time
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(stream: StateStream, port: int):
+    from fastapi import FastAPI
+    import uvicorn
+
+    app = FastAPI()
+    add_stream_route(app, stream)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="error")
+
+
+def publish(stream: StateStream, n_robots: int, rate: float, stop: list[bool]):
+    robots = {4 + i: RobotState(x=0, y=0) for i in range(n_robots)}
+    score = {Team.RED: 0, Team.BLUE: 0}
+    start = time.perf_counter()
+    while not stop[0]:
+        t = time.perf_counter() - start
+        for i, robot in enumerate(robots.values()):
+            robot.x = 300 + 200 * math.sin(t + i)
+            robot.y = 400 + 300 * math.cos(t + i)
+        stream.publish(180 - t, GameState.RUNNING, score, robots)
+        time.sleep(1 / rate)
+
+
+async def client(port: int, subscription: dict, duration: float) -> int:
+    import websockets
+
+    received = 0
+    async with websockets.connect(f"ws://127.0.0.1:{port}/stream") as ws:
+        await ws.send(json.dumps(subscription))
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=end - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            decode_snapshot(message)
+            received += 1
+    return received
+
+
+async def measure(port: int, n_clients: int, subset: bool, rate: float, duration: float) -> list[int]:
+    subscriptions = [
+        {"robots": [4 + 2 * (i % 4), 5 + 2 * (i % 4)], "rate": rate} if subset else {"rate": rate}
+        for i in range(n_clients)
+    ]
+    return await asyncio.gather(*(client(port, s, duration) for s in subscriptions))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds to measure per client count. Defaults to 3.")
+    parser.add_argument("--robots", type=int, default=16, help="Number of robots. Defaults to 16.")
+    parser.add_argument("--rate", type=float, default=30.0, help="Publish and subscription rate in Hz. Defaults to 30.")
+    parser.add_argument("--subset", action="store_true", help="Clients subscribe to robot pairs instead of all robots.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    stream = StateStream()
+    port = free_port()
+    Thread(target=serve, args=(stream, port), name="Stream Server", daemon=True).start()
+    stop = [False]
+    Thread(target=publish, args=(stream, args.robots, args.rate, stop), name="Publisher", daemon=True).start()
+    time.sleep(1.0)
+    encodes = metrics.counter("stream_encodes")
+
+    print(f"{'clients':>7} {'server CPU %':>12} {'encodes/snapshot':>16} {'frames/client':>13} {'min frames':>10}")
+    for n_clients in (1, 10, 50, 100):
+        cpu = thread_cpu_seconds().get("Stream Server", 0.0)
+        encoded, seq = encodes.value, stream.seq
+        received = asyncio.run(measure(port, n_clients, args.subset, args.rate, args.duration))
+        cpu = thread_cpu_seconds().get("Stream Server", 0.0) - cpu
+        per_snapshot = (encodes.value - encoded) / max(1, stream.seq - seq)
+        print(
+            f"{n_clients:>7} {100 * cpu / args.duration:>12.1f} {per_snapshot:>16.2f} "
+            f"{sum(received) / n_clients:>13.1f} {min(received):>10}"
+        )
+    stop[0] = True
@@ -0,0 +1,60 @@
+"""
+Records a synthetic full-length match through the TrajectoryStore and times the analysis queries on it.
+
+Usage: python -m benchmarks.trajectory_queries [--robots 16] [--rate 60] [--match-length 180]
+"""
+from jhockey.TrajectoryStore import TrajectoryStore, MatchTrajectory
+from jhockey.JeVoisSimulator import lissajous_trajectory
+from jhockey.types import RobotState, PuckState
+import argparse
+import tempfile
+import time
+import os
+
+
+def timed(label: str, query, repeat: int = 20):
+    query()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = query()
+    print(f"{label:<28} {1e3 * (time.perf_counter() - start) / repeat:8.3f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=16, help="Number of robots. Defaults to 16.")
+    parser.add_argument("--rate", type=float, default=60.0, help="Game loop rate in Hz. Defaults to 60.")
+    parser.add_argument("--match-length", type=float, default=180.0, help="Match length in seconds. Defaults to 180.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TrajectoryStore(directory=directory).start()
+        store.start_match()
+        robots = {4 + i: RobotState() for i in range(args.robots)}
+        n_loops = int(args.match_length * args.rate)
+        append_time = 0.0
+        for step in range(n_loops):
+            t = step / args.rate
+            for i, robot in enumerate(robots.values()):
+                robot.x, robot.y = lissajous_trajectory(t, i)
+                robot.found = (step + i) % 50 != 0
+            start = time.perf_counter()
+            store.append(t, robots, PuckState(0, 0, False))
+            append_time += time.perf_counter() - start
+        start = time.perf_counter()
+        store.stop()
+        print(f"{n_loops} loops, {n_loops * (args.robots + 1)} rows")
+        print(f"{'append (game loop)':<28} {1e6 * append_time / n_loops:8.3f} us")
+        print(f"{'write + finalize':<28} {1e3 * (time.perf_counter() - start):8.3f} ms")
+
+        match_dir = os.path.join(directory, os.listdir(directory)[0])
+        timed("open", lambda: MatchTrajectory(match_dir))
+        match = MatchTrajectory(match_dir)
+        timed("time range (10 s)", lambda: match.time_range(60, 70))
+        timed("robot slice", lambda: match.robot(4))
+        timed("distance (1 robot)", lambda: match.distance(4))
+        timed("max speed (1 robot)", lambda: match.max_speed(4))
+        timed("occupancy (all robots)", lambda: match.occupancy())
+        timed("summary (all robots)", match.summary, repeat=5)
+        print(match.summary())
@@ -0,0 +1,102 @@
+"""
+Measures offline video tracking against the number of worker processes.
+Records a synthetic match video (field tags, --robots robots moving on Lissajous curves), tracks it once in
+a single chunk as the reference, then in --chunk second chunks with 1, 2, 4... workers up to the core count.
+Reports the speed relative to real time and fails (exit code 1) if a chunked run finds a robot the reference
+does not, misses one, or places one elsewhere.
+
+Usage: python -m benchmarks.video_batch [--duration 60] [--chunk 10] [--robots 8] [--workers 1 2 4]
+"""
+from jhockey.VideoBatch import BatchConfig, process_video
+from jhockey.TrajectoryStore import MatchTrajectory
+from jhockey.TagRegistry import TagRegistry
+from benchmarks.field_mask import draw_tag
+import numpy as np
+import cv2 as cv
+import argparse
+import tempfile
+import logging
+import time
+import math
+import sys
+import os
+
+WIDTH, HEIGHT = 640, 480
+FPS = 30.0
+
+
+def record(path: str, config: str, n_robots: int, duration: float):
+    dictionary = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_4X4_50)
+    positions = TagRegistry(config).field_positions
+    field = np.float32(list(positions.values()))
+    (x_min, y_min), (x_max, y_max) = field.min(axis=0), field.max(axis=0)
+    corners = np.float32([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]])
+    image = np.float32([[200, 60], [440, 60], [500, 420], [140, 420]])
+    H_inv = cv.getPerspectiveTransform(corners, image)
+    background = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+    cv.fillPoly(background, [image.astype(np.int32)], (90, 140, 90))
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"MJPG"), FPS, (WIDTH, HEIGHT))
+    for frame_index in range(int(duration * FPS)):
+        t = frame_index / FPS
+        frame = background.copy()
+        points = [positions[tag] for tag in sorted(positions)]
+        for i in range(n_robots):
+            u = 0.5 + 0.3 * math.sin((0.2 + 0.05 * i) * t + i)
+            v = 0.5 + 0.3 * math.sin((0.3 + 0.04 * i) * t + 2 * i)
+            points.append((x_min + (x_max - x_min) * u, y_min + (y_max - y_min) * v))
+        px = cv.perspectiveTransform(np.float32([points]), H_inv)[0]
+        for tag, (x, y) in zip(sorted(positions) + [4 + i for i in range(n_robots)], px):
+            draw_tag(frame, dictionary, tag, x, y)
+        writer.write(frame)
+    writer.release()
+
+
+def found(match_dir: str) -> dict[tuple[int, float], tuple[float, float]]:
+    match = MatchTrajectory(match_dir)
+    columns = match.columns
+    mask = columns["found"]
+    return {
+        (int(tag), round(float(t), 3)): (float(x), float(y))
+        for tag, t, x, y in zip(columns["id"][mask], columns["time"][mask], columns["x"][mask], columns["y"][mask])
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=60.0, help="Video length in seconds. Defaults to 60.")
+    parser.add_argument("--chunk", type=float, default=10.0, help="Chunk length in seconds. Defaults to 10.")
+    parser.add_argument("--robots", type=int, default=8, help="Number of robots. Defaults to 8.")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Worker counts to measure. Defaults to 1, 2, 4... up to the core count.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        video = os.path.join(directory, "match.avi")
+        record(video, args.config, args.robots, args.duration)
+        settings = BatchConfig(video=video, config=args.config, field_mask=False)
+        start = time.perf_counter()
+        reference_dir, frames, _ = process_video(settings, 1, args.duration + 1, 0, directory, "reference")
+        reference_time = time.perf_counter() - start
+        reference = found(reference_dir)
+        print(f"reference: {frames} frames, {args.duration / reference_time:.1f}x real time, {len(reference)} positions")
+
+        workers = args.workers or [1]
+        while args.workers is None and workers[-1] * 2 <= (os.cpu_count() or 1):
+            workers.append(workers[-1] * 2)
+        print(f"{'workers':>7} {'seconds':>7} {'x real time':>11} {'speedup':>7} {'overlap disagreements':>21}")
+        failed = False
+        for n in workers:
+            start = time.perf_counter()
+            match_dir, _, disagreements = process_video(settings, n, args.chunk, 2.0, directory, f"workers-{n}")
+            elapsed = time.perf_counter() - start
+            print(f"{n:>7} {elapsed:>7.1f} {args.duration / elapsed:>11.1f} {reference_time / elapsed:>6.1f}x {disagreements:>21}")
+            positions = found(match_dir)
+            if positions.keys() != reference.keys() or any(
+                math.dist(positions[key], reference[key]) > 1e-3 for key in reference
+            ):
+                print(f"FAIL: {n} workers differ from the reference")
+                failed = True
+    if failed:
+        sys.exit(1)
+    print("PASS")
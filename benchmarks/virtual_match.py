@@ -0,0 +1,89 @@
+"""
+Simulates full matches on a virtual clock in a single thread and checks that they are reproducible.
+The JeVois simulator renders a frame for every step at the virtual time, and the detector parser, field
+homography, robot tracker, broadcast encoding and headless referee run in order via GameManager.run_until().
+Every broadcast message and robot pose is hashed, so two runs (or a run and --expect) must give the same digest.
+Fails (exit code 1) when the runs differ or do not match --expect.
+
+Usage: python -m benchmarks.virtual_match [--robots 8] [--match-length 180] [--noise 2] [--expect DIGEST]
+"""
+from jhockey.Clock import VirtualClock
+from jhockey.JeVoisArucoDetector import JeVoisArucoDetector
+from jhockey.JeVoisSimulator import JeVoisSimulator
+from jhockey.FieldHomography import FieldHomography
+from jhockey.RobotTracker import RobotTracker
+from jhockey.GameManager import GameManager
+from jhockey.HeadlessGUI import HeadlessGUI
+from jhockey.PausableTimer import PausableTimer
+from jhockey.TagRegistry import TagRegistry
+from jhockey.XBeeBroadcaster import XBeeBroadcaster
+import argparse
+import hashlib
+import struct
+import time
+import sys
+
+
+def run(n_robots: int, match_length: int, noise: float, fps: float, config: str) -> tuple[str, int, int, float]:
+    """
+    Plays one match from a fresh pipeline. Returns the digest, the steps, the matches started and the wall time.
+    """
+    clock = VirtualClock()
+    simulator = JeVoisSimulator(n_robots=n_robots, noise=noise, seed=0)
+    detector = JeVoisArucoDetector()
+    detector.ser_port = simulator.serial(clock)
+    detector.connected = True
+    tag_registry = TagRegistry(aruco_config=config)
+    homography = FieldHomography(param_file=config, tag_registry=tag_registry)
+    # never connected, messages are only encoded
+    broadcaster = XBeeBroadcaster(port="/dev/null")
+    gui = HeadlessGUI(between_matches=1.0, clock=clock)
+    gm = GameManager(
+        match_length_sec=match_length,
+        broadcaster=broadcaster,
+        robot_tracker=RobotTracker(aruco_config=config, field_homography=homography, tag_registry=tag_registry),
+        field_homography=homography,
+        aruco_detector=detector,
+        gui=gui,
+        timer=PausableTimer(clock),
+        tag_registry=tag_registry,
+        clock=clock,
+    )
+    digest = hashlib.sha256()
+    pose = struct.Struct("<iddd?")
+    steps = 0
+    # the referee starts the match after between_matches, which then runs to the end
+    end = gui.between_matches + match_length + 1.0
+    start = time.perf_counter()
+    while clock.now() < end:
+        steps += gm.run_until(clock.now() + 1 / fps, dt=1 / fps)
+        digest.update(broadcaster.encoder.encode(broadcaster.message))
+        for tag, robot in gm.robot_states.items():
+            digest.update(pose.pack(tag, robot.x, robot.y, robot.heading, robot.found))
+    elapsed = time.perf_counter() - start
+    simulator.stop()
+    return digest.hexdigest(), steps, gui.matches_started, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=8, help="Number of robots. Defaults to 8.")
+    parser.add_argument("--match-length", type=int, default=180, help="Match length in seconds. Defaults to 180.")
+    parser.add_argument("--noise", type=float, default=2.0, help="Seeded tag position jitter. Defaults to 2.")
+    parser.add_argument("--fps", type=float, default=30.0, help="Camera frame rate on the virtual clock. Defaults to 30.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    parser.add_argument("--expect", type=str, default=None, help="Fail unless the digest equals this one.")
+    args = parser.parse_args()
+
+    digests = []
+    for i in range(2):
+        digest, steps, matches, elapsed = run(args.robots, args.match_length, args.noise, args.fps, args.config)
+        print(f"run {i + 1}: {steps} steps, {matches} match, {elapsed:.2f} s wall time for {steps / args.fps:.0f} s simulated, {digest}")
+        digests.append(digest)
+    if digests[0] != digests[1]:
+        print("FAIL: runs differ")
+        sys.exit(1)
+    if args.expect is not None and digests[0] != args.expect:
+        print("FAIL: digest differs from --expect")
+        sys.exit(1)
+    print("PASS")
@@ -0,0 +1,273 @@
+"""
+Benchmarks the XBee transmit path against a serial stand-in on a pseudo-terminal.
+The stand-in drains API frames at the emulated baud rate and answers each one with a TX status after
+the emulated radio latency, like an XBee in API mode. Compares the blocking path (send, then wait for
+the TX status, as XBeeDevice.send_data_broadcast does) with the pipelined XBeeTransmitter.
+
+Usage: python -m benchmarks.xbee_loopback [--duration 3] [--baudrate 115200] [--radio_latency 0.005] [--unicast 8]
+"""
+from jhockey.XBeeTransmitter import XBeeTransmitter
+from jhockey.types import BroadcasterMessage, RobotState
+from jhockey.Metrics import metrics
+from digi.xbee.packets.raw import TX64Packet, TXStatusPacket
+from digi.xbee.packets.common import ATCommResponsePacket
+from digi.xbee.models.status import ATCommandStatus
+from digi.xbee.packets.factory import build_frame
+from digi.xbee.models.address import XBee64BitAddress
+from digi.xbee.models.options import TransmitOptions
+from digi.xbee.models.status import TransmitStatus
+from threading import Thread, Event
+from collections import deque
+import argparse
+import serial
+import time
+import pty
+import tty
+import os
+
+
+class XBeeStandIn:
+    """
+    Reads API frames from the master side of a pty at the emulated baud rate and replies with TX status frames.
+    Like the XBee, the UART keeps receiving while earlier frames are on the air.
+    AT command frames are answered as an 802.15.4 XBee in API mode would, so XBeeDevice.open() works on the port.
+    """
+
+    API_TX_FRAMES = (0x00, 0x01, 0x10)
+    AT_COMMAND_FRAMES = (0x08, 0x09)
+    # enough of the parameters XBeeDevice.open() reads
+    AT_PARAMETERS = {
+        "AP": bytes([1]),
+        "HV": bytes([0x17, 0x00]),
+        "VR": bytes([0x10, 0xEF]),
+        "SH": bytes.fromhex("0013A200"),
+        "SL": bytes.fromhex("41B1C2D3"),
+        "MY": bytes.fromhex("0001"),
+        "NI": b"STANDIN",
+        "CE": bytes([1]),
+    }
+
+    def __init__(self, baudrate: int, radio_latency: float):
+        self.baudrate = baudrate
+        self.radio_latency = radio_latency
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.frames_received = 0
+        self.stopped = False
+        self.replies: deque[tuple[float, int]] = deque()
+        self.radio_free_at = 0.0
+        self.uart_time = 0.0
+
+    def start(self):
+        for target, name in ((self.run, "XBee Stand-In UART"), (self.reply, "XBee Stand-In Radio")):
+            t = Thread(target=target, name=name)
+            t.daemon = True
+            t.start()
+        return self
+
+    def reply(self):
+        try:
+            while not self.stopped:
+                if not self.replies:
+                    time.sleep(0.0005)
+                    continue
+                due, frame_id = self.replies[0]
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.replies.popleft()
+                os.write(self.master_fd, bytes(TXStatusPacket(frame_id, TransmitStatus.SUCCESS).output()))
+        except OSError:
+            return
+
+    def read_exact(self, n: int) -> bytes:
+        data = os.read(self.master_fd, n)
+        arrival = time.perf_counter()
+        while len(data) < n:
+            data += os.read(self.master_fd, n - len(data))
+        # the UART cannot deliver bytes faster than the baud rate (8N1)
+        self.uart_time = max(self.uart_time, arrival) + n * 10 / self.baudrate
+        delay = self.uart_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return data
+
+    def run(self):
+        try:
+            while not self.stopped:
+                if self.read_exact(1) != b"\x7e":
+                    continue
+                length = int.from_bytes(self.read_exact(2), "big")
+                frame = self.read_exact(length + 1)
+                if frame[0] in self.AT_COMMAND_FRAMES:
+                    command = frame[2:4].decode()
+                    value = self.AT_PARAMETERS.get(command, b"")
+                    response = ATCommResponsePacket(frame[1], command, ATCommandStatus.OK, value if value else None)
+                    os.write(self.master_fd, bytes(response.output()))
+                    continue
+                if frame[0] not in self.API_TX_FRAMES:
+                    continue
+                self.frames_received += 1
+                # frames go over the air one at a time, then the status is reported
+                self.radio_free_at = max(time.perf_counter(), self.radio_free_at) + self.radio_latency
+                self.replies.append((self.radio_free_at, frame[1]))
+        except OSError:
+            return
+
+
+def read_status_frames(ser: serial.Serial, on_packet, stopped: Event):
+    buffer = bytearray()
+    while not stopped.is_set():
+        buffer += ser.read(max(1, ser.in_waiting))
+        while len(buffer) >= 4:
+            start = buffer.find(b"\x7e")
+            if start < 0:
+                buffer.clear()
+                break
+            del buffer[:start]
+            length = int.from_bytes(buffer[1:3], "big")
+            if len(buffer) < length + 4:
+                break
+            on_packet(build_frame(bytes(buffer[: length + 4])))
+            del buffer[: length + 4]
+
+
+def make_payload() -> bytes:
+    robots = {4 + i: RobotState(x=100 + i, y=200 + i) for i in range(8)}
+    return str(BroadcasterMessage(time_dsec=1800, robots=robots, enabled=True)).encode()
+
+
+def bench_blocking(port: str, duration: float) -> tuple[int, int, list[float]]:
+    """
+    Sends one frame, waits for its TX status, repeats.
+    """
+    payload = make_payload()
+    ser = serial.Serial(port, timeout=1)
+    frames, n_bytes, latencies = 0, 0, []
+    frame_id = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        frame_id = frame_id % 255 + 1
+        t0 = time.perf_counter()
+        ser.write(bytes(TX64Packet(frame_id, XBee64BitAddress.BROADCAST_ADDRESS, TransmitOptions.NONE.value, rf_data=payload).output()))
+        status = ser.read(7)
+        if len(status) != 7:
+            break
+        latencies.append(time.perf_counter() - t0)
+        frames += 1
+        n_bytes += len(payload)
+    ser.close()
+    return frames, n_bytes, latencies
+
+
+def bench_pipelined(port: str, duration: float, produce_rate: float) -> tuple[XBeeTransmitter, float]:
+    """
+    Produces messages at produce_rate (0 = as fast as possible) into the pipelined transmitter.
+    """
+    payload = make_payload()
+    ser = serial.Serial(port, timeout=0.1)
+    transmitter = XBeeTransmitter(lambda packet: ser.write(bytes(packet.output())))
+    stopped = Event()
+    reader = Thread(target=read_status_frames, args=(ser, transmitter.on_packet, stopped), daemon=True)
+    reader.start()
+    transmitter.start()
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        transmitter.submit(payload)
+        time.sleep(1 / produce_rate if produce_rate > 0 else 0.0005)
+    elapsed = time.perf_counter() - start
+    transmitter.stop()
+    time.sleep(0.2)
+    stopped.set()
+    reader.join()
+    ser.close()
+    return transmitter, elapsed
+
+
+def bench_unicast(port: str, duration: float, n_robots: int, produce_rate: float) -> tuple[dict, float]:
+    """
+    Sends every robot its own short packet per message and records per-robot TX status latency.
+    """
+    robots = {4 + i: RobotState(x=100 + i, y=200 + i) for i in range(n_robots)}
+    addresses = {tag: XBee64BitAddress.from_hex_string(f"0013A200{tag:08X}") for tag in robots}
+    robot_ids = {address: tag for tag, address in addresses.items()}
+    latencies = {tag: [] for tag in robots}
+    ser = serial.Serial(port, timeout=0.1)
+    transmitter = XBeeTransmitter(
+        lambda packet: ser.write(bytes(packet.output())),
+        queue_size=n_robots,
+        on_status=lambda address, latency, success: latencies[robot_ids[address]].append(latency),
+    )
+    stopped = Event()
+    reader = Thread(target=read_status_frames, args=(ser, transmitter.on_packet, stopped), daemon=True)
+    reader.start()
+    transmitter.start()
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        msg = BroadcasterMessage(time_dsec=1800, robots=robots, enabled=True)
+        for tag, address in addresses.items():
+            transmitter.submit(msg.unicast(tag).encode(), address)
+        time.sleep(1 / produce_rate)
+    elapsed = time.perf_counter() - start
+    transmitter.stop()
+    time.sleep(0.2)
+    stopped.set()
+    reader.join()
+    ser.close()
+    return latencies, elapsed
+
+
+def percentile(hist, q: float) -> float:
+    """
+    Upper bucket bound containing the q-th quantile of a metrics Histogram.
+    """
+    target = q * hist.count
+    cumulative = 0
+    for bound, count in zip(hist.bounds + (float("inf"),), hist.counts):
+        cumulative += count
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per run. Defaults to 3.")
+    parser.add_argument("--baudrate", type=int, default=115200, help="Emulated UART baud rate. Defaults to 115200.")
+    parser.add_argument("--radio_latency", type=float, default=0.005, help="Emulated over-the-air time per frame in seconds. Defaults to 0.005.")
+    parser.add_argument("--produce_rate", type=float, default=0, help="Messages per second offered to the pipelined path, 0 for as fast as possible.")
+    parser.add_argument("--unicast", type=int, default=0, help="Also benchmark unicast mode with this many robots.")
+    args = parser.parse_args()
+
+    stand_in = XBeeStandIn(args.baudrate, args.radio_latency).start()
+    frames, n_bytes, latencies = bench_blocking(stand_in.port, args.duration)
+    latencies.sort()
+    print("Blocking send_data_broadcast equivalent:")
+    print(f"  {frames / args.duration:8.1f} frames/s {n_bytes / args.duration:10.0f} bytes/s")
+    if latencies:
+        print(f"  round trip p50 {1e3 * latencies[len(latencies) // 2]:.2f} ms, p95 {1e3 * latencies[int(0.95 * len(latencies))]:.2f} ms")
+
+    transmitter, elapsed = bench_pipelined(stand_in.port, args.duration, args.produce_rate)
+    queue_delay = metrics.histogram("xbee_queue_delay_seconds")
+    status_latency = metrics.histogram("xbee_tx_status_latency_seconds")
+    print("Pipelined XBeeTransmitter:")
+    print(f"  {transmitter.frames_sent / elapsed:8.1f} frames/s {transmitter.bytes_sent / elapsed:10.0f} bytes/s")
+    print(f"  queue delay p50 <= {1e3 * percentile(queue_delay, 0.5):.1f} ms, p95 <= {1e3 * percentile(queue_delay, 0.95):.1f} ms")
+    print(f"  TX status latency p50 <= {1e3 * percentile(status_latency, 0.5):.1f} ms, p95 <= {1e3 * percentile(status_latency, 0.95):.1f} ms")
+    print(f"  dropped: {metrics.counter('xbee_tx_dropped', reason='overflow').value} overflow, {metrics.counter('xbee_tx_dropped', reason='stale').value} stale")
+
+    if args.unicast > 0:
+        latencies, elapsed = bench_unicast(stand_in.port, args.duration, args.unicast, args.produce_rate or 20)
+        print(f"Unicast to {args.unicast} robots at {args.produce_rate or 20:g} messages/s:")
+        print(f"  {'robot':>5} {'delivered/s':>11} {'p50 ms':>7} {'p95 ms':>7}")
+        for tag, samples in latencies.items():
+            samples.sort()
+            if not samples:
+                print(f"  {tag:>5} {0:>11.1f}")
+                continue
+            print(
+                f"  {tag:>5} {len(samples) / elapsed:>11.1f} {1e3 * samples[len(samples) // 2]:>7.2f} "
+                f"{1e3 * samples[int(0.95 * len(samples))]:>7.2f}"
+            )
+    stand_in.stopped = True
@@ -0,0 +1,70 @@
+from string import ascii_uppercase
+import logging
+from .types import BroadcasterMessage
+
+# fixed-width decimal digits, so numbers are copied into the buffer without formatting
+DIGITS2 = [b"%02d" % i for i in range(100)]
+DIGITS3 = [b"%03d" % i for i in range(1000)]
+# robot letters by tag, "A" for tag 4
+LETTERS = {4 + i: ord(letter) for i, letter in enumerate(ascii_uppercase)}
+PUCK = b"B000000"
+
+
+class BroadcastEncoder:
+    """
+    Encodes BroadcasterMessages into a reusable buffer, byte for byte the same as str(message).encode().
+    Every field has a fixed width, so digits are copied from lookup tables and the checksum is summed over
+    the buffer in one pass. Values outside the fixed widths (i.e. a robot off the field) fall back to
+    str(message).
+    """
+
+    MAX_ROBOTS = 16
+    # ">" enabled[1] time[4], 16 robots of letter[1] x[3] y[3], the puck, checksum[2] ";"
+    MAX_BYTES = 6 + 7 * MAX_ROBOTS + len(PUCK) + 3
+
+    def __init__(self):
+        self.buffer = bytearray(self.MAX_BYTES)
+        self.view = memoryview(self.buffer)
+        self.fallbacks = 0
+
+    def encode(self, msg: BroadcasterMessage) -> memoryview:
+        """
+        Returns the encoded message as a view of the buffer, valid until the next call.
+        """
+        buf, view = self.buffer, self.view
+        t = msg.time_dsec
+        enabled = int(msg.enabled)
+        if not 0 <= t <= 9999 or not 0 <= enabled <= 9:
+            return self.fallback(msg)
+        buf[0] = 62  # ">"
+        buf[1] = 48 + enabled
+        view[2:4] = DIGITS2[t // 100]
+        view[4:6] = DIGITS2[t % 100]
+        pos = 6
+        # snapshot the robots, which the tracker may add to while this runs
+        robots = list(msg.robots.items())
+        if len(robots) > self.MAX_ROBOTS:
+            logging.warning("Broadcast message is too large, truncating robots list")
+            del robots[self.MAX_ROBOTS :]
+        for tag, robot in robots:
+            letter = LETTERS.get(tag)
+            if letter is None:
+                logging.warning("Robot ID %d cannot be broadcast without fragmented mode", tag)
+                continue
+            x, y = int(robot.x), int(robot.y)
+            if not (0 <= x <= 999 and 0 <= y <= 999):
+                return self.fallback(msg)
+            buf[pos] = letter
+            view[pos + 1 : pos + 4] = DIGITS3[x]
+            view[pos + 4 : pos + 7] = DIGITS3[y]
+            pos += 7
+        view[pos : pos + 7] = PUCK
+        pos += 7
+        # the checksum includes the trailing ";"
+        view[pos : pos + 2] = DIGITS2[(sum(view[:pos]) + 59) % 64]
+        buf[pos + 2] = 59
+        return view[: pos + 3]
+
+    def fallback(self, msg: BroadcasterMessage) -> memoryview:
+        self.fallbacks += 1
+        return memoryview(str(msg).encode())
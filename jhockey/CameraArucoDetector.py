@@ -2,8 +2,18 @@ import cv2
 from threading import Thread, Lock
 from typing import Protocol
 import numpy as np
-from .types import AruCoTag
+from .types import AruCoTag, Point
+from .Metrics import metrics
 import logging
+import time
+
+
+class FieldMask(Protocol):
+    def apply(self, frame: np.ndarray) -> tuple[np.ndarray, int, int]:
+        """
+        Returns the frame cropped and masked to the field, and the x, y offset of the crop.
+        """
+        ...
 
 
 class Camera(Protocol):
@@ -22,13 +32,15 @@ class Camera(Protocol):
 
 
 class CameraArucoDetector:
-    def __init__(self, name="ArUco Detector"):
+    def __init__(self, name="ArUco Detector", field_mask: FieldMask = None):
         """
         Class to detect ArUco markers.
         Parameters
         ----------
         name : str, optional
             The name of the thread, by default "ArUco Detector"
+        field_mask : FieldMask, optional
+            Restricts detection to the field once the homography is known, by default None (full frames)
         """
         self.arucoDict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
         self.arucoParams = cv2.aruco.DetectorParameters()
@@ -36,10 +48,22 @@ class CameraArucoDetector:
             self.arucoDict, self.arucoParams
         )
         self.name = name
-        self.corners = None
-        self.ids = None
+        self.field_mask = field_mask
+        self.camera = None
+        self.threading = False
+        self.frame_count = 0
+        self.frame_time = 0.0
+        # (corners, ids, frame_count) of the latest frame, published in one assignment so a consumer
+        # thread never pairs the corners of one frame with the ids of another
+        self.detection = None
+        self.tags: list[AruCoTag] = []
+        self._tags_frame = None
+        self._tag_pools: tuple[list[AruCoTag], list[AruCoTag]] = ([], [])
         self.stopped = False
         self.aruco_lock = Lock()
+        # labelled per detector, every camera's detector updates its own collectors
+        self._stage = metrics.stage("detector", detector=name)
+        self._dropped = metrics.counter("dropped_frames", stage="detector", detector=name)
 
     def start(self, cam):
         """
@@ -55,33 +79,80 @@ class CameraArucoDetector:
         t = Thread(target=self.run, name=self.name, args=(cam,))
         t.daemon = True
         t.start()
+        self.threading = True
         return self
 
     def get(self) -> list[AruCoTag]:
-        if self.corners is None or self.ids is None:
+        """
+        Returns the tags of the latest frame. Computed once per frame, reusing the tag objects of the
+        frame before the previous one, so a consumer can still hold the previous frame.
+        """
+        detection = self.detection
+        if detection is None or detection[1] is None:
             logging.warning("No ArUco tags found")
             return []
-        tag_list = []
-        for corner, id in zip(self.corners, self.ids):
-            center = np.mean(corner, axis=0)
-            w, h = np.linalg.norm(corner[0] - corner[1]), np.linalg.norm(
-                corner[1] - corner[2]
-            )
-            tag_list.append(AruCoTag(id=id[0], center=center, w=w, h=h))
-        return tag_list
+        corners, ids, frame_count = detection
+        if frame_count == self._tags_frame:
+            return self.tags
+        # corners are in raw (distorted) pixels, lens correction happens on the centers downstream
+        corners = np.concatenate(corners).reshape(-1, 4, 2)
+        # (N, 1) in OpenCV 4, (N,) in later versions
+        ids = ids.reshape(-1)
+        centers = corners.mean(axis=1)
+        widths = np.linalg.norm(corners[:, 0] - corners[:, 1], axis=1)
+        heights = np.linalg.norm(corners[:, 1] - corners[:, 2], axis=1)
+        pool = self._tag_pools[frame_count % 2]
+        tags = []
+        for i in range(len(ids)):
+            tag_id, x, y = int(ids[i]), float(centers[i, 0]), float(centers[i, 1])
+            w, h = float(widths[i]), float(heights[i])
+            if i < len(pool):
+                tag = pool[i]
+                tag.id, tag.center.x, tag.center.y, tag.w, tag.h = tag_id, x, y, w, h
+            else:
+                tag = AruCoTag(id=tag_id, center=Point(x, y), w=w, h=h)
+                pool.append(tag)
+            tags.append(tag)
+        self.tags = tags
+        self._tags_frame = frame_count
+        return tags
 
     def detect(self, frame):
-        self.corners, self.ids, _ = self.detector.detectMarkers(frame)
+        x0 = y0 = 0
+        if self.field_mask is not None:
+            frame, x0, y0 = self.field_mask.apply(frame)
+        corners, ids, _ = self.detector.detectMarkers(frame)
+        if x0 or y0:
+            # back to full frame pixels
+            for tag_corners in corners:
+                tag_corners += (x0, y0)
+        self.frame_count += 1
+        self.detection = (corners, ids, self.frame_count)
 
     def run(self, cam: Camera):
+        last_frame_count = None
         while True:
             if self.stopped:
                 return
+            t0 = self._stage.begin()
+            frame_count = getattr(cam, "frame_count", None)
             frame = cam.read()
             if frame is None:
                 logging.warning("No frame received")
                 continue
+            if frame_count is not None and frame_count == last_frame_count:
+                # the same frame again, detecting it would only repeat stale positions
+                time.sleep(0.001)
+                continue
+            # frames the camera produced while we were busy detecting never get processed
+            if frame_count is not None and last_frame_count is not None:
+                skipped = frame_count - last_frame_count - 1
+                if skipped > 0:
+                    self._dropped.inc(skipped)
+            last_frame_count = frame_count
             self.detect(frame)
+            self.frame_time = t0
+            self._stage.end(t0)
 
     def stop(self):
         self.stopped = True
@@ -0,0 +1,40 @@
+import time
+
+
+class WallClock:
+    """
+    The real clock: time.perf_counter() seconds, and sleeps that block.
+    """
+
+    def now(self) -> float:
+        return time.perf_counter()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """
+    A clock that only moves when told to. Sleeping advances it instantly, so a loop paced by it runs
+    as fast as the CPU allows and gives the same timestamps on every run.
+    """
+
+    def __init__(self, start: float = 0.0):
+        """
+        Parameters
+        ----------
+        start : float, optional
+            The time the clock starts at in seconds, by default 0.0
+        """
+        self.t = start
+
+    def now(self) -> float:
+        return self.t
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        if seconds < 0:
+            raise ValueError("Virtual clock cannot go backwards")
+        self.t += seconds
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from threading import Thread, Lock
+from typing import Callable, Protocol
+from .types import ConnectionState
+from .Metrics import metrics
+import logging
+import random
+import time
+
+
+class Device(Protocol):
+    name: str
+
+    @property
+    def connected(self) -> bool:
+        """
+        Returns whether the device is connected. Devices clear this themselves when the link drops.
+        """
+        ...
+
+    def connect(self) -> None:
+        """
+        Makes one connection attempt, raising an exception on failure.
+        """
+        ...
+
+    def disconnect(self) -> None:
+        """
+        Releases the device handle.
+        """
+        ...
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter, so devices that drop together do not retry in lockstep.
+    """
+
+    def __init__(self, initial: float = 0.25, maximum: float = 10.0, multiplier: float = 2.0, jitter: float = 0.5):
+        """
+        Parameters
+        ----------
+        initial : float, optional
+            The first retry delay in seconds, by default 0.25
+        maximum : float, optional
+            The largest retry delay in seconds, by default 10.0
+        multiplier : float, optional
+            The growth factor per failed attempt, by default 2.0
+        jitter : float, optional
+            The fraction of each delay that is randomized, by default 0.5
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self) -> float:
+        """
+        Returns the delay before the next attempt and counts the failed one.
+        """
+        delay = min(self.maximum, self.initial * self.multiplier**self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+class SupervisedDevice:
+    def __init__(self, device: Device, backoff: Backoff):
+        self.device = device
+        self.backoff = backoff
+        self.state = ConnectionState.DISCONNECTED
+        self.next_attempt = 0.0
+        self.connected_gauge = metrics.gauge("device_connected", device=device.name)
+        self.reconnects = metrics.counter("device_reconnects", device=device.name)
+
+
+class DeviceSupervisor:
+    """
+    Owns the device handles (camera, JeVois, XBee) and keeps them connected.
+    Disconnected devices are retried with exponential backoff and jitter from a single thread,
+    and every connection state change is published to the registered listeners and the metrics.
+    """
+
+    def __init__(self, poll_interval: float = 0.1, name="Device Supervisor"):
+        """
+        Parameters
+        ----------
+        poll_interval : float, optional
+            How often device states are checked, in seconds, by default 0.1
+        name : str, optional
+            The name of the thread, by default "Device Supervisor"
+        """
+        self.poll_interval = poll_interval
+        self.name = name
+        self.stopped = False
+        self.devices: list[SupervisedDevice] = []
+        self.listeners: list[Callable[[str, ConnectionState], None]] = []
+        self._lock = Lock()
+
+    def add(self, device: Device, backoff: Backoff = None) -> DeviceSupervisor:
+        """
+        Puts a device under supervision.
+        """
+        with self._lock:
+            self.devices.append(SupervisedDevice(device, backoff or Backoff()))
+        return self
+
+    def add_listener(self, listener: Callable[[str, ConnectionState], None]):
+        """
+        Registers a callback receiving (device name, new state) on every state change.
+        """
+        self.listeners.append(listener)
+
+    @property
+    def states(self) -> dict[str, ConnectionState]:
+        return {supervised.device.name: supervised.state for supervised in self.devices}
+
+    def start(self) -> DeviceSupervisor:
+        t = Thread(target=self.run, name=self.name)
+        t.daemon = True
+        t.start()
+        return self
+
+    def set_state(self, supervised: SupervisedDevice, state: ConnectionState):
+        if supervised.state == state:
+            return
+        supervised.state = state
+        supervised.connected_gauge.set(1 if state == ConnectionState.CONNECTED else 0)
+        for listener in self.listeners:
+            try:
+                listener(supervised.device.name, state)
+            except Exception:
+                logging.exception("Device state listener failed")
+
+    def check(self, supervised: SupervisedDevice, now: float):
+        device = supervised.device
+        if device.connected:
+            self.set_state(supervised, ConnectionState.CONNECTED)
+            return
+        if supervised.state == ConnectionState.CONNECTED:
+            # the device dropped its link since the last check
+            logging.error("%s disconnected", device.name)
+            supervised.reconnects.inc()
+            supervised.backoff.reset()
+            supervised.next_attempt = now
+            try:
+                device.disconnect()
+            except Exception:
+                logging.exception("Could not release %s", device.name)
+        if now < supervised.next_attempt:
+            return
+        self.set_state(supervised, ConnectionState.CONNECTING)
+        try:
+            device.connect()
+        except Exception as e:
+            delay = supervised.backoff.next()
+            supervised.next_attempt = time.monotonic() + delay
+            logging.warning("Could not connect to %s (%s), retrying in %.1f s", device.name, e, delay)
+            self.set_state(supervised, ConnectionState.DISCONNECTED)
+            return
+        supervised.backoff.reset()
+        logging.info("Connected to %s", device.name)
+        self.set_state(supervised, ConnectionState.CONNECTED)
+
+    def run(self):
+        while not self.stopped:
+            with self._lock:
+                devices = list(self.devices)
+            for supervised in devices:
+                self.check(supervised, time.monotonic())
+            time.sleep(self.poll_interval)
+
+    def stop(self):
+        self.stopped = True
@@ -1,8 +1,10 @@
-import json
 import numpy as np
 import cv2 as cv
 from .types import AruCoTag
+from .Metrics import metrics
+from .TagRegistry import TagRegistry
 import logging
+import math
 
 
 class FieldHomography:
@@ -10,7 +12,14 @@ class FieldHomography:
     FieldHomography class to convert between the camera frame and the field frame using ArUco markers.
     """
 
-    def __init__(self, param_file: str = "config.json"):
+    def __init__(
+        self,
+        param_file: str = "config.json",
+        lut=None,
+        refit_tolerance: float = 0.5,
+        tag_registry: TagRegistry = None,
+        name: str = None,
+    ):
         """
         Parameters
         ----------
@@ -42,39 +51,110 @@ class FieldHomography:
                 }
             ],
             } ...
+        lut : FieldLUT, optional
+            Fused undistortion and homography lookup table for raw (distorted) camera frames,
+            by default None, where pixels are taken to be undistorted already (i.e. from the JeVois)
+        refit_tolerance : float, optional
+            The homography is only fitted again when a field tag moves by more than this many pixels,
+            by default 0.5
+        tag_registry : TagRegistry, optional
+            The shared tag roles and field tag positions, by default None (loaded from param_file)
+        name : str, optional
+            The camera the homography belongs to, labels its metrics when there are several, by default None
         """
-        self.field_params = json.load(open(param_file, "r"))
-        self.tag_positions = {
-            int(tag["id"]): (float(tag["x"]), float(tag["y"]))
-            for tag in self.field_params["field_tags"]
-        }
+        self.tag_registry = tag_registry if tag_registry is not None else TagRegistry(param_file)
+        self.tag_positions = self.tag_registry.field_positions
+        self.lut = lut
+        self.refit_tolerance = refit_tolerance
+        self._fit: list[tuple[int, float, float]] = None
         self.H = None
+        if lut is not None and lut.H is not None:
+            # the cached table maps positions before the field tags are seen
+            self.H = lut.H
+            self.H_inv = np.linalg.inv(lut.H)
+        labels = {} if name is None else {"camera": name}
+        self._stage = metrics.stage("homography", **labels)
+        self._recomputes = metrics.counter("homography_recomputes", **labels)
+        self._reprojection_error = metrics.gauge("homography_reprojection_error", **labels)
+
+    def field_tags_moved(self, field_tags: list[AruCoTag]) -> bool:
+        """
+        Returns whether the field tags differ from the ones the current homography was fitted to,
+        by ID or by more than refit_tolerance pixels. Only compares, so it does not allocate.
+        """
+        fit = self._fit
+        if self.H is None or fit is None:
+            return True
+        i = 0
+        is_field = self.tag_registry.is_field
+        for tag in field_tags:
+            if not is_field(tag.id):
+                continue
+            if i >= len(fit):
+                return True
+            tag_id, x, y = fit[i]
+            if tag.id != tag_id or abs(tag.center.x - x) > self.refit_tolerance or abs(tag.center.y - y) > self.refit_tolerance:
+                return True
+            i += 1
+        return i != len(fit)
 
     def find_homography(self, field_tags: list[AruCoTag]) -> None:
-        try:
-            detected_tags = [tag for tag in field_tags if tag.id in self.tag_positions]
-        except KeyError as e:
-            logging.warning("KeyError in find_homography")
+        if not self.field_tags_moved(field_tags):
+            # the camera and field have not moved since the last fit
             return None
+        detected_tags = self.tag_registry.partition(field_tags).field
         if len(detected_tags) < 4:
             # logging.warning(f"Not enough tags for homography detected: {len(detected_tags)} tags received, expected 4.")
             return None
+        t0 = self._stage.begin()
         tag_px = np.array(
             [[tag.center.x, tag.center.y] for tag in detected_tags], dtype=np.float32
         ).reshape(-1, 1, 2)
-        self.H, _ = cv.findHomography(
-            tag_px,
-            np.array(
-                [
-                    (self.tag_positions[tag.id][0], self.tag_positions[tag.id][1])
-                    for tag in detected_tags
-                ],
-                dtype=np.float32,
-            ).reshape(-1, 1, 2),
-            cv.RANSAC,
-            5.0,
-        )
-        self.H_inv = np.linalg.inv(self.H)
+        if self.lut is not None:
+            # fit the homography in undistorted pixels
+            tag_px = self.lut.undistort(tag_px.reshape(-1, 2)).astype(np.float32).reshape(-1, 1, 2)
+        tag_world = np.array(
+            [
+                (self.tag_positions[tag.id][0], self.tag_positions[tag.id][1])
+                for tag in detected_tags
+            ],
+            dtype=np.float32,
+        ).reshape(-1, 1, 2)
+        H, _ = cv.findHomography(tag_px, tag_world, cv.RANSAC, 5.0)
+        if H is None:
+            logging.warning("Homography could not be computed from field tags")
+            return None
+        self.H = H
+        # cv.invert is several times faster than np.linalg.inv on a 3x3 matrix, which adds up when refitting per frame
+        self.H_inv = cv.invert(H)[1]
+        self._fit = [(tag.id, tag.center.x, tag.center.y) for tag in detected_tags]
+        self._recomputes.inc()
+        if self.lut is not None:
+            self.lut.set_homography(H)
+        residuals = (cv.perspectiveTransform(tag_px, self.H) - tag_world).reshape(-1, 2).tolist()
+        self._reprojection_error.set(sum(math.hypot(dx, dy) for dx, dy in residuals) / len(residuals))
+        self._stage.end(t0)
+
+    def convert_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        @param points: (N, 2) array of pixel coordinates
+        @return: (N, 2) array of world coordinates
+        """
+        if self.lut is not None:
+            return self.lut.to_field(points)
+        if self.H is None:
+            raise Exception("Homography not initialized")
+        return cv.perspectiveTransform(
+            np.asarray(points, dtype=np.float32).reshape(-1, 1, 2), self.H
+        ).reshape(-1, 2)
+
+    def convert_px2world(self, x: int, y: int) -> np.ndarray:
+        """
+        @param x: x coordinate in pixels
+        @param y: y coordinate in pixels
+        @return: x, y coordinates in world coordinates
+        """
+        return self.convert_points(np.array([[x, y]], dtype=np.float32))[0]
 
     def convert_cam2world(self, x: int, y: int) -> np.ndarray:
         """
@@ -82,11 +162,7 @@ class FieldHomography:
         @param y: y coordinate in pixels
         @return: x, y coordinates in world coordinates
         """
-        if self.H is None:
-            raise Exception("Homography not initialized")
-        return cv.perspectiveTransform(
-            np.array([x, y], dtype=np.float32).reshape(-1, 1, 2), self.H
-        )
+        return self.convert_points(np.array([[x, y]], dtype=np.float32)).reshape(-1, 1, 2)
 
     def convert_world2cam(self, x: float, y: float) -> np.ndarray:
         """
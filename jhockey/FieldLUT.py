@@ -0,0 +1,241 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from threading import Lock, Thread
+import numpy as np
+import cv2 as cv
+from .Metrics import metrics
+
+
+def interpolate(table: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Bilinear lookup of a (height, width, 2) table at fractional pixel positions.
+    @param table: the lookup table, indexed as table[y, x]
+    @param points: (N, 2) array of x, y pixel positions, clamped to the table
+    @return: (N, 2) array of interpolated values
+    """
+    h, w = table.shape[:2]
+    x = np.clip(points[:, 0], 0, w - 1.001)
+    y = np.clip(points[:, 1], 0, h - 1.001)
+    x0 = x.astype(np.intp)
+    y0 = y.astype(np.intp)
+    fx = (x - x0)[:, None]
+    fy = (y - y0)[:, None]
+    top = table[y0, x0] * (1 - fx) + table[y0, x0 + 1] * fx
+    bottom = table[y0 + 1, x0] * (1 - fx) + table[y0 + 1, x0 + 1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+class FieldLUT:
+    """
+    Precomputed pixel-to-field mapping that fuses lens undistortion and the field homography.
+    Detection runs on raw frames and only the detected points are corrected and projected,
+    by interpolating in a table instead of undistorting every frame.
+
+    Two tables are kept, both cached on disk:
+    - raw pixel -> undistorted pixel, keyed by the calibration. Field tags are looked up here,
+      so the homography is fitted in undistorted pixels.
+    - raw pixel -> field, keyed by the calibration, field configuration and camera. It is rebuilt when the
+      homography moves by more than the tolerance, and loaded at startup so positions are available
+      before the field tags are seen. Rebuilt tables are written to the cache in the background.
+    """
+
+    def __init__(
+        self,
+        mtx: np.ndarray,
+        dist: np.ndarray,
+        frame_size: tuple[int, int],
+        field_config: str = "config.json",
+        cache_dir: str = "lut_cache",
+        tolerance: float = 1e-3,
+        camera: str = None,
+    ):
+        """
+        Parameters
+        ----------
+        mtx : np.ndarray
+            The 3x3 camera matrix
+        dist : np.ndarray
+            The distortion coefficients
+        frame_size : tuple[int, int]
+            The width and height of the raw frames in pixels
+        field_config : str, optional
+            The field configuration the homography is fitted to, by default "config.json"
+        cache_dir : str, optional
+            The directory the tables are cached in, by default "lut_cache"
+        tolerance : float, optional
+            The fused table is rebuilt when the homography moves a frame corner by more than this
+            fraction of the field size, by default 1e-3
+        camera : str, optional
+            The camera the table belongs to, i.e. its source. Cameras sharing a calibration file see the
+            field from different places, so each caches its own fused table. By default None
+        """
+        self.mtx = np.asarray(mtx, dtype=np.float64).reshape(3, 3)
+        self.dist = np.asarray(dist, dtype=np.float64).ravel()
+        self.width, self.height = frame_size
+        self.cache_dir = cache_dir
+        self.tolerance = tolerance
+        field_tags = json.load(open(field_config, "r"))["field_tags"]
+        positions = np.array([(float(tag["x"]), float(tag["y"])) for tag in field_tags])
+        self.field_size = float(np.linalg.norm(positions.max(axis=0) - positions.min(axis=0))) or 1.0
+        calibration = hashlib.sha1()
+        calibration.update(self.mtx.tobytes())
+        calibration.update(self.dist.tobytes())
+        calibration.update(np.array([self.width, self.height]).tobytes())
+        self.calibration_key = calibration.hexdigest()[:16]
+        calibration.update(json.dumps(field_tags, sort_keys=True).encode())
+        if camera is not None:
+            calibration.update(str(camera).encode())
+        self.field_key = calibration.hexdigest()[:16]
+        self.H: np.ndarray | None = None
+        self.field_table: np.ndarray | None = None
+        self._build = metrics.stage("field_lut_build")
+        self._rebuilds = metrics.counter("field_lut_rebuilds")
+        self._cache_lock = Lock()
+        self._cache_writer: Thread | None = None
+        self._pending_cache: tuple[np.ndarray, np.ndarray] | None = None
+        self.undistort_table = self.load_undistort_table()
+        self.load_field_table()
+
+    @classmethod
+    def from_file(cls, calibration: str, **kwargs) -> FieldLUT:
+        """
+        Loads the camera calibration from a .json file, for example:
+        {
+            "camera_matrix": [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+            "dist_coeffs": [k1, k2, p1, p2, k3],
+            "width": 1280,
+            "height": 720
+        }
+        """
+        params = json.load(open(calibration, "r"))
+        return cls(
+            params["camera_matrix"],
+            params["dist_coeffs"],
+            (int(params["width"]), int(params["height"])),
+            **kwargs,
+        )
+
+    def cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def write_cache(self, path: str, write):
+        """
+        Writes a cache file through a temporary file that replaces it at once, so another process
+        loading the same cache (i.e. the VideoBatch workers) never sees it half written.
+        @param write: writes the contents to the open file, i.e. lambda f: np.save(f, table)
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def load_undistort_table(self) -> np.ndarray:
+        path = self.cache_path(f"undistort-{self.calibration_key}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+        t0 = self._build.begin()
+        xs, ys = np.meshgrid(
+            np.arange(self.width, dtype=np.float32), np.arange(self.height, dtype=np.float32)
+        )
+        grid = np.stack((xs, ys), axis=-1).reshape(-1, 1, 2)
+        # map every raw pixel to where it lands in the undistorted image, keeping the camera matrix
+        table = cv.undistortPoints(grid, self.mtx, self.dist, P=self.mtx).reshape(self.height, self.width, 2)
+        self._build.end(t0)
+        self.write_cache(path, lambda f: np.save(f, table))
+        return table
+
+    def load_field_table(self):
+        path = self.cache_path(f"field-{self.field_key}.npz")
+        if not os.path.exists(path):
+            return
+        cached = np.load(path)
+        self.H = cached["H"]
+        self.field_table = cached["table"]
+
+    def undistort(self, points: np.ndarray) -> np.ndarray:
+        """
+        @param points: (N, 2) array of raw pixel positions
+        @return: (N, 2) array of undistorted pixel positions
+        """
+        return interpolate(self.undistort_table, points)
+
+    def to_field(self, points: np.ndarray) -> np.ndarray:
+        """
+        @param points: (N, 2) array of raw pixel positions
+        @return: (N, 2) array of field positions
+        """
+        if self.field_table is None:
+            raise Exception("Homography not initialized")
+        return interpolate(self.field_table, points)
+
+    def moved(self, H: np.ndarray) -> bool:
+        """
+        Returns whether H moves any frame corner by more than the tolerance compared to the fused table.
+        """
+        if self.H is None:
+            return True
+        corners = np.array(
+            [[0, 0], [self.width - 1, 0], [0, self.height - 1], [self.width - 1, self.height - 1]],
+            dtype=np.float32,
+        ).reshape(-1, 1, 2)
+        shift = cv.perspectiveTransform(corners, H) - cv.perspectiveTransform(corners, self.H)
+        return float(np.max(np.linalg.norm(shift, axis=2))) > self.tolerance * self.field_size
+
+    def set_homography(self, H: np.ndarray):
+        """
+        Sets the undistorted pixel -> field homography, rebuilding the fused table if it moved.
+        """
+        if not self.moved(H):
+            return
+        t0 = self._build.begin()
+        table = cv.perspectiveTransform(self.undistort_table.reshape(-1, 1, 2), H)
+        self.field_table = table.reshape(self.height, self.width, 2)
+        self.H = H
+        self._rebuilds.inc()
+        self._build.end(t0)
+        self.save_field_table(H, self.field_table)
+
+    def save_field_table(self, H: np.ndarray, table: np.ndarray):
+        """
+        Queues the fused table for the cache without blocking the caller, i.e. the game loop.
+        Only the latest table is kept, so rebuilds made while a write is running are coalesced.
+        """
+        with self._cache_lock:
+            self._pending_cache = (H, table)
+            if self._cache_writer is not None:
+                return
+            # not a daemon thread, so a table rebuilt just before exit still reaches the cache
+            self._cache_writer = Thread(target=self.write_field_tables, name="Field LUT Cache")
+            self._cache_writer.start()
+
+    def write_field_tables(self):
+        while True:
+            with self._cache_lock:
+                pending = self._pending_cache
+                self._pending_cache = None
+                if pending is None:
+                    self._cache_writer = None
+                    return
+            H, table = pending
+            try:
+                self.write_cache(self.cache_path(f"field-{self.field_key}.npz"), lambda f: np.savez(f, H=H, table=table))
+            except OSError as e:
+                logging.warning("Could not cache the field lookup table: %s", e)
+
+    def flush(self):
+        """
+        Waits until the queued field table is written to the cache.
+        """
+        writer = self._cache_writer
+        while writer is not None:
+            writer.join()
+            writer = self._cache_writer
@@ -0,0 +1,173 @@
+from __future__ import annotations
+import json
+import logging
+from typing import Protocol
+import numpy as np
+import cv2 as cv
+from .Metrics import metrics
+
+
+class FieldHomography(Protocol):
+    @property
+    def H(self) -> np.ndarray:
+        """
+        Returns the (undistorted) pixel -> field homography, or None before the field tags are seen.
+        """
+        ...
+
+    @property
+    def lut(self):
+        """
+        Returns the FieldLUT with the lens calibration of raw frames, or None.
+        """
+        ...
+
+
+def load_field_boundary(config: str = "config.json") -> np.ndarray:
+    """
+    Loads the field boundary polygon in field coordinates from the config file, listed as, for example:
+    "field_boundary": [
+        {"x": 0, "y": -0.5},
+        {"x": 6.8333333, "y": -0.5},
+        {"x": 6.8333333, "y": 9.8333333},
+        {"x": 0, "y": 9.8333333}
+    ]
+    Without a boundary, the bounding rectangle of the field tags and goals is used.
+    @return: (N, 2) array of the polygon's vertices
+    """
+    config = json.load(open(config, "r"))
+    if "field_boundary" in config:
+        return np.array([(float(p["x"]), float(p["y"])) for p in config["field_boundary"]], dtype=np.float64)
+    points = [(float(tag["x"]), float(tag["y"])) for tag in config["field_tags"]]
+    for goal in config.get("goals", []):
+        points.append((float(goal["x_min"]), float(goal["y_min"])))
+        points.append((float(goal["x_max"]), float(goal["y_max"])))
+    points = np.array(points, dtype=np.float64)
+    (x_min, y_min), (x_max, y_max) = points.min(axis=0), points.max(axis=0)
+    return np.array([(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)], dtype=np.float64)
+
+
+class FieldMask:
+    """
+    Restricts detection to the field. The field boundary is projected into the image through the inverse
+    homography, and frames are cropped to its bounding box and masked to the polygon, so the crowd, benches
+    and spectators around the field are neither searched nor produce false candidates.
+    The crop and mask are only rebuilt when the homography changes. Every full_frame_interval frames the
+    whole frame is passed through, so field tags are still found after the camera moves.
+    Applying reuses one buffer, so each consumer thread needs its own FieldMask.
+    """
+
+    def __init__(
+        self,
+        field_homography: FieldHomography,
+        field_config: str = "config.json",
+        margin: float = 0.05,
+        padding: int = 24,
+        full_frame_interval: int = 30,
+        name: str = "field",
+    ):
+        """
+        Parameters
+        ----------
+        field_homography : FieldHomography
+            The homography of the camera whose frames are masked
+        field_config : str, optional
+            The config file with the field boundary, by default "config.json"
+        margin : float, optional
+            The boundary is grown by this fraction of its size around its center, by default 0.05
+        padding : int, optional
+            The projected boundary is grown by this many pixels, so tags on the edge stay whole however
+            far they are from the camera, by default 24
+        full_frame_interval : int, optional
+            Every this many frames the whole frame is passed through, by default 30 (0 never does)
+        name : str, optional
+            The name of the consumer in the metrics, by default "field"
+        """
+        self.field_homography = field_homography
+        boundary = load_field_boundary(field_config)
+        center = boundary.mean(axis=0)
+        self.boundary = center + (boundary - center) * (1 + margin)
+        self.padding = padding
+        self.full_frame_interval = full_frame_interval
+        self.frame_count = 0
+        self._H = None
+        self._shape = None
+        # (x0, y0, x1, y1) crop and the mask of the crop, swapped together when the homography changes
+        self._region: tuple[tuple[int, int, int, int], np.ndarray] | None = None
+        self._buffer: np.ndarray | None = None
+        self._updates = metrics.counter("field_mask_updates", consumer=name)
+        self._fraction = metrics.gauge("field_mask_fraction", consumer=name)
+
+    def polygon(self, H: np.ndarray) -> np.ndarray:
+        """
+        Returns the boundary in raw pixels of the camera, with edges subdivided so lens distortion
+        bends them like the field lines in the image.
+        @return: (N, 2) array of pixel positions
+        """
+        corners = self.boundary
+        steps = np.linspace(0.0, 1.0, 16, endpoint=False)[:, None]
+        edges = [a + (b - a) * steps for a, b in zip(corners, np.roll(corners, -1, axis=0))]
+        points = np.concatenate(edges).astype(np.float64).reshape(-1, 1, 2)
+        px = cv.perspectiveTransform(points, np.linalg.inv(H)).reshape(-1, 2)
+        lut = getattr(self.field_homography, "lut", None)
+        if lut is not None:
+            # H maps undistorted pixels, distort them back into the raw frame
+            normalized = cv.undistortPoints(px.reshape(-1, 1, 2), lut.mtx, None).reshape(-1, 2)
+            rays = np.hstack((normalized, np.ones((len(normalized), 1))))
+            px, _ = cv.projectPoints(rays, np.zeros(3), np.zeros(3), lut.mtx, lut.dist)
+            px = px.reshape(-1, 2)
+        return px
+
+    def update(self, H: np.ndarray, shape: tuple[int, ...]):
+        """
+        Rebuilds the crop and mask for a new homography or frame size.
+        """
+        self._H, self._shape = H, shape
+        height, width = shape[:2]
+        try:
+            px = self.polygon(H)
+        except np.linalg.LinAlgError:
+            logging.warning("Field mask could not invert the homography")
+            self._region = None
+            return
+        x0, y0 = np.floor(px.min(axis=0)).astype(int) - self.padding
+        x1, y1 = np.ceil(px.max(axis=0)).astype(int) + self.padding + 1
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width), min(y1, height)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            logging.warning("Field boundary is outside the frame, detecting on the full frame")
+            self._region = None
+            return
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        polygon = [np.round(px - (x0, y0)).astype(np.int32)]
+        cv.fillPoly(mask, polygon, 255)
+        if self.padding > 0:
+            # a thick outline grows the polygon by the padding on every side
+            cv.polylines(mask, polygon, True, 255, thickness=2 * self.padding + 1)
+        self._region = ((x0, y0, x1, y1), mask)
+        self._buffer = None
+        self._updates.inc()
+        self._fraction.set(float(np.count_nonzero(mask)) / (width * height))
+
+    def apply(self, frame: np.ndarray) -> tuple[np.ndarray, int, int]:
+        """
+        Crops and masks a frame to the field.
+        @param frame: the raw camera frame
+        @return: the cropped frame and the x, y offset of the crop, which is added to positions found in it
+        """
+        self.frame_count += 1
+        H = self.field_homography.H
+        if H is None or (self.full_frame_interval and self.frame_count % self.full_frame_interval == 0):
+            return frame, 0, 0
+        if H is not self._H or frame.shape != self._shape:
+            self.update(H, frame.shape)
+        region = self._region
+        if region is None:
+            return frame, 0, 0
+        (x0, y0, x1, y1), mask = region
+        crop = frame[y0:y1, x0:x1]
+        if self._buffer is None or self._buffer.shape != crop.shape:
+            self._buffer = np.zeros_like(crop)
+        # only pixels inside the polygon are written, the ones outside stay black
+        cv.bitwise_and(crop, crop, dst=self._buffer, mask=mask)
+        return self._buffer, x0, y0
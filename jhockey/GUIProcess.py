@@ -0,0 +1,488 @@
+"""
+Runs the GameGUI front end in its own process, so NiceGUI does not compete with the pipeline for the GIL.
+
+The pipeline process uses a RemoteGUI in place of the GameGUI. Every game loop iteration it writes the GUI data
+into a GUISnapshot in shared memory, guarded by a sequence lock so the GUI never reads a half-written state.
+The GUI process (python -m jhockey.GUIProcess, started by RemoteGUI) polls the snapshot and sends the
+referee's commands (start/pause, reset, score, goal decisions) back over a multiprocessing connection.
+"""
+from __future__ import annotations
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Listener, Client, Connection
+from threading import Thread, Lock
+import argparse
+import logging
+import secrets
+import subprocess
+import json
+import time
+import sys
+import os
+import numpy as np
+from .types import GameState, Team, GUIData, RobotState, PuckState, AruCoTag, Point, GoalEvent, ConnectionState, StageState
+from .Metrics import metrics
+
+HEADER = np.dtype(
+    [
+        ("seq", "<u8"),  # odd while the pipeline is writing
+        ("state", "u1"),
+        ("seconds_remaining", "<f8"),
+        ("score_red", "<i4"),
+        ("score_blue", "<i4"),
+        ("cam_connected", "u1"),
+        ("radio_connected", "i1"),  # -1: no radio
+        ("puck_found", "i1"),  # -1: no puck tracker
+        ("puck_x", "<f8"),
+        ("puck_y", "<f8"),
+        ("goal_seq", "<u4"),
+        ("goal_team", "i1"),  # -1: no pending goal
+        ("goal_crossing_time", "<f8"),
+        ("goal_frame_time", "<f8"),
+        ("goal_detected_time", "<f8"),
+        ("n_robots", "<u4"),
+        ("n_tags", "<u4"),
+        ("broadcast_len", "<u4"),
+        ("devices_len", "<u4"),
+    ]
+)
+ROBOT = np.dtype([("id", "<i4"), ("x", "<f4"), ("y", "<f4"), ("heading", "<f4"), ("found", "u1")])
+TAG = np.dtype([("id", "<i4"), ("x", "<f4"), ("y", "<f4")])
+STATES = list(GameState)
+TEAMS = list(Team)
+
+
+class GUISnapshot:
+    """
+    Fixed-layout view of the GUI data in shared memory: a header, robot and tag tables, the debug broadcast
+    string and the device and stage states as JSON. One process writes, any number read.
+    """
+
+    def __init__(self, name: str = None, max_robots: int = 64, max_tags: int = 128, max_text: int = 1024):
+        """
+        Parameters
+        ----------
+        name : str, optional
+            The shared memory block to attach to, by default None (create one)
+        max_robots : int, optional
+            The most robots the snapshot holds, by default 64
+        max_tags : int, optional
+            The most detected tags the snapshot holds, by default 128
+        max_text : int, optional
+            The size of the broadcast string and device state fields in bytes, by default 1024
+        """
+        self.max_robots = max_robots
+        self.max_tags = max_tags
+        self.max_text = max_text
+        size = HEADER.itemsize + max_robots * ROBOT.itemsize + max_tags * TAG.itemsize + 2 * max_text
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        if not self.owner:
+            # only the creating process unlinks the block (Python < 3.13 tracks attached blocks too)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        buf = self.shm.buf
+        offset = 0
+        self.header = np.ndarray((), dtype=HEADER, buffer=buf, offset=offset)
+        offset += HEADER.itemsize
+        self.robots = np.ndarray((max_robots,), dtype=ROBOT, buffer=buf, offset=offset)
+        offset += max_robots * ROBOT.itemsize
+        self.tags = np.ndarray((max_tags,), dtype=TAG, buffer=buf, offset=offset)
+        offset += max_tags * TAG.itemsize
+        self.broadcast = np.ndarray((max_text,), dtype=np.uint8, buffer=buf, offset=offset)
+        offset += max_text
+        self.devices = np.ndarray((max_text,), dtype=np.uint8, buffer=buf, offset=offset)
+        self.goal_seq = 0
+        self._goal = None
+        self._goal_event: GoalEvent | None = None
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def _write_text(field: np.ndarray, text: bytes) -> int:
+        n = min(len(text), len(field))
+        field[:n] = np.frombuffer(text, dtype=np.uint8, count=n)
+        return n
+
+    def write(self, data: GUIData, broadcast: bytes = None, devices: bytes = None):
+        """
+        Writes the GUI data. The broadcast string and device and stage states are only rewritten when given.
+        """
+        h = self.header
+        h["seq"] += 1
+        h["state"] = STATES.index(data.state)
+        h["seconds_remaining"] = data.seconds_remaining
+        h["score_red"] = data.score[Team.RED]
+        h["score_blue"] = data.score[Team.BLUE]
+        h["cam_connected"] = bool(data.cam_connected)
+        h["radio_connected"] = -1 if data.radio_connected is None else int(data.radio_connected)
+        if data.puck is None:
+            h["puck_found"] = -1
+        else:
+            h["puck_found"] = int(data.puck.found)
+            h["puck_x"] = data.puck.x
+            h["puck_y"] = data.puck.y
+        goal = data.pending_goal
+        if goal is not self._goal:
+            self._goal = goal
+            self.goal_seq += 1
+            h["goal_seq"] = self.goal_seq
+            h["goal_team"] = -1 if goal is None else TEAMS.index(goal.team)
+            if goal is not None:
+                h["goal_crossing_time"] = goal.crossing_time
+                h["goal_frame_time"] = goal.frame_time
+                h["goal_detected_time"] = goal.detected_time
+        n = 0
+        if data.robot_states is not None:
+            robots = self.robots
+            for tag, robot in data.robot_states.items():
+                if n == self.max_robots:
+                    break
+                row = robots[n]
+                row["id"], row["x"], row["y"], row["heading"], row["found"] = tag, robot.x, robot.y, robot.heading, robot.found
+                n += 1
+        h["n_robots"] = n
+        n = 0
+        if data.aruco_tags is not None:
+            tags = self.tags
+            for tag in data.aruco_tags:
+                if n == self.max_tags:
+                    break
+                row = tags[n]
+                row["id"], row["x"], row["y"] = tag.id, tag.center.x, tag.center.y
+                n += 1
+        h["n_tags"] = n
+        if broadcast is not None:
+            h["broadcast_len"] = self._write_text(self.broadcast, broadcast)
+        if devices is not None:
+            h["devices_len"] = self._write_text(self.devices, devices)
+        h["seq"] += 1
+
+    def read(self, retries: int = 10) -> tuple[GUIData, dict[str, dict[str, str]]] | None:
+        """
+        Returns a consistent copy of the GUI data and the device and stage states, or None if nothing was written yet
+        or the writer kept overwriting it.
+        """
+        for _ in range(retries):
+            seq = int(self.header["seq"])
+            if seq == 0:
+                return None
+            if seq % 2 == 1:
+                time.sleep(0.0005)
+                continue
+            h = self.header.copy()
+            robots = self.robots[: h["n_robots"]].copy()
+            tags = self.tags[: h["n_tags"]].copy()
+            broadcast = self.broadcast[: h["broadcast_len"]].tobytes()
+            devices = self.devices[: h["devices_len"]].tobytes()
+            if int(self.header["seq"]) == seq:
+                return self._unpack(h, robots, tags, broadcast), json.loads(devices) if devices else {}
+        return None
+
+    def _unpack(self, h: np.ndarray, robots: np.ndarray, tags: np.ndarray, broadcast: bytes) -> GUIData:
+        score = {Team.RED: int(h["score_red"]), Team.BLUE: int(h["score_blue"])}
+        if h["goal_seq"] != self.goal_seq:
+            # one GoalEvent per goal, the GUI opens its prompt when the object changes
+            self.goal_seq = int(h["goal_seq"])
+            self._goal_event = None
+            if h["goal_team"] >= 0:
+                self._goal_event = GoalEvent(
+                    team=TEAMS[h["goal_team"]],
+                    crossing_time=float(h["goal_crossing_time"]),
+                    frame_time=float(h["goal_frame_time"]),
+                    detected_time=float(h["goal_detected_time"]),
+                )
+        return GUIData(
+            state=STATES[h["state"]],
+            seconds_remaining=float(h["seconds_remaining"]),
+            puck=None if h["puck_found"] < 0 else PuckState(float(h["puck_x"]), float(h["puck_y"]), bool(h["puck_found"])),
+            score=score,
+            score_as_string=f"Red: {score[Team.RED]}, Blue: {score[Team.BLUE]}",
+            robot_states={
+                int(row["id"]): RobotState(float(row["x"]), float(row["y"]), float(row["heading"]), bool(row["found"]))
+                for row in robots
+            },
+            aruco_tags=[AruCoTag(int(row["id"]), Point(float(row["x"]), float(row["y"])), 0, 0) for row in tags],
+            cam_connected=bool(h["cam_connected"]),
+            broadcast_msg=broadcast.decode() if broadcast else None,
+            radio_connected=None if h["radio_connected"] < 0 else bool(h["radio_connected"]),
+            pending_goal=self._goal_event,
+        )
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RemoteGUI:
+    """
+    Stand-in for GameGUI in the pipeline process. Publishes the GUI data to the shared-memory snapshot and
+    turns the commands of the GUI process into the flags the GameManager reads, one of each kind per iteration.
+    """
+
+    def __init__(self, profiler=None, profile_window: float = 10.0, serve_metrics: bool = False, port: int = 8080):
+        """
+        Parameters
+        ----------
+        profiler : SamplingProfiler, optional
+            Profiler triggered by the "Profile" debug button, by default None (no button)
+        profile_window : float, optional
+            The capture window in seconds for the "Profile" button, by default 10.0
+        serve_metrics : bool, optional
+            Serve the pipeline metrics at /metrics of the GUI, by default False
+        port : int, optional
+            The port of the web GUI, by default 8080
+        """
+        self.profiler = profiler
+        self.profile_window = profile_window
+        self.serve_metrics = serve_metrics
+        self.port = port
+        self.toggle_state = False
+        self.reset_state = False
+        self.add_score: Team | None = None
+        self.goal_decision: str | None = None
+        self.debug = False
+        self.device_states: dict[str, ConnectionState] = {}
+        self.stage_states: dict[str, StageState] = {}
+        self.snapshot: GUISnapshot | None = None
+        self.process: subprocess.Popen | None = None
+        self.conn: Connection | None = None
+        self.commands: deque = deque()
+        self._devices_changed = True
+        self._listener: Listener | None = None
+        self._commands = metrics.counter("gui_commands")
+        self._write = metrics.stage("gui_snapshot")
+
+    def on_device_state(self, name: str, state: ConnectionState):
+        """
+        Device supervisor listener, forwarded to the debug view of the GUI process.
+        """
+        self.device_states = {**self.device_states, name: state}
+        self._devices_changed = True
+
+    def on_stage_state(self, name: str, state: StageState):
+        """
+        Watchdog listener, forwarded to the GUI process with the device states.
+        """
+        self.stage_states = {**self.stage_states, name: state}
+        self._devices_changed = True
+
+    def create_ui(self, match_length_sec: int):
+        """
+        Creates the snapshot and starts the GUI process.
+        """
+        self.snapshot = GUISnapshot()
+        authkey = secrets.token_bytes(16)
+        self._listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        host, port = self._listener.address
+        command = [
+            sys.executable, "-m", "jhockey.GUIProcess",
+            "--snapshot", self.snapshot.name,
+            "--address", f"{host}:{port}",
+            "--match-length", str(match_length_sec),
+            "--profile-window", str(self.profile_window),
+            "--port", str(self.port),
+        ]
+        if self.profiler is not None:
+            command.append("--profiler")
+        if self.serve_metrics:
+            command.append("--metrics")
+        # the key is passed through the environment so it does not show up in the process list
+        self.process = subprocess.Popen(command, env={**os.environ, "JHOCKEY_GUI_KEY": authkey.hex()})
+        t = Thread(target=self.run, name="GUI Commands")
+        t.daemon = True
+        t.start()
+
+    def run(self):
+        """
+        Receives commands from the GUI process. Requests that need an answer are served right here,
+        the referee's commands are queued for the game loop.
+        """
+        self.conn = self._listener.accept()
+        while True:
+            try:
+                command, *args = self.conn.recv()
+            except (EOFError, OSError):
+                logging.error("GUI process disconnected")
+                return
+            self._commands.inc()
+            match command:
+                case "metrics":
+                    self.conn.send(metrics.render())
+                case "profile":
+                    self.conn.send(self.profiler is not None and self.profiler.capture(args[0]))
+                case "last_capture":
+                    self.conn.send(self.profiler.last_capture if self.profiler is not None else None)
+                case "debug":
+                    self.debug = args[0]
+                case _:
+                    self.commands.append((command, *args))
+
+    def update(self, data: GUIData):
+        t0 = self._write.begin()
+        self.toggle_state = False
+        self.reset_state = False
+        self.add_score = None
+        self.goal_decision = None
+        broadcast = None
+        if self.debug:
+            broadcast = str(data.broadcast_msg).encode() if data.broadcast_msg is not None else b"No broadcast message"
+        devices = None
+        if self._devices_changed:
+            self._devices_changed = False
+            devices = json.dumps({
+                "devices": {name: state.name for name, state in self.device_states.items()},
+                "stages": {name: state.name for name, state in self.stage_states.items()},
+            }).encode()
+        self.snapshot.write(data, broadcast, devices)
+        self.next_commands()
+        self._write.end(t0)
+
+    def next_commands(self):
+        """
+        Sets the flags for the next iteration from the queued commands, at most one of each kind.
+        """
+        seen = set()
+        while self.commands:
+            command, *args = self.commands[0]
+            if command in seen:
+                return
+            seen.add(command)
+            self.commands.popleft()
+            match command:
+                case "toggle":
+                    self.toggle_state = True
+                case "reset":
+                    self.reset_state = True
+                case "score":
+                    self.add_score = Team[args[0]]
+                case "goal":
+                    self.goal_decision = args[0]
+
+    def wait(self):
+        """
+        Blocks until the GUI process exits.
+        """
+        try:
+            self.process.wait()
+        except KeyboardInterrupt:
+            self.process.wait()
+        self.snapshot.close()
+
+
+class GUIChannel:
+    """
+    The GUI process end of the command connection. Sends are serialized, since both the UI event loop and the
+    metrics route use it.
+    """
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.lock = Lock()
+
+    def send(self, *command):
+        with self.lock:
+            self.conn.send(command)
+
+    def request(self, *command, timeout: float = 2.0):
+        with self.lock:
+            self.conn.send(command)
+            if not self.conn.poll(timeout):
+                raise TimeoutError(f"No reply to {command[0]} from the pipeline")
+            return self.conn.recv()
+
+
+class RemoteMetrics:
+    """
+    Renders the pipeline's metrics registry, so add_metrics_route can serve it from the GUI process.
+    """
+
+    def __init__(self, channel: GUIChannel):
+        self.channel = channel
+
+    def render(self) -> str:
+        return self.channel.request("metrics")
+
+
+class RemoteProfiler:
+    """
+    Starts profiler captures in the pipeline process, which is where the threads worth profiling run.
+    """
+
+    def __init__(self, channel: GUIChannel):
+        self.channel = channel
+
+    def capture(self, duration: float) -> bool:
+        return self.channel.request("profile", duration)
+
+    @property
+    def last_capture(self) -> str | None:
+        return self.channel.request("last_capture")
+
+
+def run_gui(args: argparse.Namespace):
+    from nicegui import app, ui
+    from .GameGUI import GameGUI
+
+    start_time = time.perf_counter()
+    host, port = args.address.rsplit(":", 1)
+    channel = GUIChannel(Client((host, int(port)), authkey=bytes.fromhex(os.environ["JHOCKEY_GUI_KEY"])))
+    snapshot = GUISnapshot(name=args.snapshot)
+    gui = GameGUI(profiler=RemoteProfiler(channel) if args.profiler else None, profile_window=args.profile_window)
+    gui.create_ui(args.match_length)
+    parent = os.getppid()
+    last_debug = gui.debug
+
+    def poll():
+        nonlocal last_debug
+        if os.getppid() != parent:
+            # the pipeline exited
+            app.shutdown()
+            return
+        # forward what the referee did since the last update, the same flags the GameManager reads in-process
+        if gui.add_score is not None:
+            channel.send("score", gui.add_score.name)
+        if gui.goal_decision is not None:
+            channel.send("goal", gui.goal_decision)
+        if gui.reset_state:
+            channel.send("reset")
+        if gui.toggle_state:
+            channel.send("toggle")
+        gui.add_score, gui.goal_decision, gui.reset_state, gui.toggle_state = None, None, False, False
+        if gui.debug != last_debug:
+            last_debug = gui.debug
+            channel.send("debug", gui.debug)
+        snapshot_data = snapshot.read()
+        if snapshot_data is None:
+            return
+        data, devices = snapshot_data
+        device_states = devices.get("devices", {})
+        if device_states != {name: state.name for name, state in gui.device_states.items()}:
+            gui.device_states = {name: ConnectionState[state] for name, state in device_states.items()}
+        stage_states = devices.get("stages", {})
+        if stage_states != {name: state.name for name, state in gui.stage_states.items()}:
+            gui.stage_states = {name: StageState[state] for name, state in stage_states.items()}
+        gui.update(data)
+
+    ui.timer(1 / 30, poll)
+    if args.metrics:
+        from .Metrics import add_metrics_route
+        add_metrics_route(app, registry=RemoteMetrics(channel))
+
+    app.on_startup(lambda: print(f"GUI process ready after {time.perf_counter() - start_time:.2f} s"))
+    app.on_shutdown(snapshot.close)
+    ui.run(title="JHockey", reload=False, host="0.0.0.0", port=args.port, show=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JHockey GUI process, started by RemoteGUI.")
+    parser.add_argument("--snapshot", type=str, required=True, help="Shared memory name of the GUI snapshot.")
+    parser.add_argument("--address", type=str, required=True, help="host:port of the pipeline's command listener.")
+    parser.add_argument("--match-length", type=int, default=180)
+    parser.add_argument("--profile-window", type=float, default=10.0)
+    parser.add_argument("--profiler", action="store_true")
+    parser.add_argument("--metrics", action="store_true")
+    parser.add_argument("--port", type=int, default=8080)
+    run_gui(parser.parse_args())
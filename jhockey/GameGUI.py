@@ -1,4 +1,4 @@
-from .types import GameState, Team, GUIData
+from .types import GameState, Team, GUIData, ConnectionState, StageState
 from functools import partial
 import time
 import signal
@@ -15,20 +15,60 @@ class GameGUI:
     Web GUI to control the game, add score, monitor time, and start/stop gameplay.
     """
 
-    def __init__(self):
+    def __init__(self, profiler=None, profile_window: float = 10.0):
+        """
+        Parameters
+        ----------
+        profiler : SamplingProfiler, optional
+            Profiler triggered by the "Profile" debug button, by default None (no button)
+        profile_window : float, optional
+            The capture window in seconds for the "Profile" button, by default 10.0
+        """
+        self.profiler = profiler
+        self.profile_window = profile_window
+        self.last_capture: str | None = None
         self.state = GameState.STOPPED
         self.toggle_state = False
         self.reset_state = False
         self.seconds_remaining: int = None
         self.score = None
         self.add_score = None
+        self.goal_decision: str | None = None
+        self.pending_goal = None
         self.last_update_time = time.time()
         self.camera_connected = False
+        self.radio_connected: bool | None = None
+        self.device_states: dict[str, ConnectionState] = {}
+        self.stage_states: dict[str, StageState] = {}
         
     @property
     def int_seconds_remaining(self) -> int:
         return int(self.seconds_remaining)
 
+    @property
+    def device_status_text(self) -> str:
+        return " | ".join(f"{name}: {state.name.lower()}" for name, state in self.device_states.items())
+
+    @property
+    def stalled(self) -> bool:
+        return StageState.STALLED in self.stage_states.values()
+
+    @property
+    def stall_text(self) -> str:
+        return "Stalled: " + ", ".join(name for name, state in self.stage_states.items() if state == StageState.STALLED)
+
+    def on_device_state(self, name: str, state: ConnectionState):
+        """
+        Device supervisor listener, records the connection state shown in the debug view.
+        """
+        self.device_states = {**self.device_states, name: state}
+
+    def on_stage_state(self, name: str, state: StageState):
+        """
+        Watchdog listener, stalled stages are shown next to the controls.
+        """
+        self.stage_states = {**self.stage_states, name: state}
+
     def create_ui(self, match_length_sec: int):
         self.match_length_sec = match_length_sec
         self.seconds_remaining = match_length_sec
@@ -69,6 +109,13 @@ class GameGUI:
             ]
             self.tag_debug_tab = ui.table(columns=tag_columns, rows=[], row_key="id")
             self.broadcast_msg = ui.label("No broadcast message")
+            self.device_status = ui.label("").bind_text_from(self, "device_status_text")
+            if self.profiler is not None:
+                self.profile_button: ui.button = ui.button(
+                    "Profile", on_click=self.capture_profile, color="purple"
+                )
+                # also reports captures started with --profile
+                ui.timer(1.0, self.check_profile)
 
             # self.loop_rate_indicator = ui.label("")
 
@@ -105,12 +152,48 @@ class GameGUI:
                 .bind_visibility_from(self, "camera_connected", value=False)
                 .classes("text-5xl")
             )
+            self.radio_connected_icon = (
+                ui.icon("cell_tower", color="green")
+                .bind_visibility_from(self, "radio_connected", value=True)
+                .classes("text-5xl")
+            )
+            self.radio_disconnected_icon = (
+                ui.icon("portable_wifi_off", color="red")
+                .bind_visibility_from(self, "radio_connected", value=False)
+                .classes("text-5xl")
+            )
+            self.stall_warning = (
+                ui.label("")
+                .bind_text_from(self, "stall_text")
+                .bind_visibility_from(self, "stalled")
+                .classes("text-h6 text-red")
+            )
+        with ui.dialog().props("persistent") as self.goal_dialog, ui.card():
+            self.goal_label = ui.label("").classes("text-h6")
+            with ui.row():
+                ui.button("Confirm", on_click=partial(self.decide_goal, "confirm"), color="green")
+                self.override_button: ui.button = ui.button(
+                    "Other team", on_click=partial(self.decide_goal, "override"), color="orange"
+                )
+                ui.button("No goal", on_click=partial(self.decide_goal, "reject"), color="red")
         app.on_shutdown(self.cleanup)
         signal.signal(signal.SIGINT, handle_sigint)
 
     def toggle_debug(self):
         self.debug = not self.debug
 
+    def capture_profile(self):
+        if self.profiler.capture(self.profile_window):
+            ui.notify(f"Profiling all threads for {self.profile_window:g} s")
+        else:
+            ui.notify("Profile capture already in progress")
+
+    def check_profile(self):
+        last_capture = self.profiler.last_capture
+        if last_capture is not None and last_capture != self.last_capture:
+            self.last_capture = last_capture
+            ui.notify(f"Profile written to {last_capture}")
+
     def start_pause(self):
         self.toggle_state = True
 
@@ -123,10 +206,13 @@ class GameGUI:
         self.reset_state = False
         self.state = data.state
         self.add_score = None
+        self.goal_decision = None
+        self.show_goal(data.pending_goal)
         self.score = data.score
         self.score_display.text = data.score_as_string
         self.seconds_remaining = data.seconds_remaining
         self.camera_connected = data.cam_connected
+        self.radio_connected = data.radio_connected
         robot_states = data.robot_states
         aruco_tags = data.aruco_tags
         if robot_states is not None and self.debug:
@@ -166,6 +252,25 @@ class GameGUI:
         self.last_update_time = time.time()
         self.update_rate.text = f"Update Rate: {update_rate:.1e} Hz"
 
+    def show_goal(self, goal):
+        """
+        Opens the confirm/override prompt for a detected goal and closes it once the goal is resolved.
+        """
+        if goal is self.pending_goal:
+            return
+        self.pending_goal = goal
+        if goal is None:
+            self.goal_dialog.close()
+            return
+        other = Team.BLUE if goal.team == Team.RED else Team.RED
+        latency_ms = 1e3 * (goal.detected_time - goal.frame_time)
+        self.goal_label.text = f"Goal detected for {goal.team.name} ({latency_ms:.0f} ms)"
+        self.override_button.text = f"Goal for {other.name}"
+        self.goal_dialog.open()
+
+    def decide_goal(self, decision: str):
+        self.goal_decision = decision
+
     def update_score(self, team: Team):
         if self.state == GameState.RUNNING:
             self.add_score = team
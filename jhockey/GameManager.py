@@ -6,11 +6,13 @@ from .types import (
     AruCoTag,
     GameState,
     BroadcasterMessage,
+    GoalEvent,
 )
+from .Metrics import metrics
+from .Clock import WallClock
 from typing import Optional, Any, Protocol
 import threading
 from datetime import datetime
-from time import time
 
 
 class PausableTimer(Protocol):
@@ -38,6 +40,12 @@ class PausableTimer(Protocol):
         """
         ...
 
+    def seconds(self) -> float:
+        """
+        Returns the time elapsed in seconds.
+        """
+        ...
+
     def reset(self):
         """
         Resets the timer.
@@ -52,6 +60,17 @@ class PausableTimer(Protocol):
         ...
 
 
+class Clock(Protocol):
+    def now(self) -> float:
+        """
+        Returns the current time in seconds.
+        """
+        ...
+
+    def sleep(self, seconds: float) -> None:
+        ...
+
+
 class ThreadedNode(Protocol):
     def get(self) -> Any:
         ...
@@ -83,6 +102,10 @@ class Broadcaster(ThreadedNode):
         """
         ...
 
+    @property
+    def connected(self) -> bool:
+        ...
+
 
 class FieldHomography(Protocol):
     def find_homography(self, field_tags: list[AruCoTag]) -> None:
@@ -99,6 +122,63 @@ class FieldHomography(Protocol):
         ...
 
 
+class TrajectoryStore(Protocol):
+    def start_match(self) -> None:
+        ...
+
+    def end_match(self) -> None:
+        ...
+
+    def append(self, t: float, robots: dict[int, RobotState], puck: PuckState = None) -> None:
+        """
+        Queues the poses at match time t without blocking.
+        """
+        ...
+
+
+class GoalDetector(Protocol):
+    def update(self, puck: PuckState, frame_time: float) -> Optional[GoalEvent]:
+        """
+        Returns the goal scored since the previous puck position, if any.
+        """
+        ...
+
+    def reset(self) -> None:
+        ...
+
+
+class TagRegistry(Protocol):
+    def partition(self, tags: list[AruCoTag]) -> Any:
+        """
+        Splits a frame's detections into field, robots and puck tags, dropping unknown tags.
+        """
+        ...
+
+
+class StateStream(Protocol):
+    def publish(
+        self,
+        seconds_remaining: float,
+        state: GameState,
+        score: dict[Team, int],
+        robots: dict[int, RobotState],
+        puck: PuckState = None,
+    ) -> None:
+        """
+        Hands the latest state to the stream clients without blocking.
+        """
+        ...
+
+
+class Watchdog(Protocol):
+    @property
+    def tracking_stalled(self) -> bool:
+        """
+        Returns whether a stage the robot positions depend on is stalled.
+        """
+        ...
+
+
 class GUI(Protocol):
     def create_ui(self, match_length_sec: int) -> None:
         ...
@@ -116,6 +196,13 @@ class GUI(Protocol):
         """
         ...
 
+    @property
+    def goal_decision(self) -> Optional[str]:
+        """
+        Returns the referee's decision on a detected goal: "confirm", "override" or "reject".
+        """
+        ...
+
     @property
     def reset_state(self) -> bool:
         """
@@ -148,6 +235,12 @@ class GameManager:
         aruco_detector: ArucoDetector = None,
         gui: Optional[GUI] = None,
         timer: PausableTimer = None,
+        trajectory_store: TrajectoryStore = None,
+        goal_detector: GoalDetector = None,
+        tag_registry: TagRegistry = None,
+        clock: Clock = None,
+        state_stream: StateStream = None,
+        watchdog: Watchdog = None,
     ):
         """
         Parameters
@@ -168,6 +261,22 @@ class GameManager:
             The GUI object, by default None
         timer : PausableTimer
             The timer object.
+        trajectory_store : TrajectoryStore, optional
+            Records the poses of every match while it is running, by default None
+        goal_detector : GoalDetector, optional
+            Detects goals from the puck track; a goal pauses the match until the referee confirms it in the GUI,
+            by default None
+        tag_registry : TagRegistry, optional
+            Partitions each frame's tags once, so only field tags reach the homography and only robot tags
+            reach the tracker, by default None (every tag is passed to both)
+        clock : Clock, optional
+            The clock of the game loop, shared with the timer, by default None (the wall clock).
+            With a VirtualClock, run_until() simulates a match in a single thread as fast as it can.
+        state_stream : StateStream, optional
+            Publishes every iteration's robots, puck, time and score to external clients, by default None
+        watchdog : Watchdog, optional
+            While it reports tracking as stalled, robots are marked as not found and left out of the broadcast,
+            by default None
         """
         self.match_length_sec = match_length_sec
         self.start_time = None
@@ -181,10 +290,28 @@ class GameManager:
         self.robot_states: Optional[dict[int, RobotState]] = None
         self.aruco_detector: Optional[ArucoDetector] = aruco_detector
         self.gui: Optional[GUI] = gui
+        self.trajectory_store: Optional[TrajectoryStore] = trajectory_store
+        self.goal_detector: Optional[GoalDetector] = goal_detector
+        self.tag_registry: Optional[TagRegistry] = tag_registry
+        self.clock: Clock = clock if clock is not None else WallClock()
+        self.state_stream: Optional[StateStream] = state_stream
+        self.watchdog: Optional[Watchdog] = watchdog
+        self._no_robots: dict[int, RobotState] = {}
+        self.pending_goal: Optional[GoalEvent] = None
+        # double buffered: the broadcaster thread encodes the message handed over last while the next one is filled
+        self._messages = (
+            BroadcasterMessage(time_dsec=int(match_length_sec * 1e1), robots={}, enabled=False),
+            BroadcasterMessage(time_dsec=int(match_length_sec * 1e1), robots={}, enabled=False),
+        )
+        self.message = self._messages[0]
+        self.gui_data: Optional[GUIData] = None
+        self._score_string = None
+        self._score_key = None
         self.gui.create_ui(self.match_length_sec)
         self._state: GameState = GameState.STOPPED
         self.loop_rate = 0
         self.lock = threading.Lock()
+        self._stage = metrics.stage("game_manager")
 
     def start(self):
         """
@@ -214,9 +341,13 @@ class GameManager:
     @property
     def score_as_string(self) -> str:
         """
-        Returns the score as a string.
+        Returns the score as a string, only formatted again when the score changes.
         """
-        return f"Red: {self.score[Team.RED]}, Blue: {self.score[Team.BLUE]}"
+        red, blue = self.score[Team.RED], self.score[Team.BLUE]
+        if self._score_key is None or self._score_key[0] != red or self._score_key[1] != blue:
+            self._score_key = (red, blue)
+            self._score_string = f"Red: {red}, Blue: {blue}"
+        return self._score_string
 
     def start_game(self):
         """
@@ -225,8 +356,11 @@ class GameManager:
         if self.state == GameState.PAUSED:
             self.timer.resume()
         else:
-            self.score = {Team.RED: 0, Team.BLUE: 0}
+            for team in self.score:
+                self.score[team] = 0
             self.timer.start()
+            if self.trajectory_store is not None:
+                self.trajectory_store.start_match()
 
     @property
     def seconds_remaining(self) -> float:
@@ -234,9 +368,9 @@ class GameManager:
         Returns the time remaining in the game.
         If remaining time is negative, resets the game.
         """
-        if not self.timer.timestarted:
+        if self.timer.timestarted is None:
             return self.match_length_sec
-        remaining = self.match_length_sec - self.timer.get().total_seconds()
+        remaining = self.match_length_sec - self.timer.seconds()
         return remaining if remaining > 0 else 0
 
     def pause(self):
@@ -251,46 +385,116 @@ class GameManager:
         """
         self.timer.reset()
         self.start_time = None
+        if self.trajectory_store is not None:
+            self.trajectory_store.end_match()
+        self.pending_goal = None
+        if self.goal_detector is not None:
+            self.goal_detector.reset()
 
     def update(self):
         """
         Updates the game state.
         """
         while True:
-            if not self.aruco_detector.threading:
-                self.aruco_detector.detect()
-            aruco_tags = self.aruco_detector.get()
-            self.field_homography.find_homography(aruco_tags)
-            H = self.field_homography.H
-            self.robot_tracker.set(aruco_tags, H)
-            self.puck_state = None
-            if self.puck_tracker is not None:
-                self.puck_state = self.puck_tracker.get()
-            self.robot_states = self.robot_tracker.get()
-
-            if self.seconds_remaining <= 0:
-                self.state = GameState.STOPPED
-
-            msg = None
-            if self.broadcaster is not None:
-                time_left_decisecond = (
-                    (self.match_length_sec - self.timer.get().total_seconds()) * 1e1
-                    if self.timer.timestarted
-                    else (self.match_length_sec * 1e1)
-                )
-                msg = BroadcasterMessage(
-                    time_dsec=int(time_left_decisecond),
-                    robots=self.robot_states,
-                    enabled=self.state == GameState.RUNNING,
-                )
-                self.broadcaster.set_message(msg)
-            if self.gui is not None:
-                self.update_gui(aruco_tags, msg)
+            self.step()
+
+    def run_until(self, t: float, dt: float = 1 / 30) -> int:
+        """
+        Runs the game loop in the calling thread until the clock reaches t, sleeping dt after every step.
+        With a VirtualClock (and no node threads started) every stage runs in order on virtual time,
+        so runs are reproducible and take only as long as the computation.
+        Returns the number of steps run.
+        """
+        steps = 0
+        while self.clock.now() < t:
+            self.step()
+            self.clock.sleep(dt)
+            steps += 1
+        return steps
+
+    def step(self):
+        """
+        Runs one iteration of the game loop.
+        The two broadcast messages and the GUI data are allocated once and updated in place, so the steady-state
+        loop does not produce garbage.
+        """
+        t0 = self._stage.begin()
+        if not self.aruco_detector.connected:
+            # nothing to track until the camera connects, so keep the clock and GUI running without spinning
+            self.clock.sleep(0.05)
+        elif not self.aruco_detector.threading:
+            self.aruco_detector.detect()
+        aruco_tags = self.aruco_detector.get()
+        field_tags = robot_tags = aruco_tags
+        if self.tag_registry is not None:
+            frame = self.tag_registry.partition(aruco_tags)
+            field_tags, robot_tags = frame.field, frame.robots
+        self.field_homography.find_homography(field_tags)
+        H = self.field_homography.H
+        self.robot_tracker.set(robot_tags, H)
+        self.puck_state = None
+        if self.puck_tracker is not None:
+            self.puck_state = self.puck_tracker.get()
+            if self.goal_detector is not None and self.state == GameState.RUNNING:
+                self.detect_goal()
+        self.robot_states = self.robot_tracker.get()
+        tracking_stalled = self.watchdog is not None and self.watchdog.tracking_stalled
+        if tracking_stalled:
+            # the positions come from stale data
+            for robot in self.robot_states.values():
+                robot.found = False
+
+        elapsed = self.timer.seconds() if self.timer.timestarted is not None else 0.0
+        if self.trajectory_store is not None and self.state == GameState.RUNNING:
+            self.trajectory_store.append(elapsed, self.robot_states, self.puck_state)
+
+        if self.seconds_remaining <= 0:
+            self.state = GameState.STOPPED
+            elapsed = 0.0
+
+        if self.state_stream is not None:
+            self.state_stream.publish(self.seconds_remaining, self.state, self.score, self.robot_states, self.puck_state)
+
+        msg = None
+        if self.broadcaster is not None:
+            # fill the message the broadcaster is not sending
+            msg = self._messages[1] if self.message is self._messages[0] else self._messages[0]
+            msg.time_dsec = int((self.match_length_sec - elapsed) * 1e1)
+            # the broadcast formats without a found flag carry no robots instead
+            msg.robots = self._no_robots if tracking_stalled else self.robot_states
+            msg.enabled = self.state == GameState.RUNNING
+            self.broadcaster.set_message(msg)
+            self.message = msg
+        if self.gui is not None:
+            self.update_gui(aruco_tags, msg)
+        self._stage.end(t0)
+
+    def detect_goal(self):
+        """
+        Pauses the match when the goal detector sees the puck enter a goal, pending the referee's decision.
+        """
+        goal = self.goal_detector.update(self.puck_state, getattr(self.puck_tracker, "frame_time", self.clock.now()))
+        if goal is None:
+            return
+        self.pending_goal = goal
+        self.state = GameState.PAUSED
+
+    def resolve_goal(self, decision: str):
+        goal = self.pending_goal
+        self.pending_goal = None
+        if decision == "confirm":
+            self.score[goal.team] += 1
+        elif decision == "override":
+            other = Team.BLUE if goal.team == Team.RED else Team.RED
+            self.score[other] += 1
 
     def update_gui(self, aruco_tags: list[AruCoTag], broadcast_msg: BroadcasterMessage):
         add_score = self.gui.add_score
         if add_score is not None:
             self.score[add_score] += 1
+        goal_decision = self.gui.goal_decision
+        if goal_decision is not None and self.pending_goal is not None:
+            self.resolve_goal(goal_decision)
         reset_state = self.gui.reset_state
         if reset_state:
             self.state = GameState.STOPPED
@@ -301,17 +505,30 @@ class GameManager:
                     self.state = GameState.PAUSED
                 else:
                     self.state = GameState.RUNNING
-        send_data = GUIData(
-            state=self.state,
-            seconds_remaining=self.seconds_remaining,
-            puck=self.puck_state,
-            score=self.score,
-            score_as_string=self.score_as_string,
-            robot_states=self.robot_states,
-            aruco_tags=aruco_tags,
-            cam_connected=self.aruco_detector.connected,
-            broadcast_msg=broadcast_msg,
-        )
+        send_data = self.gui_data
+        if send_data is None:
+            send_data = self.gui_data = GUIData(
+                state=self.state,
+                seconds_remaining=self.seconds_remaining,
+                puck=self.puck_state,
+                score=self.score,
+                score_as_string=self.score_as_string,
+                robot_states=self.robot_states,
+                aruco_tags=aruco_tags,
+                cam_connected=self.aruco_detector.connected,
+                broadcast_msg=broadcast_msg,
+            )
+        send_data.state = self.state
+        send_data.seconds_remaining = self.seconds_remaining
+        send_data.puck = self.puck_state
+        send_data.score = self.score
+        send_data.score_as_string = self.score_as_string
+        send_data.robot_states = self.robot_states
+        send_data.aruco_tags = aruco_tags
+        send_data.cam_connected = self.aruco_detector.connected
+        send_data.broadcast_msg = broadcast_msg
+        send_data.radio_connected = self.broadcaster.connected if self.broadcaster is not None else None
+        send_data.pending_goal = self.pending_goal
         self.gui.update(
             send_data
         )  # used to thread lock this, dont think we need to anymore
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+import json
+import logging
+import time
+from .types import PuckState, Team, GoalEvent
+from .Metrics import metrics
+
+
+@dataclass
+class GoalRegion:
+    """
+    Axis-aligned goal region in field coordinates. A puck entering it scores for team.
+    """
+
+    team: Team
+    x_min: float
+    x_max: float
+    y_min: float
+    y_max: float
+
+    def contains(self, x: float, y: float) -> bool:
+        return self.x_min <= x <= self.x_max and self.y_min <= y <= self.y_max
+
+    def entry_fraction(self, x0: float, y0: float, x1: float, y1: float) -> Optional[float]:
+        """
+        Returns where along the segment from (x0, y0) to (x1, y1) it first enters the region, from 0 to 1,
+        or None if it misses (Liang-Barsky clipping).
+        """
+        dx = x1 - x0
+        dy = y1 - y0
+        t_enter, t_exit = 0.0, 1.0
+        for p, q in ((-dx, x0 - self.x_min), (dx, self.x_max - x0), (-dy, y0 - self.y_min), (dy, self.y_max - y0)):
+            if p == 0:
+                if q < 0:
+                    return None
+                continue
+            r = q / p
+            if p < 0:
+                t_enter = max(t_enter, r)
+            else:
+                t_exit = min(t_exit, r)
+        if t_enter > t_exit:
+            return None
+        return t_enter
+
+
+def load_goal_regions(config: str = "config.json") -> list[GoalRegion]:
+    """
+    Loads the goal regions from the config file, listed as, for example:
+    "goals": [
+        {
+            "team": "RED",
+            "x_min": 0, "x_max": 6.8333333,
+            "y_min": 9.3333333, "y_max": 10
+        }
+    ]
+    where team is the team that scores when the puck enters the region.
+    """
+    config = json.load(open(config, "r"))
+    return [
+        GoalRegion(Team[goal["team"].upper()], float(goal["x_min"]), float(goal["x_max"]), float(goal["y_min"]), float(goal["y_max"]))
+        for goal in config.get("goals", [])
+    ]
+
+
+class GoalDetector:
+    """
+    Detects goals from the puck track in field coordinates.
+    Consecutive puck positions are joined into a segment, so a goal is detected even if the puck passes
+    through a goal region between two frames, and the crossing time is interpolated along the segment.
+    After a goal the detector is disarmed until the puck has left every goal region and the debounce
+    time has passed, so a puck resting on the goal line scores once.
+    """
+
+    def __init__(self, goals: list[GoalRegion], debounce: float = 2.0, max_gap: float = 0.5):
+        """
+        Parameters
+        ----------
+        goals : list[GoalRegion]
+            The goal regions, i.e. from load_goal_regions()
+        debounce : float, optional
+            The minimum time between two goals in seconds, by default 2.0
+        max_gap : float, optional
+            Positions further apart in time than this are not joined into a segment, by default 0.5
+        """
+        self.goals = goals
+        self.debounce = debounce
+        self.max_gap = max_gap
+        self.last_position: Optional[tuple[float, float, float]] = None
+        self.last_goal_time: Optional[float] = None
+        self.armed = True
+        self._goals = {team: metrics.counter("goals_detected", team=team.name) for team in Team}
+        self._latency = metrics.histogram("goal_decision_latency_seconds")
+
+    def reset(self):
+        self.last_position = None
+        self.last_goal_time = None
+        self.armed = True
+
+    def update(self, puck: PuckState, frame_time: float) -> Optional[GoalEvent]:
+        """
+        Processes one puck position.
+        @param puck: the puck state in field coordinates
+        @param frame_time: time.perf_counter() timestamp of the frame the puck was seen in
+        @return: the goal scored between the previous position and this one, if any
+        """
+        if puck is None or not puck.found:
+            return None
+        x, y = float(puck.x), float(puck.y)
+        previous = self.last_position
+        if previous is not None and previous[0] == frame_time:
+            # same frame as last time
+            return None
+        self.last_position = (frame_time, x, y)
+        if not self.armed:
+            in_goal = any(goal.contains(x, y) for goal in self.goals)
+            if not in_goal and frame_time - self.last_goal_time >= self.debounce:
+                self.armed = True
+            return None
+        if previous is None or frame_time - previous[0] > self.max_gap:
+            return None
+        t0, x0, y0 = previous
+        for goal in self.goals:
+            if goal.contains(x0, y0):
+                # already inside, i.e. the puck was placed there
+                continue
+            fraction = goal.entry_fraction(x0, y0, x, y)
+            if fraction is None:
+                continue
+            detected = time.perf_counter()
+            event = GoalEvent(
+                team=goal.team,
+                crossing_time=t0 + fraction * (frame_time - t0),
+                frame_time=frame_time,
+                detected_time=detected,
+            )
+            self.armed = False
+            self.last_goal_time = frame_time
+            self._goals[goal.team].inc()
+            self._latency.observe(detected - frame_time)
+            logging.info(
+                "Goal for %s detected %.1f ms after the frame (crossing %.1f ms before the frame)",
+                goal.team.name,
+                1e3 * (detected - frame_time),
+                1e3 * (frame_time - event.crossing_time),
+            )
+            return event
+        return None
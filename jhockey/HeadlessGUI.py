@@ -0,0 +1,75 @@
+from .types import GameState, GUIData, ConnectionState, StageState
+from .Clock import WallClock
+import logging
+
+
+class HeadlessGUI:
+    """
+    Stand-in for GameGUI that runs the game without a web UI, i.e. for unattended soak runs.
+    With autoplay it acts as the referee: it starts a new match a few seconds after the last one ended,
+    confirms detected goals and resumes the match after them.
+    """
+
+    def __init__(self, autoplay: bool = True, between_matches: float = 2.0, clock=None):
+        """
+        Parameters
+        ----------
+        autoplay : bool, optional
+            Play matches back to back, by default True
+        between_matches : float, optional
+            The seconds between the end of a match and the start of the next, by default 2.0
+        clock : WallClock | VirtualClock, optional
+            The clock timing the pause between matches, by default None (the wall clock)
+        """
+        self.clock = clock if clock is not None else WallClock()
+        self.autoplay = autoplay
+        self.between_matches = between_matches
+        self.state = GameState.STOPPED
+        self.toggle_state = False
+        self.reset_state = False
+        self.add_score = None
+        self.goal_decision: str | None = None
+        self.data: GUIData | None = None
+        self.matches_started = 0
+        self.device_states: dict[str, ConnectionState] = {}
+        self.stage_states: dict[str, StageState] = {}
+        self._stopped_since: float | None = None
+
+    def on_device_state(self, name: str, state: ConnectionState):
+        """
+        Device supervisor listener.
+        """
+        self.device_states = {**self.device_states, name: state}
+        logging.info("%s is %s", name, state.name.lower())
+
+    def on_stage_state(self, name: str, state: StageState):
+        """
+        Watchdog listener.
+        """
+        self.stage_states = {**self.stage_states, name: state}
+
+    def create_ui(self, match_length_sec: int):
+        self.match_length_sec = match_length_sec
+
+    def update(self, data: GUIData):
+        self.toggle_state = False
+        self.reset_state = False
+        self.add_score = None
+        self.goal_decision = None
+        self.state = data.state
+        self.data = data
+        if not self.autoplay:
+            return
+        if data.pending_goal is not None:
+            self.goal_decision = "confirm"
+        elif data.state == GameState.PAUSED:
+            self.toggle_state = True
+        elif data.state == GameState.STOPPED:
+            now = self.clock.now()
+            if self._stopped_since is None:
+                self._stopped_since = now
+            elif now - self._stopped_since >= self.between_matches:
+                self._stopped_since = None
+                self.matches_started += 1
+                logging.info("Starting match %d", self.matches_started)
+                self.toggle_state = True
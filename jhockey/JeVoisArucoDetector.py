@@ -1,11 +1,14 @@
 from threading import Thread, Lock
 from .types import AruCoTag, Point
+from .Metrics import metrics
+from .JeVoisFormat import OUTPUT_MODES, CONFIGURE_COMMANDS, SYNC, HEADER, RECORD, CHECKSUM, COMPACT_PREFIX, checksum
 import serial
 import logging
+import time
 
 
 class JeVoisArucoDetector:
-    def __init__(self, name="JeVois ArUco Detector", port="/dev/ttyACM0", baudrate=115200):
+    def __init__(self, name="JeVois ArUco Detector", port="/dev/ttyACM0", baudrate=115200, output_mode="normal", configure=True):
         """
         Parameters
         ----------
@@ -15,18 +18,43 @@ class JeVoisArucoDetector:
             The serial port to connect to, by default "/dev/ttyACM0".
         baudrate : int, optional
             The baudrate of the serial connection, by default 115200
+        output_mode : str, optional
+            The JeVois output format, "normal", "compact" or "binary" (see JeVoisFormat), by default "normal"
+        configure : bool, optional
+            Select the output mode on the JeVois when connecting, by default True.
+            If the JeVois rejects or does not answer the compact or binary mode, i.e. because the JHockey
+            module is not running, the detector falls back to normal output and logs an error.
+
+        The port is not opened here; connect() is called by a DeviceSupervisor,
+        so a missing camera cannot block startup.
         """
         self.port = port
         self.baudrate = baudrate
         self.name = name
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown JeVois output mode {output_mode!r}, expected one of {OUTPUT_MODES}")
+        self.output_mode = output_mode
+        self.configure = configure
+        self._read_frame = self.frame_reader(output_mode)
         self.tags: list[AruCoTag] = []
+        # tag objects are reused every other frame, so the consumer can still hold the previous frame
+        self._tag_pools: tuple[list[AruCoTag], list[AruCoTag]] = ([], [])
         self.stopped = False
         self.connected = False
         self.ser_port = None
-        self.try_connect()
         self.aruco_lock = Lock()
         self.new_data = False
+        self.frame_count = 0
+        self.frame_time = 0.0
         self.threading = False
+        # labelled per detector, every camera's detector updates its own collectors
+        self._stage = metrics.stage("detector", detector=name)
+        self._dropped = metrics.counter("dropped_frames", stage="detector", detector=name)
+        self._bytes_in = metrics.counter("serial_bytes", link="jevois", direction="in", device=name)
+        self._bytes_out = metrics.counter("serial_bytes", link="jevois", direction="out", device=name)
+
+    def frame_reader(self, output_mode: str):
+        return {"normal": self.read_normal, "compact": self.read_compact, "binary": self.read_binary}[output_mode]
 
     def start(self):
         """
@@ -46,74 +74,196 @@ class JeVoisArucoDetector:
             return []
         return self.tags
 
-    def detect(self, ser=None):
-        
-        def read_serial(ser):
-            try:
-                line = ""
-                while line != "MARK START":
-                    line = ser.readline().decode("utf-8").rstrip()
-            except serial.SerialException:
-                self.connected = False
-                logging.error("JeVois disconnected!")
-                self.stop()
-                return
-            tags = []
-            while line != "MARK STOP":
-                line = ser.readline().decode("utf-8").rstrip()
-                if line == "MARK STOP":
-                    with self.aruco_lock:
-                        self.tags = tags
-                    break
+    def readline(self, ser) -> bytes:
+        raw = ser.readline()
+        self._bytes_in.inc(len(raw))
+        return raw
+
+    def read(self, ser, n: int) -> bytes:
+        raw = ser.read(n)
+        self._bytes_in.inc(len(raw))
+        return raw
+
+    def pooled_tag(self, pool: list[AruCoTag], i: int, id: int, x: float, y: float, w: float, h: float) -> AruCoTag:
+        if i < len(pool):
+            tag = pool[i]
+            tag.id, tag.center.x, tag.center.y, tag.w, tag.h = id, x, y, w, h
+        else:
+            tag = AruCoTag(id, center=Point(x, y), w=w, h=h)
+            pool.append(tag)
+        return tag
+
+    def publish(self, tags: list[AruCoTag], t0: float):
+        with self.aruco_lock:
+            self.tags = tags
+        self.frame_time = t0
+        self.frame_count += 1
+        self._stage.end(t0)
+
+    def read_normal(self, ser):
+        """
+        Reads one frame of "N2" lines between MARK START and MARK STOP.
+        """
+        # parsed as bytes, int() takes them directly, so lines are never decoded
+        line = b""
+        while line != b"MARK START":
+            line = self.readline(ser).rstrip()
+        t0 = self._stage.begin()
+        tags = []
+        pool = self._tag_pools[self.frame_count % 2]
+        # checked once per frame, a disabled log call per line is a measurable share of the parse
+        log_lines = logging.root.isEnabledFor(logging.INFO)
+        while line != b"MARK STOP":
+            line = self.readline(ser).rstrip()
+            if line == b"MARK STOP":
+                self.publish(tags, t0)
+                break
+            if log_lines:
                 logging.info("Line received from Jevois: %s", line)
-                tok = line.split()
-                if len(tok) < 1:
-                    logging.warning("Invalid line from JeVois: %s", line)
-                    return
-                if tok[0] != "N2":
-                    logging.warning("JeVois may be in terse mode!")
-                    logging.warning("Invalid line from JeVois: %s", line)
-                    return
-                if len(tok) != 6:
-                    logging.warning("Invalid line from JeVois: %s", line)
-                    return
-                _, id, x, y, w, h = tok
+            tok = line.split()
+            if len(tok) < 1:
+                logging.warning("Invalid line from JeVois: %s", line)
+                self._dropped.inc()
+                return
+            if tok[0] != b"N2":
+                logging.warning("JeVois may be in terse mode!")
+                logging.warning("Invalid line from JeVois: %s", line)
+                self._dropped.inc()
+                return
+            if len(tok) != 6:
+                logging.warning("Invalid line from JeVois: %s", line)
+                self._dropped.inc()
+                return
+            _, id, x, y, w, h = tok
+            try:
                 x = int(x)
                 y = int(y)
                 w = int(w)
                 h = int(h)
                 id = int(id[1:])
-                # coordinates are returned in "standard" coordinates, where center is at (0, 0), right edge is at 1000 and bottom edge is at 750
-                if id in [tag.id for tag in self.tags]:
-                    # update existing tag
-                    tags = [tag for tag in self.tags if tag.id != id]
-                    tags.append(AruCoTag(id, center=Point(x, y), w=w, h=h))
-                else:
-                    # add new tag
-                    tags.append(AruCoTag(id, center=Point(x, y), w=w, h=h))
+            except ValueError:
+                logging.warning("Invalid line from JeVois: %s", line)
+                self._dropped.inc()
+                return
+            # coordinates are returned in "standard" coordinates, where center is at (0, 0), right edge is at 1000 and bottom edge is at 750
+            tags.append(self.pooled_tag(pool, len(tags), id, x, y, w, h))
+
+    def decode_payload(self, payload: bytes, t0: float):
+        """
+        Decodes the header, records and checksum of a compact or binary frame.
+        """
+        if len(payload) < HEADER.size + CHECKSUM.size:
+            self._dropped.inc()
+            return
+        _, count = HEADER.unpack_from(payload)
+        end = HEADER.size + count * RECORD.size
+        if len(payload) != end + CHECKSUM.size or checksum(payload[:end]) != payload[end]:
+            logging.warning("Invalid frame from JeVois, %d bytes", len(payload))
+            self._dropped.inc()
+            return
+        pool = self._tag_pools[self.frame_count % 2]
+        tags = [
+            self.pooled_tag(pool, i, id, x, y, w, h)
+            for i, (id, x, y, w, h) in enumerate(RECORD.iter_unpack(payload[HEADER.size : end]))
+        ]
+        self.publish(tags, t0)
 
+    def read_compact(self, ser):
+        """
+        Reads one "C<hex>" frame line; other lines (i.e. command replies) are skipped.
+        """
+        line = self.readline(ser)
+        if not line.startswith(COMPACT_PREFIX):
+            return
+        t0 = self._stage.begin()
+        try:
+            payload = bytes.fromhex(line[1:].decode("ascii"))
+        except (ValueError, UnicodeDecodeError):
+            logging.warning("Invalid line from JeVois: %s", line)
+            self._dropped.inc()
+            return
+        self.decode_payload(payload, t0)
+
+    def read_binary(self, ser):
+        """
+        Reads one binary frame, resynchronizing on the sync bytes.
+        """
+        skipped = ser.read_until(SYNC)
+        self._bytes_in.inc(len(skipped))
+        if not skipped.endswith(SYNC):
+            # read timed out
+            return
+        t0 = self._stage.begin()
+        header = self.read(ser, HEADER.size)
+        if len(header) < HEADER.size:
+            self._dropped.inc()
+            return
+        body = self.read(ser, header[1] * RECORD.size + CHECKSUM.size)
+        self.decode_payload(header + body, t0)
+
+    def detect(self, ser=None):
         if ser is None:
-            with self.ser_port as ser:
-                read_serial(ser)
-        else:
-            read_serial(ser)
-            
-    def run(self):
-        while True:
-            if self.stopped:
+            if not self.connected:
                 return
-            with self.ser_port as ser:
-                self.detect(ser)
+            # the port stays open between frames, reopening it would flush the next frame
+            ser = self.ser_port
+        try:
+            self._read_frame(ser)
+        except (serial.SerialException, OSError):
+            # the supervisor reopens the port, the detector thread keeps running
+            self.connected = False
+            logging.error("JeVois disconnected!")
 
-    def try_connect(self):
-        while self.connected == False:
-            try:
-                with serial.Serial(self.port, self.baudrate, timeout=1):
-                    self.connected = True
-                    logging.info("Connected to JeVois camera")
-                self.ser_port = serial.Serial(self.port, self.baudrate, timeout=1)
-            except:
-                logging.warning("Could not connect to JeVois camera. Retrying...")
+    def run(self):
+        while not self.stopped:
+            if not self.connected:
+                time.sleep(0.05)
+                continue
+            self.detect()
+
+    def connect(self):
+        """
+        Opens the serial port once, raising serial.SerialException on failure.
+        """
+        self.ser_port = serial.Serial(self.port, self.baudrate, timeout=1)
+        if self.configure:
+            for command in CONFIGURE_COMMANDS[self.output_mode]:
+                reply = self.send_command(command)
+                if reply.startswith("OK"):
+                    continue
+                if self.output_mode == "normal":
+                    logging.warning("JeVois answered %r with %r", command, reply)
+                    continue
+                # only the JHockey module knows jhockey_format, otherwise no frames would ever arrive
+                logging.error(
+                    "JeVois answered %r with %r, is the JHockey module running? Falling back to normal output",
+                    command,
+                    reply,
+                )
+                self.output_mode = "normal"
+                for normal_command in CONFIGURE_COMMANDS["normal"]:
+                    self.send_command(normal_command)
+                self._read_frame = self.frame_reader("normal")
+                break
+        self.connected = True
+
+    def send_command(self, command: str, timeout: float = 2.0) -> str:
+        """
+        Sends a serial command and returns the JeVois reply ("OK" or "ERR ..."), or "" if none came within timeout.
+        Frame lines arriving before the reply are skipped.
+        """
+        self._bytes_out.inc(self.ser_port.write(f"{command}\n".encode()))
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            line = self.readline(self.ser_port).strip()
+            if line.startswith(b"OK") or line.startswith(b"ERR"):
+                return line.decode("ascii", errors="replace")
+        return ""
+
+    def disconnect(self):
+        self.connected = False
+        if self.ser_port is not None:
+            self.ser_port.close()
 
     def stop(self):
         self.stopped = True
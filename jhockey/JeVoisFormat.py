@@ -0,0 +1,63 @@
+"""
+Wire formats of the JeVois ArUco output, shared by JeVoisArucoDetector and JeVoisSimulator.
+
+normal:  the JeVois "Normal" serial style, one "N2 U<id> <x> <y> <w> <h>" line per tag between
+         "MARK START" and "MARK STOP" lines, about 25 bytes per tag.
+compact: one line per frame, "C" followed by the hex digits of a binary frame without its sync bytes.
+         Still line based, so it passes through the JeVois text serial output, 16 bytes per tag.
+binary:  sync[2] seq[1] count[1] then count records of id[2] x[2] y[2] w[1] h[1], little endian,
+         and a checksum[1] (sum of seq, count and the records, mod 256), 8 bytes per tag.
+
+Compact and binary are sent by the JHockey JeVois module once the detector selects them with
+"setpar jhockey_format <mode>"; coordinates are JeVois standard coordinates, w and h are capped at 255.
+Other modules answer that command with "ERR Unknown parameter", and the detector falls back to normal.
+"""
+import struct
+
+OUTPUT_MODES = ("normal", "compact", "binary")
+SYNC = b"\xa5\x5a"
+HEADER = struct.Struct("<BB")  # frame sequence (mod 256), tag count
+RECORD = struct.Struct("<HhhBB")  # id, x, y, w, h
+CHECKSUM = struct.Struct("<B")
+COMPACT_PREFIX = b"C"
+MAX_TAGS = 255
+
+# serial commands selecting each mode, sent when the detector connects
+CONFIGURE_COMMANDS = {
+    "normal": ("setpar serstyle Normal", "setpar serprec 0"),
+    "compact": ("setpar serprec 0", "setpar jhockey_format compact"),
+    "binary": ("setpar serprec 0", "setpar jhockey_format binary"),
+}
+
+
+def checksum(data: bytes) -> int:
+    return sum(data) & 0xFF
+
+
+def encode_payload(seq: int, tags: list[tuple[int, int, int, int, int]]) -> bytes:
+    """
+    Packs the header, records and checksum of one frame, without the sync bytes.
+    @param seq: frame sequence number, taken mod 256
+    @param tags: (id, x, y, w, h) per tag, at most MAX_TAGS
+    """
+    body = bytearray(HEADER.size + RECORD.size * len(tags))
+    HEADER.pack_into(body, 0, seq % 256, len(tags))
+    for i, (tag_id, x, y, w, h) in enumerate(tags):
+        RECORD.pack_into(body, HEADER.size + i * RECORD.size, tag_id, x, y, min(w, 255), min(h, 255))
+    return bytes(body) + CHECKSUM.pack(checksum(body))
+
+
+def encode_frame(mode: str, seq: int, tags: list[tuple[int, int, int, int, int]]) -> bytes:
+    """
+    Encodes one frame of (id, x, y, w, h) tags in the given output mode.
+    """
+    if mode == "normal":
+        lines = [b"MARK START\n"]
+        lines.extend(f"N2 U{tag_id} {x} {y} {w} {h}\n".encode() for tag_id, x, y, w, h in tags)
+        lines.append(b"MARK STOP\n")
+        return b"".join(lines)
+    if mode == "compact":
+        return COMPACT_PREFIX + encode_payload(seq, tags).hex().upper().encode() + b"\n"
+    if mode == "binary":
+        return SYNC + encode_payload(seq, tags)
+    raise ValueError(f"Unknown JeVois output mode {mode!r}, expected one of {OUTPUT_MODES}")
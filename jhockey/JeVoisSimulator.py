@@ -0,0 +1,321 @@
+from __future__ import annotations
+from threading import Thread
+from typing import Callable, Optional
+import argparse
+import logging
+import random
+import time
+import math
+import select
+import pty
+import tty
+import os
+from .JeVoisFormat import OUTPUT_MODES, encode_frame
+
+
+# JeVois "standard" coordinates: center is at (0, 0), right edge is at 1000 and bottom edge is at 750
+STD_HALF_WIDTH = 1000
+STD_HALF_HEIGHT = 750
+
+
+def lissajous_trajectory(t: float, i: int) -> tuple[float, float]:
+    """
+    Default scripted trajectory: each robot follows its own Lissajous curve inside the field tags.
+    @param t: time in seconds
+    @param i: index of the simulated robot
+    @return: x, y in JeVois standard coordinates
+    """
+    ax = 0.75 * STD_HALF_WIDTH * (0.4 + 0.6 * ((i * 37) % 11) / 10)
+    ay = 0.75 * STD_HALF_HEIGHT * (0.4 + 0.6 * ((i * 53) % 13) / 12)
+    wx = 0.2 + 0.05 * (i % 7)
+    wy = 0.3 + 0.04 * (i % 5)
+    phase = i * 2 * math.pi / 17
+    return ax * math.sin(wx * t + phase), ay * math.sin(wy * t + 2 * phase)
+
+
+class SimulatedSerial:
+    """
+    Serial port stand-in that renders a simulator frame at the clock's current time whenever the
+    previous one has been read, so a detector can be stepped on virtual time without a pty or a thread.
+    """
+
+    def __init__(self, simulator: JeVoisSimulator, clock):
+        self.simulator = simulator
+        self.clock = clock
+        self.buffer = b""
+        # read position in buffer, so reading a line does not copy the rest of the frame
+        self.pos = 0
+
+    def fill(self):
+        if self.pos < len(self.buffer):
+            return
+        self.buffer = self.simulator.frame(self.clock.now())
+        self.pos = 0
+        self.simulator.frames_sent += 1
+        self.simulator.bytes_sent += len(self.buffer)
+
+    def take(self, end: int) -> bytes:
+        data = self.buffer[self.pos : end]
+        self.pos = end
+        return data
+
+    def readline(self) -> bytes:
+        self.fill()
+        end = self.buffer.find(b"\n", self.pos)
+        return self.take(len(self.buffer) if end < 0 else end + 1)
+
+    def read(self, n: int = 1) -> bytes:
+        self.fill()
+        return self.take(min(self.pos + n, len(self.buffer)))
+
+    def read_until(self, expected: bytes) -> bytes:
+        self.fill()
+        end = self.buffer.find(expected, self.pos)
+        return self.take(len(self.buffer) if end < 0 else end + len(expected))
+
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+
+class JeVoisSimulator:
+    """
+    Emulates the serial output of a JeVois running the ArUco module on a pseudo-terminal.
+    Point a JeVoisArucoDetector at the simulator's port to exercise the pipeline without hardware.
+    """
+
+    def __init__(
+        self,
+        n_robots: int = 4,
+        fps: float = 30.0,
+        baudrate: int = 115200,
+        noise: float = 0.0,
+        corruption: float = 0.0,
+        field_tags: tuple[int, ...] = (0, 1, 2, 3),
+        first_robot_id: int = 4,
+        trajectory: Callable[[float, int], tuple[float, float]] = lissajous_trajectory,
+        tag_size: int = 40,
+        seed: Optional[int] = None,
+        output_mode: str = "normal",
+        jhockey_module: bool = True,
+        name="JeVois Simulator",
+    ):
+        """
+        Parameters
+        ----------
+        n_robots : int, optional
+            The number of simulated robots, by default 4
+        fps : float, optional
+            The frame rate to emit, by default 30.0
+        baudrate : int, optional
+            The emulated link speed; output is paced to 10 bits per byte (8N1), by default 115200.
+            Use 0 to disable pacing.
+        noise : float, optional
+            Standard deviation of Gaussian jitter added to tag positions in standard coordinates, by default 0.0
+        corruption : float, optional
+            Probability that any given line is corrupted (bit flip, truncation or garbage), by default 0.0
+        field_tags : tuple[int, ...], optional
+            The IDs of the field corner tags, by default (0, 1, 2, 3)
+        first_robot_id : int, optional
+            The tag ID of the first robot; robots use consecutive IDs, by default 4
+        trajectory : Callable[[float, int], tuple[float, float]], optional
+            Maps (time, robot index) to a position in standard coordinates, by default lissajous_trajectory
+        tag_size : int, optional
+            The tag width and height in standard coordinates, by default 40
+        seed : int, optional
+            Seed for the noise and corruption generator, by default None
+        output_mode : str, optional
+            The output format, "normal", "compact" or "binary" (see JeVoisFormat), by default "normal".
+            Like the JeVois module, the simulator switches format on "setpar jhockey_format <mode>".
+        jhockey_module : bool, optional
+            Emulate the JHockey JeVois module, by default True. When False the simulator behaves like a
+            stock ArUco module and answers "setpar jhockey_format" with an error.
+        name : str, optional
+            The name of the thread, by default "JeVois Simulator"
+        """
+        self.n_robots = n_robots
+        self.fps = fps
+        self.baudrate = baudrate
+        self.noise = noise
+        self.corruption = corruption
+        self.field_tags = field_tags
+        self.first_robot_id = first_robot_id
+        self.trajectory = trajectory
+        self.tag_size = tag_size
+        self.rng = random.Random(seed)
+        self.name = name
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown JeVois output mode {output_mode!r}, expected one of {OUTPUT_MODES}")
+        self.output_mode = output_mode
+        self.jhockey_module = jhockey_module
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.stopped = False
+        # a paused camera stays connected but sends nothing, i.e. a hung JeVois
+        self.paused = False
+        self.master_fd, self.slave_fd = pty.openpty()
+        # raw mode, so the line discipline does not echo or translate line endings
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self._commands = b""
+
+    def start(self) -> JeVoisSimulator:
+        """
+        Starts emitting frames on the pseudo-terminal.
+        """
+        t = Thread(target=self.run, name=self.name)
+        t.daemon = True
+        t.start()
+        return self
+
+    def serial(self, clock) -> SimulatedSerial:
+        """
+        Returns a serial port stand-in rendering frames at the clock's time, for stepped runs on a VirtualClock.
+        """
+        return SimulatedSerial(self, clock)
+
+    def field_tag_positions(self) -> list[tuple[int, float, float]]:
+        """
+        Field tags sit at the corners of the field, in the same order as config.json.
+        """
+        x = 0.85 * STD_HALF_WIDTH
+        y = 0.85 * STD_HALF_HEIGHT
+        corners = [(-x, -y), (x, -y), (-x, y), (x, y)]
+        return [(tag_id, *corners[i % 4]) for i, tag_id in enumerate(self.field_tags)]
+
+    def corrupt(self, line: bytes) -> bytes:
+        kind = self.rng.randrange(3)
+        if kind == 0 and len(line) > 1:
+            # flip a bit of one character
+            i = self.rng.randrange(len(line) - 1)
+            return line[:i] + bytes([line[i] ^ (1 << self.rng.randrange(8))]) + line[i + 1 :]
+        if kind == 1:
+            # truncated line
+            return line[: self.rng.randrange(len(line))] + b"\n"
+        return bytes(self.rng.randrange(256) for _ in range(self.rng.randrange(1, 16))) + b"\n"
+
+    def frame(self, t: float) -> bytes:
+        """
+        Renders one frame at time t in the current output mode.
+        """
+        tags = self.field_tag_positions()
+        for i in range(self.n_robots):
+            x, y = self.trajectory(t, i)
+            tags.append((self.first_robot_id + i, x, y))
+        records = []
+        lines = [b"MARK START\n"]
+        normal = self.output_mode == "normal"
+        noise, gauss, size = self.noise, self.rng.gauss, self.tag_size
+        for tag_id, x, y in tags:
+            if noise > 0:
+                x += gauss(0, noise)
+                y += gauss(0, noise)
+            x = round(x)
+            y = round(y)
+            x = -STD_HALF_WIDTH if x < -STD_HALF_WIDTH else STD_HALF_WIDTH if x > STD_HALF_WIDTH else x
+            y = -STD_HALF_HEIGHT if y < -STD_HALF_HEIGHT else STD_HALF_HEIGHT if y > STD_HALF_HEIGHT else y
+            if not normal:
+                records.append((tag_id, x, y, size, size))
+                continue
+            line = b"N2 U%d %d %d %d %d\n" % (tag_id, x, y, size, size)
+            if self.corruption > 0 and self.rng.random() < self.corruption:
+                line = self.corrupt(line)
+            lines.append(line)
+        if self.output_mode != "normal":
+            data = encode_frame(self.output_mode, self.frames_sent, records)
+            if self.corruption > 0 and self.rng.random() < self.corruption:
+                data = self.corrupt(data)
+            return data
+        lines.append(b"MARK STOP\n")
+        return b"".join(lines)
+
+    def handle_commands(self):
+        """
+        Answers the serial commands the detector sends when it connects.
+        """
+        # polled between frames, so it never blocks the frame output
+        if not select.select([self.master_fd], [], [], 0)[0]:
+            return
+        self._commands += os.read(self.master_fd, 1024)
+        *commands, self._commands = self._commands.split(b"\n")
+        for command in commands:
+            tok = command.decode("ascii", errors="replace").split()
+            if len(tok) == 3 and tok[:2] == ["setpar", "jhockey_format"]:
+                if not self.jhockey_module or tok[2] not in OUTPUT_MODES:
+                    self.write(b"ERR Unknown parameter [jhockey_format]\n")
+                    continue
+                self.output_mode = tok[2]
+            elif len(tok) == 0:
+                continue
+            self.write(b"OK\n")
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while len(view) > 0:
+            n = os.write(self.master_fd, view)
+            view = view[n:]
+
+    def run(self):
+        start = time.perf_counter()
+        next_frame = start
+        while not self.stopped:
+            if self.paused:
+                time.sleep(1 / self.fps)
+                next_frame = time.perf_counter()
+                continue
+            try:
+                self.handle_commands()
+                data = self.frame(time.perf_counter() - start)
+                self.write(data)
+            except OSError:
+                if not self.stopped:
+                    logging.error("JeVois simulator pty closed")
+                return
+            self.frames_sent += 1
+            self.bytes_sent += len(data)
+            # the frame cannot be faster than the serial link can carry it
+            airtime = len(data) * 10 / self.baudrate if self.baudrate > 0 else 0
+            next_frame += max(1 / self.fps, airtime)
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.perf_counter()
+
+    def stop(self):
+        self.stopped = True
+        for fd in (self.master_fd, self.slave_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate a JeVois ArUco camera on a pseudo-terminal.")
+    parser.add_argument("--robots", type=int, default=4, help="Number of simulated robots. Defaults to 4.")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frame rate. Defaults to 30.")
+    parser.add_argument("--baudrate", type=int, default=115200, help="Emulated baud rate, 0 to disable pacing. Defaults to 115200.")
+    parser.add_argument("--noise", type=float, default=0.0, help="Position jitter in JeVois standard coordinates. Defaults to 0.")
+    parser.add_argument("--corruption", type=float, default=0.0, help="Probability of corrupting each line. Defaults to 0.")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+    parser.add_argument("--output-mode", type=str, default="normal", choices=OUTPUT_MODES, help="Output format. Defaults to normal.")
+    parser.add_argument("--stock-module", action="store_true", help="Behave like the stock ArUco module, which rejects compact and binary output.")
+    args = parser.parse_args()
+
+    sim = JeVoisSimulator(
+        n_robots=args.robots,
+        fps=args.fps,
+        baudrate=args.baudrate,
+        noise=args.noise,
+        corruption=args.corruption,
+        seed=args.seed,
+        output_mode=args.output_mode,
+        jhockey_module=not args.stock_module,
+    ).start()
+    print(f"Simulating JeVois on {sim.port} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{sim.frames_sent} frames, {sim.bytes_sent} bytes sent")
+    except KeyboardInterrupt:
+        sim.stop()
@@ -0,0 +1,274 @@
+from __future__ import annotations
+from bisect import bisect_left
+from threading import Lock
+import threading
+import time
+import os
+import logging
+
+
+# Latency buckets in seconds, from sub-millisecond serial parsing up to a full second stall.
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Counter:
+    """
+    Monotonically increasing counter.
+    Each counter is expected to be written by a single thread, so no lock is taken on the hot path.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int | float = 1):
+        self.value += n
+
+
+class Gauge:
+    """
+    Gauge holding the last value set.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class RateMeter:
+    """
+    Exponentially weighted loop rate meter.
+    Call tick() once per loop iteration; the rate is derived from the smoothed period between ticks.
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.period = 0.0
+        self.count = 0
+        self._last = None
+
+    def tick(self, now: float = None):
+        if now is None:
+            now = time.perf_counter()
+        if self._last is not None:
+            dt = now - self._last
+            if self.period == 0.0:
+                self.period = dt
+            else:
+                self.period += self.alpha * (dt - self.period)
+        self._last = now
+        self.count += 1
+
+    @property
+    def rate(self) -> float:
+        if self.period <= 0.0:
+            return 0.0
+        return 1.0 / self.period
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class StageMetrics:
+    """
+    Loop rate and latency for one pipeline stage.
+
+    Usage:
+        t0 = stage.begin()
+        ...  # do the work
+        stage.end(t0)
+    """
+
+    def __init__(self):
+        self.rate = RateMeter()
+        self.latency = Histogram()
+
+    def begin(self) -> float:
+        return time.perf_counter()
+
+    def end(self, t0: float):
+        now = time.perf_counter()
+        self.rate.tick(now)
+        self.latency.observe(now - t0)
+
+
+def thread_cpu_seconds() -> dict[str, float]:
+    """
+    Returns the CPU time (user + system) consumed by each live thread, keyed by thread name.
+    Reads /proc on Linux; returns an empty dict on other platforms.
+    """
+    cpu = {}
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+    except (AttributeError, ValueError, OSError):
+        return cpu
+    for thread in threading.enumerate():
+        try:
+            with open(f"/proc/self/task/{thread.native_id}/stat", "r") as f:
+                stat = f.read()
+        except (OSError, TypeError):
+            continue
+        # the thread name field may contain spaces, so split after the closing parenthesis
+        fields = stat[stat.rfind(")") + 2 :].split()
+        utime, stime = int(fields[11]), int(fields[12])
+        # threads sharing a name (e.g. worker pools) are summed together
+        cpu[thread.name] = cpu.get(thread.name, 0.0) + (utime + stime) / ticks
+    return cpu
+
+
+class MetricsRegistry:
+    """
+    Registry of pipeline metrics, rendered in the Prometheus text exposition format.
+    Collectors are created once (under a lock) and then updated lock-free by the owning thread.
+    """
+
+    def __init__(self, prefix: str = "jhockey"):
+        self.prefix = prefix
+        self._lock = Lock()
+        self._counters: dict[tuple[str, tuple], Counter] = {}
+        self._gauges: dict[tuple[str, tuple], Gauge] = {}
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._stages: dict[tuple[str, tuple], StageMetrics] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, str] | None) -> tuple[str, tuple]:
+        return name, tuple(sorted((labels or {}).items()))
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._counters:
+                self._counters[key] = Counter()
+            return self._counters[key]
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._gauges:
+                self._gauges[key] = Gauge()
+            return self._gauges[key]
+
+    def histogram(self, name: str, buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, **labels) -> Histogram:
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+            return self._histograms[key]
+
+    def stage(self, name: str, **labels) -> StageMetrics:
+        """
+        Returns the stage's collectors; stages run by several threads at once, i.e. one detector per camera,
+        need a label each, since the collectors are updated lock-free.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._stages:
+                self._stages[key] = StageMetrics()
+            return self._stages[key]
+
+    def stages(self) -> dict[str, StageMetrics]:
+        """
+        Returns the registered stages by name, followed by their labels if they have any.
+        """
+        with self._lock:
+            stages = list(self._stages.items())
+        return {f"{name}{self._format_labels(labels)}": stage for (name, labels), stage in stages}
+
+    def _format_labels(self, labels: tuple) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def _render_histogram(self, name: str, labels: tuple, hist: Histogram) -> list[str]:
+        label = ",".join(f'{k}="{v}"' for k, v in labels)
+        sep = "," if label else ""
+        lines = []
+        # copy before summing so a concurrent observe() cannot make the buckets inconsistent
+        counts = list(hist.counts)
+        cumulative = 0
+        for bound, count in zip(hist.bounds, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label}{sep}le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{label}{sep}le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{self._format_labels(labels)} {hist.sum}")
+        lines.append(f"{name}_count{self._format_labels(labels)} {cumulative}")
+        return lines
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        p = self.prefix
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = list(self._histograms.items())
+            stages = list(self._stages.items())
+        lines = []
+        for (name, labels), counter in sorted(counters, key=lambda kv: kv[0]):
+            lines.append(f"{p}_{name}_total{self._format_labels(labels)} {counter.value}")
+        for (name, labels), gauge in sorted(gauges, key=lambda kv: kv[0]):
+            lines.append(f"{p}_{name}{self._format_labels(labels)} {gauge.value}")
+        for (name, labels), hist in sorted(histograms, key=lambda kv: kv[0]):
+            lines.extend(self._render_histogram(f"{p}_{name}", labels, hist))
+        for (name, labels), stage in sorted(stages, key=lambda kv: kv[0]):
+            labels = (("stage", name),) + labels
+            lines.append(f"{p}_stage_rate_hz{self._format_labels(labels)} {stage.rate.rate:.3f}")
+            lines.append(f"{p}_stage_iterations_total{self._format_labels(labels)} {stage.rate.count}")
+            lines.extend(self._render_histogram(f"{p}_stage_latency_seconds", labels, stage.latency))
+        for thread_name, seconds in sorted(thread_cpu_seconds().items()):
+            lines.append(f'{p}_thread_cpu_seconds_total{{thread="{thread_name}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by all pipeline components.
+metrics = MetricsRegistry()
+
+
+def add_metrics_route(app, registry: MetricsRegistry = metrics, path: str = "/metrics"):
+    """
+    Serves the registry from an existing FastAPI (or NiceGUI) app.
+    Parameters
+    ----------
+    app : fastapi.FastAPI
+        The app to add the route to, i.e. nicegui.app
+    registry : MetricsRegistry, optional
+        The registry to render, by default the process-wide registry.
+    path : str, optional
+        The route path, by default "/metrics"
+    """
+    from fastapi.responses import PlainTextResponse
+
+    @app.get(path, response_class=PlainTextResponse)
+    def _metrics() -> str:
+        return registry.render()
+
+    logging.info("Serving metrics at %s", path)
@@ -0,0 +1,278 @@
+from __future__ import annotations
+from threading import Thread, Event, Lock
+from typing import Protocol
+import time
+import numpy as np
+from .types import AruCoTag, Point
+from .Metrics import metrics
+from .TagRegistry import TagRegistry
+
+
+class ArucoDetector(Protocol):
+    def get(self) -> list[AruCoTag]:
+        ...
+
+    def detect(self) -> None:
+        ...
+
+    @property
+    def connected(self) -> bool:
+        ...
+
+    @property
+    def threading(self) -> bool:
+        ...
+
+    @property
+    def frame_count(self) -> int:
+        """
+        Returns the number of frames detected so far.
+        """
+        ...
+
+    @property
+    def frame_time(self) -> float:
+        """
+        Returns the time.perf_counter() timestamp of the latest frame.
+        """
+        ...
+
+
+class FieldHomography(Protocol):
+    def find_homography(self, field_tags: list[AruCoTag]) -> None:
+        ...
+
+    def convert_points(self, points: np.ndarray) -> np.ndarray:
+        ...
+
+    @property
+    def H(self) -> np.ndarray:
+        ...
+
+
+class Observation:
+    """
+    The two latest field positions of one tag seen by one camera, used to align it in time.
+    """
+
+    __slots__ = ("t", "x", "y", "w", "h", "vx", "vy")
+
+    def __init__(self, t: float, x: float, y: float, w: float, h: float):
+        self.t = t
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.vx = 0.0
+        self.vy = 0.0
+
+    def update(self, t: float, x: float, y: float, w: float, h: float, max_gap: float):
+        dt = t - self.t
+        if 0 < dt <= max_gap:
+            self.vx = (x - self.x) / dt
+            self.vy = (y - self.y) / dt
+        else:
+            self.vx = self.vy = 0.0
+        self.t, self.x, self.y, self.w, self.h = t, x, y, w, h
+
+    def at(self, t: float) -> tuple[float, float]:
+        """
+        Returns the position extrapolated to time t.
+        """
+        dt = t - self.t
+        return self.x + self.vx * dt, self.y + self.vy * dt
+
+
+class CameraSource:
+    """
+    One camera of a multi-camera setup: its detector, its own field homography solved from the
+    field tags it can see, and a worker thread that maps its robot detections to field coordinates.
+    """
+
+    def __init__(self, detector: ArucoDetector, field_homography: FieldHomography, tag_registry: TagRegistry, max_age: float, name: str):
+        self.detector = detector
+        self.field_homography = field_homography
+        self.tag_registry = tag_registry
+        self.max_age = max_age
+        self.name = name
+        self.stopped = False
+        self.observations: dict[int, Observation] = {}
+        self.lock = Lock()
+        self.new_frame = None
+        self._frames = metrics.counter("fusion_frames", camera=name)
+        self._latency = metrics.histogram("fusion_frame_age_seconds", camera=name)
+
+    def start(self, new_frame: Event) -> CameraSource:
+        self.new_frame = new_frame
+        t = Thread(target=self.run, name=f"Camera Worker {self.name}")
+        t.daemon = True
+        t.start()
+        return self
+
+    def run(self):
+        last_frame = None
+        while not self.stopped:
+            if not self.detector.connected:
+                time.sleep(0.05)
+                continue
+            if not self.detector.threading:
+                self.detector.detect()
+            frame = getattr(self.detector, "frame_count", None)
+            if frame is not None and frame == last_frame:
+                # the detector thread has not finished a new frame yet
+                time.sleep(0.002)
+                continue
+            last_frame = frame
+            self.process(self.detector.get(), getattr(self.detector, "frame_time", time.perf_counter()))
+
+    def process(self, tags: list[AruCoTag], t: float):
+        """
+        Solves this camera's homography and records the field position of every robot tag.
+        """
+        frame = self.tag_registry.partition(tags)
+        self.field_homography.find_homography(frame.field)
+        if self.field_homography.H is None:
+            return
+        robots = frame.robots
+        if len(robots) > 0:
+            centers = self.field_homography.convert_points(
+                np.array([[tag.center.x, tag.center.y] for tag in robots], dtype=np.float32)
+            )
+            with self.lock:
+                for tag, (x, y) in zip(robots, centers):
+                    observation = self.observations.get(tag.id)
+                    if observation is None:
+                        self.observations[tag.id] = Observation(t, float(x), float(y), tag.w, tag.h)
+                    else:
+                        observation.update(t, float(x), float(y), tag.w, tag.h, self.max_age)
+        self._frames.inc()
+        self._latency.observe(time.perf_counter() - t)
+        self.new_frame.set()
+
+    def aligned(self, t: float) -> dict[int, tuple[float, float, float, float, float]]:
+        """
+        Returns {tag id: (x, y, w, h, age)} for the tags seen within max_age, extrapolated to time t.
+        """
+        aligned = {}
+        with self.lock:
+            for tag_id, observation in self.observations.items():
+                age = t - observation.t
+                if age > self.max_age:
+                    continue
+                x, y = observation.at(t)
+                aligned[tag_id] = (x, y, observation.w, observation.h, age)
+        return aligned
+
+    def stop(self):
+        self.stopped = True
+
+
+class MultiCameraFusion:
+    """
+    Merges the detections of two or more cameras (ThreadedCamera or JeVois) into one set of field positions.
+    Each camera runs its own detector worker and field homography. Detections are aligned to a common
+    timestamp by extrapolating each tag from its last two observations, and tags seen by several cameras
+    in the overlap are de-duplicated into one position, weighted towards the freshest observation.
+
+    Stands in for both the ArUco detector and the field homography of the GameManager: get() returns tags
+    whose centers are already in field coordinates, so the homography it exposes is the identity.
+    """
+
+    def __init__(self, aruco_config: str = "config.json", max_age: float = 0.2, tag_registry: TagRegistry = None):
+        """
+        Parameters
+        ----------
+        aruco_config : str, optional
+            The configuration file listing the field tags, by default "config.json"
+        max_age : float, optional
+            Observations older than this many seconds are dropped instead of extrapolated, by default 0.2
+        tag_registry : TagRegistry, optional
+            The shared tag roles, by default None (loaded from aruco_config). Only robot tags are fused.
+        """
+        self.tag_registry = tag_registry if tag_registry is not None else TagRegistry(aruco_config)
+        self.max_age = max_age
+        self.sources: list[CameraSource] = []
+        self.threading = False
+        self.tags: list[AruCoTag] = []
+        self._new_frame = Event()
+        self._identity = np.eye(3)
+        self._stage = metrics.stage("fusion")
+        self._duplicates = metrics.counter("fusion_duplicates")
+        self._alignment = metrics.histogram("fusion_alignment_seconds")
+
+    def add(self, detector: ArucoDetector, field_homography: FieldHomography, name: str = None) -> MultiCameraFusion:
+        """
+        Adds a camera with its own field homography.
+        """
+        name = name or str(len(self.sources))
+        self.sources.append(CameraSource(detector, field_homography, self.tag_registry, self.max_age, name))
+        return self
+
+    def start(self) -> MultiCameraFusion:
+        """
+        Starts one worker thread per camera.
+        """
+        for source in self.sources:
+            source.start(self._new_frame)
+        return self
+
+    @property
+    def connected(self) -> bool:
+        return any(source.detector.connected for source in self.sources)
+
+    @property
+    def H(self) -> np.ndarray | None:
+        if any(source.field_homography.H is not None for source in self.sources):
+            return self._identity
+        return None
+
+    def find_homography(self, field_tags: list[AruCoTag]) -> None:
+        # every camera solves its own homography in its worker
+        pass
+
+    def convert_points(self, points: np.ndarray) -> np.ndarray:
+        return points
+
+    def convert_px2world(self, x: float, y: float) -> np.ndarray:
+        return np.array([x, y])
+
+    def detect(self) -> None:
+        """
+        Waits for any camera to deliver a new frame, then fuses the latest detections.
+        """
+        if self._new_frame.wait(timeout=0.1):
+            self._new_frame.clear()
+        self.tags = self.fuse(time.perf_counter())
+
+    def fuse(self, t: float) -> list[AruCoTag]:
+        """
+        Returns one tag per robot in field coordinates, aligned to time t.
+        """
+        t0 = self._stage.begin()
+        merged: dict[int, list[tuple[float, float, float, float, float]]] = {}
+        for source in self.sources:
+            for tag_id, aligned in source.aligned(t).items():
+                merged.setdefault(tag_id, []).append(aligned)
+        tags = []
+        for tag_id, seen in merged.items():
+            if len(seen) == 1:
+                x, y, w, h, age = seen[0]
+            else:
+                self._duplicates.inc(len(seen) - 1)
+                weights = [1 / (age + 1e-3) for *_, age in seen]
+                total = sum(weights)
+                x = sum(weight * s[0] for weight, s in zip(weights, seen)) / total
+                y = sum(weight * s[1] for weight, s in zip(weights, seen)) / total
+                w, h = seen[weights.index(max(weights))][2:4]
+                age = min(s[4] for s in seen)
+            self._alignment.observe(age)
+            tags.append(AruCoTag(tag_id, center=Point(x, y), w=w, h=h))
+        self._stage.end(t0)
+        return tags
+
+    def get(self) -> list[AruCoTag]:
+        return self.tags
+
+    def stop(self):
+        for source in self.sources:
+            source.stop()
@@ -1,15 +1,24 @@
-from datetime import datetime
+from datetime import timedelta
+from .Clock import WallClock
 
 
 class PausableTimer:
-    def __init__(self):
-        self.timestarted: datetime = None
-        self.timepaused: datetime = None
+    def __init__(self, clock=None):
+        """
+        Parameters
+        ----------
+        clock : WallClock | VirtualClock, optional
+            The clock the timer reads, by default None (the wall clock)
+        """
+        self.clock = clock if clock is not None else WallClock()
+        # times are clock seconds as floats, so reading the timer in the game loop does not allocate
+        self.timestarted: float = None
+        self.timepaused: float = None
         self.paused = False
 
     def start(self):
         """Starts an internal timer by recording the current time"""
-        self.timestarted = datetime.now()
+        self.timestarted = self.clock.now()
 
     def pause(self):
         """Pauses the timer"""
@@ -17,7 +26,7 @@ class PausableTimer:
             raise ValueError("Timer not started")
         if self.paused:
             raise ValueError("Timer is already paused")
-        self.timepaused = datetime.now()
+        self.timepaused = self.clock.now()
         self.paused = True
 
     def resume(self):
@@ -26,19 +35,23 @@ class PausableTimer:
             raise ValueError("Timer not started")
         if not self.paused:
             raise ValueError("Timer is not paused")
-        pausetime = datetime.now() - self.timepaused
+        pausetime = self.clock.now() - self.timepaused
         self.timestarted = self.timestarted + pausetime
         self.paused = False
 
-    def get(self) -> datetime:
-        """Returns a timedelta object showing the amount of time
-        elapsed since the start time, less any pauses"""
+    def seconds(self) -> float:
+        """Returns the seconds elapsed since the start time, less any pauses"""
         if self.timestarted is None:
             raise ValueError("Timer not started")
         if self.paused:
             return self.timepaused - self.timestarted
         else:
-            return datetime.now() - self.timestarted
+            return self.clock.now() - self.timestarted
+
+    def get(self) -> timedelta:
+        """Returns a timedelta object showing the amount of time
+        elapsed since the start time, less any pauses"""
+        return timedelta(seconds=self.seconds())
 
     def reset(self):
         """Resets the timer"""
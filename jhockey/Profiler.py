@@ -0,0 +1,155 @@
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime
+from threading import Thread, Lock
+import threading
+import logging
+import time
+import sys
+import os
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler covering every thread in the process.
+    A background thread periodically snapshots the stacks of all other threads with sys._current_frames(),
+    so the profiled threads are never instrumented and overhead scales with the sampling rate only.
+    """
+
+    def __init__(self, interval: float = 0.01, output_dir: str = "profiles", name="Profiler"):
+        """
+        Parameters
+        ----------
+        interval : float, optional
+            The sampling period in seconds, by default 0.01 (100 Hz)
+        output_dir : str, optional
+            The directory captures are written to, by default "profiles"
+        name : str, optional
+            The name of the sampling thread, by default "Profiler"
+        """
+        self.interval = interval
+        self.output_dir = output_dir
+        self.name = name
+        self.last_capture: str | None = None
+        self._labels: dict = {}
+        self._lock = Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def capture(self, duration: float) -> bool:
+        """
+        Starts a capture in the background.
+        @param duration: capture window in seconds
+        @return: False if a capture is already in progress
+        """
+        with self._lock:
+            if self._running:
+                logging.warning("Profiler capture already in progress")
+                return False
+            self._running = True
+        t = Thread(target=self.run, name=self.name, args=(duration,))
+        t.daemon = True
+        t.start()
+        return True
+
+    def _label(self, code) -> str:
+        try:
+            return self._labels[code]
+        except KeyError:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+            return label
+
+    def sample(self, stacks: dict[str, Counter], own_ident: int):
+        """
+        Records one stack sample for every thread except the sampler itself.
+        """
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            name = names.get(ident, str(ident))
+            stacks.setdefault(name, Counter())[tuple(stack)] += 1
+
+    def run(self, duration: float):
+        try:
+            stacks: dict[str, Counter] = {}
+            own_ident = threading.get_ident()
+            n_samples = 0
+            start = time.perf_counter()
+            next_sample = start
+            while time.perf_counter() - start < duration:
+                self.sample(stacks, own_ident)
+                n_samples += 1
+                next_sample += self.interval
+                delay = next_sample - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            elapsed = time.perf_counter() - start
+            self.last_capture = self.write(stacks, n_samples, elapsed)
+            logging.info("Profile written to %s", self.last_capture)
+        finally:
+            self._running = False
+
+    def write(self, stacks: dict[str, Counter], n_samples: int, elapsed: float) -> str:
+        """
+        Writes a flamegraph-compatible folded stack dump and a per-thread summary.
+        Captures are named to the second, so one finishing in the same second as the last gets a counter suffix.
+        @return: the capture directory
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        capture_name = datetime.now().strftime("%Y%m%d-%H%M%S")
+        capture_dir = os.path.join(self.output_dir, capture_name)
+        suffix = 1
+        while True:
+            try:
+                os.mkdir(capture_dir)
+                break
+            except FileExistsError:
+                suffix += 1
+                capture_dir = os.path.join(self.output_dir, f"{capture_name}-{suffix}")
+        # Brendan Gregg's folded format, usable with flamegraph.pl or speedscope
+        with open(os.path.join(capture_dir, "stacks.folded"), "w") as f:
+            for thread_name, counter in sorted(stacks.items()):
+                root = thread_name.replace(";", ":").replace(" ", "_")
+                for stack, count in counter.items():
+                    f.write(";".join((root,) + stack) + f" {count}\n")
+        for thread_name, counter in sorted(stacks.items()):
+            file_name = "".join(c if c.isalnum() else "_" for c in thread_name) + ".txt"
+            with open(os.path.join(capture_dir, file_name), "w") as f:
+                f.write(self.summarize(thread_name, counter, n_samples, elapsed))
+        return capture_dir
+
+    @staticmethod
+    def summarize(thread_name: str, counter: Counter, n_samples: int, elapsed: float, top: int = 25) -> str:
+        """
+        Returns the self and cumulative sample share of the hottest functions of one thread.
+        """
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in counter.items():
+            if len(stack) == 0:
+                continue
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        lines = [
+            f"Thread: {thread_name}",
+            f"Samples: {sum(counter.values())} of {n_samples} over {elapsed:.2f} s",
+            "",
+            f"{'self %':>8} {'total %':>8}  function",
+        ]
+        for label, count in total_counts.most_common(top):
+            lines.append(
+                f"{100 * self_counts[label] / max(n_samples, 1):8.1f} "
+                f"{100 * count / max(n_samples, 1):8.1f}  {label}"
+            )
+        return "\n".join(lines) + "\n"
@@ -1,8 +1,10 @@
 import cv2 as cv
 import numpy as np
 from .types import PuckState
+from .Metrics import metrics
 from typing import Protocol
 from threading import Thread
+import time
 
 
 class FieldHomography(Protocol):
@@ -22,10 +24,18 @@ class FieldHomography(Protocol):
         ...
 
 
+class FieldMask(Protocol):
+    def apply(self, frame: np.ndarray) -> tuple[np.ndarray, int, int]:
+        """
+        Returns the frame cropped and masked to the field, and the x, y offset of the crop.
+        """
+        ...
+
+
 class Camera(Protocol):
-    def read(self) -> np.ndarray:
+    def read_frame(self) -> tuple[np.ndarray, float, int]:
         """
-        Returns the frame from the camera.
+        Returns the latest frame from the camera with its capture timestamp and frame count.
         """
         ...
 
@@ -35,43 +45,65 @@ class PuckTracker:
     PuckTracker class that uses OpenCV's KCF tracker to track the puck
     """
 
-    def __init__(self, field_homography: FieldHomography):
+    def __init__(self, field_homography: FieldHomography, field_mask: FieldMask = None):
         """
         Parameters
         ----------
         field_homography : FieldHomography
             The field homography object.
+        field_mask : FieldMask, optional
+            Restricts the search for the puck to the field, by default None (full frames)
         """
         self.tracker = cv.TrackerKCF_create()
         self.bbox = None
         self.tracker_initialized = False
+        self.lost = False
+        self.frames_tracked = 0
+        self.camera = None
         self.field_homography = field_homography
+        self.field_mask = field_mask
         self.stopped = False
+        self.frame_time = 0.0
+        self._stage = metrics.stage("puck_tracker")
 
     def start(self, cam: Camera):
+        self.camera = cam
         t = Thread(target=self.run, name="Puck Tracker", args=(cam,))
         t.daemon = True
         t.start()
         return self
 
     def run(self, cam: Camera):
+        last_frame_count = None
         while True:
             if self.stopped:
                 return
-            frame = cam.read()
-            if frame is None:
+            frame, frame_time, frame_count = cam.read_frame()
+            if frame is None or frame_count == last_frame_count:
+                # tracking the same frame again would only repeat its position
+                time.sleep(0.001)
                 continue
+            last_frame_count = frame_count
+            t0 = self._stage.begin()
             if self.tracker_initialized:
                 self.update_tracker(frame)
             else:
                 self.initialize_tracker(frame)
+            # stamped with the capture time, so the goal detector sees each frame once at the time it was taken
+            self.frame_time = frame_time
+            self._stage.end(t0)
 
     def initialize_tracker(self, frame: np.ndarray):
         """
         Find the puck in the frame and initialize the tracker.
         @param frame: initial frame to find the puck in
         """
-        hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
+        x0 = y0 = 0
+        search = frame
+        if self.field_mask is not None:
+            # orange clothing and signs off the field are not candidates
+            search, x0, y0 = self.field_mask.apply(frame)
+        hsv = cv.cvtColor(search, cv.COLOR_BGR2HSV)
         lower_orange = np.array([0, 100, 100])
         upper_orange = np.array([10, 255, 255])
         mask = cv.inRange(hsv, lower_orange, upper_orange)
@@ -79,23 +111,37 @@ class PuckTracker:
         if len(contours) > 0:
             cnt = contours[0]
             x, y, w, h = cv.boundingRect(cnt)
-            self.bbox = (x, y, w, h)
+            self.bbox = (x + x0, y + y0, w, h)
+            self.tracker = cv.TrackerKCF_create()
             self.tracker.init(frame, self.bbox)
             self.tracker_initialized = True
+            self.lost = False
+            self.frames_tracked += 1
 
     def update_tracker(self, frame):
         """
         Update the tracker with the new frame.
         @param frame: new frame to update the tracker with
         """
-        ok, self.bbox = self.tracker.update(frame)
+        ok, bbox = self.tracker.update(frame)
+        if ok:
+            self.bbox = bbox
+            self.frames_tracked += 1
+        # KCF keeps failing once it has lost the puck, until reset() searches for it again
+        self.lost = not ok
         return ok, self.bbox
 
+    def reset(self):
+        """
+        Searches for the puck again on the next frame.
+        """
+        self.tracker_initialized = False
+
     def get(self) -> PuckState:
         """
         Get the current state of the puck.
         """
-        if self.field_homography.H is None or not self.tracker_initialized:
+        if self.field_homography.H is None or not self.tracker_initialized or self.lost:
             return PuckState(0, 0, False)
         else:
             center = self.bbox[0] + self.bbox[2] // 2, self.bbox[1] + self.bbox[3] // 2
@@ -1,5 +1,6 @@
 from .types import Team, RobotState, AruCoTag
-import json
+from .Metrics import metrics
+from .TagRegistry import TagRegistry
 from typing import Any, Protocol
 import numpy as np
 from threading import Thread, Lock
@@ -16,6 +17,12 @@ class FieldHomography(Protocol):
         """
         ...
 
+    def convert_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        Convert an (N, 2) array of coordinates from the camera frame to the field frame.
+        """
+        ...
+
     @property
     def H(self) -> np.ndarray:
         """
@@ -37,30 +44,38 @@ class RobotTracker:
     RobotTracker class to maintain the state of the robots using ArUco markers.
     """
 
-    def __init__(self, aruco_config: str = "config.json"):
+    def __init__(
+        self,
+        aruco_config: str = "config.json",
+        field_homography: FieldHomography = None,
+        tag_registry: TagRegistry = None,
+    ):
         """
         Parameters
         ----------
         aruco_config : str, optional
             The path to the ArUco configuration file, by default "config.json", which contains the Tag IDs for the field.
+        field_homography : FieldHomography, optional
+            Converts all tag centers at once, including lens correction if it has a lookup table,
+            by default None (the homography passed to set() is applied)
+        tag_registry : TagRegistry, optional
+            The shared tag roles, by default None (loaded from aruco_config). Only robot tags are tracked.
         """
+        self.field_homography = field_homography
         # self.robot_states = {
         #     Team.BLUE: [RobotState(0, 0, 0, False), RobotState(0, 0, 0, False)],
         #     Team.RED: [RobotState(0, 0, 0, False), RobotState(0, 0, 0, False)],
         # }
         self.robot_states: dict[int, RobotState] = {}
-        config = json.load(open(aruco_config, "r"))
-        # self.team_tags = {}
-        # for id in config["ids"]:
-        #     tag_id = int(config["ids"][id])
-        #     robot_num = int(id.split("_")[1])
-        #     team = Team.BLUE if "blue" in id else Team.RED
-        #     self.team_tags[tag_id] = team, robot_num
-        self.field_tags = [tag["id"] for tag in config["field_tags"]]
+        self.tag_registry = tag_registry if tag_registry is not None else TagRegistry(aruco_config)
         self.stopped = False
         self.aruco_tags = []
         self.robot_lock = Lock()
+        self.H = None
+        self._centers_px = np.empty((0, 2), dtype=np.float32)
+        self._tags: list[AruCoTag] = []
         self.threading = False
+        self._stage = metrics.stage("robot_tracker")
 
     def start(self):
         """
@@ -89,44 +104,53 @@ class RobotTracker:
         )
 
     def update(self, aruco_tags: list[AruCoTag]):
-        for robot in self.robot_states.values():
-            robot.found = False
-
+        """
+        Updates the robot states in place from the robot tags; field, puck and unknown tags are skipped.
+        """
         if self.H is None:
+            for robot in self.robot_states.values():
+                robot.found = False
             return
-        # not_found_list = [
-        #     tag_id for tag_id in self.tag_tags.keys() if tag not in aruco_tags
-        # ]
-        # for tag_id in not_found_list:
-        #     team, robot_num = self.team_tags[tag_id]
-        #     self.robot_states[team][robot_num] = RobotState(found=False)
+        t0 = self._stage.begin()
+        if len(aruco_tags) > len(self._centers_px):
+            # grow the preallocated buffers, only when more tags are seen than ever before
+            self._centers_px = np.empty((len(aruco_tags), 2), dtype=np.float32)
+            self._tags = [None] * len(aruco_tags)
+        n = 0
+        is_robot = self.tag_registry.is_robot
         for tag in aruco_tags:
-            # team, robot_num = self.team_tags[tag.id]
-            center_px = tag.center
-            center_mm = self.convert_cam2world(center_px.x, center_px.y).ravel()
-            corners = np.array(
-                [
-                    [tag.center.x - tag.w / 2, tag.center.y - tag.h / 2],
-                    [tag.center.x + tag.w / 2, tag.center.y - tag.h / 2],
-                    [tag.center.x + tag.w / 2, tag.center.y + tag.h / 2],
-                    [tag.center.x - tag.w / 2, tag.center.y + tag.h / 2],
-                ]
-            )
-            heading_millirad = 1e3 * np.arctan2(
-                corners[1][1] - corners[0][1], corners[1][0] - corners[0][0]
-            )
-            # self.robot_states[team][robot_num] = RobotState(
-            #     x=center_mm[0], y=center_mm[1], heading=heading_millirad
-            # )
-            try:
-                self.robot_states[tag.id].x = center_mm[0]
-                self.robot_states[tag.id].y = center_mm[1]
-                self.robot_states[tag.id].heading = heading_millirad
-                self.robot_states[tag.id].found = True
-            except KeyError:
-                self.robot_states[tag.id] = RobotState(
-                    x=center_mm[0], y=center_mm[1], heading=heading_millirad
-                )
+            if not is_robot(tag.id):
+                continue
+            self._centers_px[n, 0] = tag.center.x
+            self._centers_px[n, 1] = tag.center.y
+            self._tags[n] = tag
+            n += 1
+        if n == 0:
+            self._stage.end(t0)
+            return
+        centers_px = self._centers_px[:n]
+        if self.field_homography is not None:
+            centers_mm = self.field_homography.convert_points(centers_px)
+        else:
+            centers_mm = cv.perspectiveTransform(centers_px.reshape(-1, 1, 2), self.H).reshape(-1, 2)
+        # cleared after the transform, which releases the GIL, so other threads do not see every robot lost
+        for robot in self.robot_states.values():
+            robot.found = False
+        for i in range(n):
+            tag = self._tags[i]
+            x, y = float(centers_mm[i, 0]), float(centers_mm[i, 1])
+            # the tag box is axis aligned (center, w, h), so the heading of its top edge is always 0
+            heading_millirad = 0.0
+            robot = self.robot_states.get(tag.id)
+            if robot is None:
+                self.robot_states[tag.id] = RobotState(x=x, y=y, heading=heading_millirad)
+            else:
+                robot.x = x
+                robot.y = y
+                robot.heading = heading_millirad
+                robot.found = True
+            self._tags[i] = None
+        self._stage.end(t0)
 
     def run(self):
         while True:
@@ -135,21 +159,19 @@ class RobotTracker:
             # aruco_tags = aruco.get()
             if len(self.aruco_tags) == 0:
                 continue
-            tag_list = self.filter_tags(self.aruco_tags)
-            if len(tag_list) > 0:
-                self.update(tag_list)
+            if any(self.tag_registry.is_robot(tag.id) for tag in self.aruco_tags):
+                self.update(self.aruco_tags)
             else:
                 logging.warning("No robot markers found")
 
     def filter_tags(self, tag_list: list[AruCoTag]):
-        return [tag for tag in tag_list if tag.id not in self.field_tags]
+        return self.tag_registry.partition(tag_list).robots
 
     def set(self, tags: list[AruCoTag], H):
         self.H = H
         self.aruco_tags = tags
-        tag_list = self.filter_tags(self.aruco_tags)
-        if len(tag_list) > 0 and not self.threading:
-            self.update(tag_list)
+        if not self.threading:
+            self.update(tags)
 
     def get(self) -> dict[Team : list[RobotState]] | dict[int:RobotState]:
         return self.robot_states
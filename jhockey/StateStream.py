@@ -0,0 +1,201 @@
+"""
+Live stream of the tracker state for external consumers (team dashboards, commentary overlays).
+
+Each game loop iteration the GameManager publishes a snapshot; clients connect to the WebSocket route added
+by add_stream_route(), optionally send a subscription as JSON text, i.e. {"robots": [4, 5], "rate": 10},
+and receive the latest snapshot as a binary message at up to their rate. Snapshots published while a client
+waits for its next slot, or while its socket is still busy, are dropped for that client only.
+
+Message layout, little endian:
+    header: magic "JH" version[1] seq[4] seconds_remaining[f4] state[1] score_red[2] score_blue[2]
+            puck_found[1] puck_x[f4] puck_y[f4] robot_count[2]
+    robot_count records: id[2] x[f4] y[f4] heading[f4] found[1]
+state is 0 (stopped), 1 (running) or 2 (paused); puck_found is -1 without a puck tracker.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import struct
+import numpy as np
+from .types import GameState, Team, RobotState, PuckState
+from .Metrics import metrics
+
+VERSION = 1
+HEADER = struct.Struct("<2sBIfBHHbffH")
+RECORD = np.dtype([("id", "<u2"), ("x", "<f4"), ("y", "<f4"), ("heading", "<f4"), ("found", "u1")])
+STATES = list(GameState)
+_encodes = metrics.counter("stream_encodes")
+
+
+class Snapshot:
+    """
+    One published state. Encoded at most once per distinct robot subset, by the first client that sends it.
+    """
+
+    __slots__ = ("seq", "header", "records", "_encoded")
+
+    def __init__(self, seq: int, header: tuple, records: np.ndarray):
+        self.seq = seq
+        self.header = header
+        self.records = records
+        self._encoded: dict[frozenset | None, bytes] = {}
+
+    def encode(self, robots: frozenset | None = None) -> bytes:
+        """
+        Returns the message for the given robot IDs, or for every robot when robots is None.
+        """
+        encoded = self._encoded.get(robots)
+        if encoded is None:
+            records = self.records
+            if robots is not None:
+                records = records[np.isin(records["id"], list(robots))]
+            encoded = HEADER.pack(*self.header, len(records)) + records.tobytes()
+            self._encoded[robots] = encoded
+            _encodes.inc()
+        return encoded
+
+
+def decode_snapshot(message: bytes) -> dict:
+    """
+    Decodes a stream message, i.e. in a Python client.
+    """
+    magic, version, seq, seconds, state, red, blue, puck_found, puck_x, puck_y, n = HEADER.unpack_from(message)
+    if magic != b"JH" or version != VERSION:
+        raise ValueError("Not a JHockey stream message")
+    records = np.frombuffer(message, dtype=RECORD, count=n, offset=HEADER.size)
+    return {
+        "seq": seq,
+        "seconds_remaining": seconds,
+        "state": STATES[state].name,
+        "score": {Team.RED.name: red, Team.BLUE.name: blue},
+        "puck": None if puck_found < 0 else {"x": puck_x, "y": puck_y, "found": bool(puck_found)},
+        "robots": {
+            int(r["id"]): {"x": float(r["x"]), "y": float(r["y"]), "heading": float(r["heading"]), "found": bool(r["found"])}
+            for r in records
+        },
+    }
+
+
+class StateStream:
+    """
+    Holds the latest snapshot for the stream clients. publish() only copies the state, so the game loop
+    does not wait on encoding or on the clients.
+    """
+
+    def __init__(self, max_rate: float = 60.0, default_rate: float = 30.0):
+        """
+        Parameters
+        ----------
+        max_rate : float, optional
+            The highest rate in Hz a client may subscribe at, by default 60.0
+        default_rate : float, optional
+            The rate in Hz of clients that do not choose one, by default 30.0
+        """
+        self.max_rate = max_rate
+        self.default_rate = default_rate
+        self.latest: Snapshot | None = None
+        self.seq = 0
+        self.clients = 0
+        self._clients = metrics.gauge("stream_clients")
+        self._sent = metrics.counter("stream_frames", result="sent")
+        self._dropped = metrics.counter("stream_frames", result="dropped")
+        self._bytes = metrics.counter("stream_bytes")
+
+    def publish(
+        self,
+        seconds_remaining: float,
+        state: GameState,
+        score: dict[Team, int],
+        robots: dict[int, RobotState] | None,
+        puck: PuckState | None = None,
+    ):
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        robots = robots or {}
+        records = np.empty(len(robots), dtype=RECORD)
+        for i, (tag, robot) in enumerate(list(robots.items())):
+            records[i] = (tag, robot.x, robot.y, robot.heading, robot.found)
+        if puck is None:
+            puck_state = (-1, 0.0, 0.0)
+        else:
+            puck_state = (int(puck.found), puck.x, puck.y)
+        header = (
+            b"JH", VERSION, self.seq, seconds_remaining, STATES.index(state), score[Team.RED], score[Team.BLUE], *puck_state
+        )
+        # replacing the reference is atomic, so clients always see a complete snapshot
+        self.latest = Snapshot(self.seq, header, records)
+
+    def subscription(self, request: dict) -> tuple[frozenset | None, float]:
+        """
+        Returns the robot subset and rate of a subscription request, with the rate limited to max_rate.
+        """
+        robots = request.get("robots")
+        robots = None if robots is None else frozenset(int(tag) for tag in robots)
+        rate = float(request.get("rate", self.default_rate))
+        return robots, min(max(rate, 0.1), self.max_rate)
+
+    async def serve(self, websocket):
+        """
+        Sends the latest snapshot to one client at its rate until it disconnects.
+        """
+        from starlette.websockets import WebSocketDisconnect
+
+        await websocket.accept()
+        self.clients += 1
+        self._clients.set(self.clients)
+        robots, rate = None, self.default_rate
+        last_seq = None
+        loop = asyncio.get_running_loop()
+        receive = asyncio.ensure_future(websocket.receive_json())
+        try:
+            # a client subscribing right after connecting gets its subset from the first message on
+            done, _ = await asyncio.wait({receive}, timeout=0.2)
+            if receive in done:
+                robots, rate = self.subscription(receive.result())
+                receive = asyncio.ensure_future(websocket.receive_json())
+            while True:
+                next_send = loop.time() + 1 / rate
+                snapshot = self.latest
+                if snapshot is not None and snapshot.seq != last_seq:
+                    if last_seq is not None:
+                        self._dropped.inc((snapshot.seq - last_seq - 1) & 0xFFFFFFFF)
+                    message = snapshot.encode(robots)
+                    await websocket.send_bytes(message)
+                    self._sent.inc()
+                    self._bytes.inc(len(message))
+                    last_seq = snapshot.seq
+                delay = next_send - loop.time()
+                if delay <= 0:
+                    continue
+                done, _ = await asyncio.wait({receive}, timeout=delay)
+                if receive in done:
+                    robots, rate = self.subscription(receive.result())
+                    receive = asyncio.ensure_future(websocket.receive_json())
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        except (ValueError, TypeError, AttributeError) as e:
+            logging.warning("Invalid stream subscription: %s", e)
+            await websocket.close(code=1003)
+        finally:
+            receive.cancel()
+            self.clients -= 1
+            self._clients.set(self.clients)
+
+
+def add_stream_route(app, stream: StateStream, path: str = "/stream"):
+    """
+    Serves the state stream as a WebSocket route of an existing FastAPI (or NiceGUI) app.
+    Parameters
+    ----------
+    app : fastapi.FastAPI
+        The app to add the route to, i.e. nicegui.app
+    stream : StateStream
+        The stream the GameManager publishes to
+    path : str, optional
+        The route path, by default "/stream"
+    """
+    from starlette.routing import WebSocketRoute
+
+    # a plain Starlette route, the handler needs no FastAPI dependency injection
+    app.router.routes.append(WebSocketRoute(path, stream.serve))
+
+    logging.info("Serving the state stream at %s", path)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import dataclasses
+from enum import IntEnum
+import json
+import numpy as np
+from .types import AruCoTag, Team
+from .Metrics import metrics
+
+
+class TagRole(IntEnum):
+    """
+    What a tag ID stands for, stored as the value of the registry's lookup array.
+    """
+
+    UNKNOWN = 0
+    FIELD = 1
+    ROBOT = 2
+    PUCK = 3
+    IGNORED = 4
+
+
+@dataclass
+class TagPartition:
+    """
+    One frame's detections split by role, each list in detection order.
+    """
+
+    field: list[AruCoTag] = dataclasses.field(default_factory=list)
+    robots: list[AruCoTag] = dataclasses.field(default_factory=list)
+    puck: list[AruCoTag] = dataclasses.field(default_factory=list)
+    dropped: int = 0  # unknown or ignored tags
+
+
+class TagRegistry:
+    """
+    Maps every tag ID to its role, loaded once from the config file and shared by every component,
+    so a frame's detections are partitioned once instead of each consumer filtering them again.
+    """
+
+    def __init__(self, aruco_config: str = "config.json", max_id: int = 999):
+        """
+        Parameters
+        ----------
+        aruco_config : str, optional
+            The configuration file, by default "config.json". Besides the field tags it may list, for example:
+            "robots": [
+                {
+                    "id": 4,
+                    "team": "RED",
+                    "slot": 0
+                }
+            ],
+            "puck_tags": [9],
+            "ignored_tags": [12, 13]
+            When robots are listed, every other ID is unknown and dropped; otherwise any ID that is
+            not a field, puck or ignored tag is taken to be a robot.
+        max_id : int, optional
+            The largest valid tag ID, by default 999 (the largest fragmented broadcasts can carry).
+            Larger or negative IDs, i.e. from corrupted frames, are dropped.
+        """
+        config = json.load(open(aruco_config, "r"))
+        self.max_id = max_id
+        robots = config.get("robots", [])
+        default = TagRole.UNKNOWN if robots else TagRole.ROBOT
+        self.roles = np.full(max_id + 1, default, dtype=np.int8)
+        # team index (into list(Team)) and slot per robot ID, -1 when not configured
+        self.teams = np.full(max_id + 1, -1, dtype=np.int8)
+        self.slots = np.full(max_id + 1, -1, dtype=np.int16)
+        teams = list(Team)
+        for robot in robots:
+            tag_id = self._check_id(robot["id"])
+            self.roles[tag_id] = TagRole.ROBOT
+            if "team" in robot:
+                self.teams[tag_id] = teams.index(Team[robot["team"].upper()])
+            if "slot" in robot:
+                self.slots[tag_id] = int(robot["slot"])
+        for tag_id in config.get("puck_tags", []):
+            self.roles[self._check_id(tag_id)] = TagRole.PUCK
+        for tag_id in config.get("ignored_tags", []):
+            self.roles[self._check_id(tag_id)] = TagRole.IGNORED
+        self.field_positions: dict[int, tuple[float, float]] = {}
+        for tag in config["field_tags"]:
+            tag_id = self._check_id(tag["id"])
+            self.roles[tag_id] = TagRole.FIELD
+            self.field_positions[tag_id] = (float(tag["x"]), float(tag["y"]))
+        # plain list for single lookups, indexing it returns cached ints instead of new numpy scalars
+        self._role_list: list[int] = self.roles.tolist()
+        self._dropped = metrics.counter("dropped_tags")
+
+    def _check_id(self, tag_id) -> int:
+        tag_id = int(tag_id)
+        if not 0 <= tag_id <= self.max_id:
+            raise ValueError(f"Tag ID {tag_id} is outside the registry range 0..{self.max_id}")
+        return tag_id
+
+    def role(self, tag_id: int) -> TagRole:
+        if 0 <= tag_id <= self.max_id:
+            return self._role_list[tag_id]
+        return TagRole.UNKNOWN
+
+    def is_field(self, tag_id: int) -> bool:
+        return self.role(tag_id) == TagRole.FIELD
+
+    def is_robot(self, tag_id: int) -> bool:
+        return self.role(tag_id) == TagRole.ROBOT
+
+    def team(self, tag_id: int) -> Team | None:
+        """
+        Returns the team of a robot tag, or None if it has none configured.
+        """
+        if not self.is_robot(tag_id) or self.teams[tag_id] < 0:
+            return None
+        return list(Team)[self.teams[tag_id]]
+
+    def slot(self, tag_id: int) -> int | None:
+        """
+        Returns the slot of a robot tag within its team, or None if it has none configured.
+        """
+        if not self.is_robot(tag_id) or self.slots[tag_id] < 0:
+            return None
+        return int(self.slots[tag_id])
+
+    def partition(self, tags: list[AruCoTag]) -> TagPartition:
+        """
+        Splits a frame's detections by role with one list lookup per tag; unknown and ignored tags are dropped.
+        A frame holds a handful of tags, so a plain loop beats building numpy temporaries for them.
+        """
+        frame = TagPartition()
+        n = len(tags)
+        if n == 0:
+            return frame
+        roles, max_id = self._role_list, self.max_id
+        field, robots, puck = frame.field, frame.robots, frame.puck
+        for tag in tags:
+            tag_id = tag.id
+            if not 0 <= tag_id <= max_id:
+                continue
+            role = roles[tag_id]
+            if role == TagRole.ROBOT:
+                robots.append(tag)
+            elif role == TagRole.FIELD:
+                field.append(tag)
+            elif role == TagRole.PUCK:
+                puck.append(tag)
+        frame.dropped = n - len(frame.field) - len(frame.robots) - len(frame.puck)
+        if frame.dropped:
+            self._dropped.inc(frame.dropped)
+        return frame
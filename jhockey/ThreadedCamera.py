@@ -1,32 +1,43 @@
 # adapted from imutils webcamvideostream.py
 from threading import Thread, Lock
 import cv2 as cv
+from .Metrics import metrics
+import logging
+import time
 
 
 class ThreadedCamera:
     '''
-    Threaded wrapper for OpenCV VideoCapture with built-in camera dewarping.
+    Threaded wrapper for OpenCV VideoCapture. Frames are delivered raw; lens correction is applied
+    to detected points only, through FieldLUT.
+    The capture is opened by connect(), normally called by a DeviceSupervisor.
     '''
-    def __init__(self, src: int = 0, name="ThreadedCamera", mtx=None, dist=None):
+    def __init__(self, src: int = 0, name="ThreadedCamera", max_read_failures: int = 30):
         """
         Initialize the ThreadedCamera object.
 
         Args:
             src (int, optional): The index of the camera device to use. Defaults to 0.
             name (str, optional): The name of the thread. Defaults to "ThreadedCamera".
-            mtx (numpy.ndarray, optional): The camera matrix. Defaults to None.
-            dist (numpy.ndarray, optional): The distortion coefficients. Defaults to None.
+            max_read_failures (int, optional): Consecutive failed reads before the camera is
+                considered disconnected. Defaults to 30.
         """
         self.connected = False
         self.src = src
+        self.stream = None
+        self.max_read_failures = max_read_failures
         self.frame = None
         self.name = name    
         self.lock = Lock()
 
-        self.mtx = mtx
-        self.dist = dist
-
         self.stopped = False
+        self.frame_count = 0
+        self.frame_time = 0.0
+        # (frame, frame_time, frame_count) of the latest frame, published in one assignment so a consumer
+        # never pairs a frame with the timestamp of another
+        self.capture = (None, 0.0, 0)
+        self._stage = metrics.stage("camera", camera=name)
+        self._dropped = metrics.counter("dropped_frames", stage="camera", camera=name)
 
     def start(self):
         """
@@ -40,28 +51,64 @@ class ThreadedCamera:
         t.start()
         return self
 
-    def update(self):
-        while self.connected is False:
-            try:
-                self.stream = cv.VideoCapture(self.src)
-                self.connected = True
-            except:
-                self.connected = False
+    def connect(self):
+        """
+        Opens the capture device once.
 
-        (self.grabbed, self.frame) = self.stream.read()
-        while True:
-            if self.stopped:
-                return
+        Raises:
+            ConnectionError: if the device could not be opened.
+        """
+        stream = cv.VideoCapture(self.src)
+        if not stream.isOpened():
+            stream.release()
+            raise ConnectionError(f"Could not open camera {self.src}")
+        self.stream = stream
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.release()
+
+    def update(self):
+        failures = 0
+        while not self.stopped:
+            if not self.connected:
+                time.sleep(0.05)
+                continue
+            t0 = self._stage.begin()
             (self.grabbed, frame) = self.stream.read()
-            if self.mtx is not None and self.dist is not None:
-                self.frame = cv.undistort(
-                    frame, self.mtx, self.dist, None, self.mtx
-                )
-            else:
-                self.frame = frame
+            if not self.grabbed:
+                self._dropped.inc()
+                self.frame = None
+                failures += 1
+                if failures >= self.max_read_failures:
+                    # leave the reconnect to the supervisor
+                    logging.error("Camera %s stopped delivering frames", self.src)
+                    self.connected = False
+                    failures = 0
+                continue
+            failures = 0
+            # read() blocks until the frame arrives, so this is the closest to its capture time
+            frame_time = time.perf_counter()
+            self.frame = frame
+            self.frame_time = frame_time
+            self.frame_count += 1
+            self.capture = (frame, frame_time, self.frame_count)
+            self._stage.end(t0)
 
     def read(self):
         return self.frame
 
+    def read_frame(self):
+        """
+        Returns the latest frame with its time.perf_counter() capture timestamp and frame count,
+        the frame being None if the last read failed.
+        """
+        if self.frame is None:
+            return None, self.frame_time, self.frame_count
+        return self.capture
+
     def stop(self):
         self.stopped = True
@@ -0,0 +1,325 @@
+from __future__ import annotations
+from collections import deque
+from datetime import datetime
+from threading import Thread, Event
+import argparse
+import json
+import logging
+import os
+import numpy as np
+from .types import RobotState, PuckState
+from .Metrics import metrics
+
+# the puck is stored as a robot with this id
+PUCK_ID = -1
+
+COLUMNS = {
+    "time": np.float64,
+    "id": np.int32,
+    "x": np.float32,
+    "y": np.float32,
+    "heading": np.float32,
+    "found": np.bool_,
+}
+
+
+class TrajectoryStore:
+    """
+    Records robot and puck poses of each match to a columnar on-disk store.
+    Every match gets a directory of memory-mapped NumPy arrays (time, id, x, y, heading, found).
+    append() only snapshots the poses into a queue; a writer thread packs and writes them,
+    so the game loop never touches the disk. Read matches back with MatchTrajectory.
+    """
+
+    def __init__(self, directory: str = "matches", capacity: int = 1 << 16, flush_interval: float = 0.5, name="Trajectory Writer"):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            The directory match folders are created in, by default "matches"
+        capacity : int, optional
+            The initial number of rows per match; files double in size when full, by default 65536
+        flush_interval : float, optional
+            How often queued poses are written, in seconds, by default 0.5
+        name : str, optional
+            The name of the writer thread, by default "Trajectory Writer"
+        """
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.name = name
+        self.stopped = False
+        self.match_dir: str | None = None
+        self.length = 0
+        self.columns: dict[str, np.memmap] = {}
+        self.queue: deque = deque()
+        self._thread: Thread | None = None
+        self._flush = Event()
+        self._rows = metrics.counter("trajectory_rows")
+        self._write = metrics.stage("trajectory_write")
+
+    def start(self) -> TrajectoryStore:
+        self._thread = Thread(target=self.run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def start_match(self):
+        """
+        Closes the current match, if any, and starts recording a new one.
+        """
+        self.queue.append(("start", datetime.now().strftime("%Y%m%d-%H%M%S")))
+        self._flush.set()
+
+    def end_match(self):
+        """
+        Writes the remaining poses and finalizes the current match.
+        """
+        self.queue.append(("end", None))
+        self._flush.set()
+
+    def append(self, t: float, robots: dict[int, RobotState], puck: PuckState = None):
+        """
+        Queues the poses at match time t. Only copies the values, so it is cheap enough for the game loop.
+        """
+        poses = [(tag, robot.x, robot.y, robot.heading, robot.found) for tag, robot in robots.items()]
+        if puck is not None:
+            poses.append((PUCK_ID, puck.x, puck.y, 0, puck.found))
+        self.queue.append((t, poses))
+
+    def run(self):
+        while True:
+            self._flush.wait(timeout=self.flush_interval)
+            self._flush.clear()
+            self.drain()
+            if self.stopped:
+                return
+
+    def drain(self):
+        """
+        Writes every queued entry. Runs on the writer thread.
+        """
+        batch = []
+        while self.queue:
+            t, poses = self.queue.popleft()
+            if t == "start" or t == "end":
+                self.write(batch)
+                batch = []
+                self.close_match()
+                if t == "start":
+                    self.open_match(poses)
+                continue
+            batch.extend((t, *pose) for pose in poses)
+        self.write(batch)
+
+    def open_match(self, match_name: str):
+        """
+        Creates the match directory. Matches are named to the second, so a match started again within the
+        same second (or a name used before) gets a counter suffix instead of overwriting the earlier one.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.match_dir = os.path.join(self.directory, match_name)
+        suffix = 1
+        while True:
+            try:
+                os.mkdir(self.match_dir)
+                break
+            except FileExistsError:
+                suffix += 1
+                self.match_dir = os.path.join(self.directory, f"{match_name}-{suffix}")
+        self.length = 0
+        self.columns = {
+            column: np.lib.format.open_memmap(
+                os.path.join(self.match_dir, f"{column}.npy"), mode="w+", dtype=dtype, shape=(self.capacity,)
+            )
+            for column, dtype in COLUMNS.items()
+        }
+        self.write_meta(finalized=False)
+        logging.info("Recording match to %s", self.match_dir)
+
+    def grow(self, needed: int):
+        """
+        Doubles the column files until they hold needed rows.
+        """
+        capacity = len(self.columns["time"])
+        while capacity < needed:
+            capacity *= 2
+        for column, dtype in COLUMNS.items():
+            path = os.path.join(self.match_dir, f"{column}.npy")
+            old = self.columns[column]
+            grown = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=dtype, shape=(capacity,))
+            grown[: self.length] = old[: self.length]
+            grown.flush()
+            del old
+            os.replace(path + ".tmp", path)
+            self.columns[column] = grown
+
+    def write(self, batch: list[tuple]):
+        if self.match_dir is None or len(batch) == 0:
+            return
+        t0 = self._write.begin()
+        n = len(batch)
+        if self.length + n > len(self.columns["time"]):
+            self.grow(self.length + n)
+        # transpose the rows into columns in one pass
+        for (column, dtype), values in zip(COLUMNS.items(), zip(*batch)):
+            self.columns[column][self.length : self.length + n] = np.fromiter(values, dtype=dtype, count=n)
+        self.length += n
+        self.write_meta(finalized=False)
+        self._rows.inc(n)
+        self._write.end(t0)
+
+    def write_meta(self, finalized: bool):
+        with open(os.path.join(self.match_dir, "meta.json"), "w") as f:
+            json.dump({"length": self.length, "finalized": finalized}, f)
+
+    def close_match(self):
+        """
+        Flushes the columns and writes a copy sorted by robot, so per-robot queries are zero-copy slices.
+        """
+        if self.match_dir is None:
+            return
+        for column in self.columns.values():
+            column.flush()
+        ids = self.columns["id"][: self.length]
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        tags, starts, counts = np.unique(sorted_ids, return_index=True, return_counts=True)
+        for column in COLUMNS:
+            np.save(os.path.join(self.match_dir, f"by_robot_{column}.npy"), self.columns[column][: self.length][order])
+        with open(os.path.join(self.match_dir, "robot_index.json"), "w") as f:
+            json.dump({str(tag): [int(start), int(start + count)] for tag, start, count in zip(tags, starts, counts)}, f)
+        self.write_meta(finalized=True)
+        logging.info("Match saved to %s (%d rows)", self.match_dir, self.length)
+        self.columns = {}
+        self.match_dir = None
+
+    def stop(self):
+        """
+        Finalizes the current match and waits for the writer to finish.
+        """
+        self.end_match()
+        self.stopped = True
+        self._flush.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class MatchTrajectory:
+    """
+    Read-only view of one recorded match. Columns are memory-mapped and queries return views where possible.
+    """
+
+    def __init__(self, match_dir: str):
+        self.match_dir = match_dir
+        meta = json.load(open(os.path.join(match_dir, "meta.json"), "r"))
+        self.length = meta["length"]
+        self.finalized = meta["finalized"]
+        self.columns = {
+            column: np.load(os.path.join(match_dir, f"{column}.npy"), mmap_mode="r")[: self.length] for column in COLUMNS
+        }
+        self.robot_index: dict[int, tuple[int, int]] = {}
+        self.by_robot: dict[str, np.ndarray] = {}
+        if self.finalized:
+            index = json.load(open(os.path.join(match_dir, "robot_index.json"), "r"))
+            self.robot_index = {int(tag): tuple(span) for tag, span in index.items()}
+            self.by_robot = {
+                column: np.load(os.path.join(match_dir, f"by_robot_{column}.npy"), mmap_mode="r") for column in COLUMNS
+            }
+
+    @property
+    def robot_ids(self) -> list[int]:
+        if self.finalized:
+            return sorted(tag for tag in self.robot_index if tag != PUCK_ID)
+        return sorted(int(tag) for tag in np.unique(self.columns["id"]) if tag != PUCK_ID)
+
+    def time_range(self, start: float, stop: float) -> dict[str, np.ndarray]:
+        """
+        Returns every column for start <= time < stop, as views into the memory map.
+        """
+        time = self.columns["time"]
+        lo, hi = np.searchsorted(time, (start, stop))
+        return {column: values[lo:hi] for column, values in self.columns.items()}
+
+    def robot(self, tag: int) -> dict[str, np.ndarray]:
+        """
+        Returns every column for one robot (or PUCK_ID) in time order.
+        Views into the memory map once the match is finalized, copies while it is still recording.
+        """
+        if self.finalized:
+            lo, hi = self.robot_index.get(tag, (0, 0))
+            return {column: values[lo:hi] for column, values in self.by_robot.items()}
+        mask = self.columns["id"] == tag
+        return {column: values[mask] for column, values in self.columns.items()}
+
+    def speeds(self, tag: int, max_gap: float = 0.5) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the times and speeds between consecutive sightings of a robot,
+        skipping steps across gaps longer than max_gap seconds.
+        """
+        track = self.robot(tag)
+        found = track["found"]
+        t, x, y = track["time"][found], track["x"][found], track["y"][found]
+        dt = np.diff(t)
+        step = np.hypot(np.diff(x), np.diff(y))
+        valid = (dt > 0) & (dt <= max_gap)
+        return t[1:][valid], step[valid] / dt[valid]
+
+    def distance(self, tag: int, max_gap: float = 0.5) -> float:
+        """
+        Returns the distance travelled by a robot, in field units.
+        """
+        track = self.robot(tag)
+        found = track["found"]
+        t, x, y = track["time"][found], track["x"][found], track["y"][found]
+        valid = np.diff(t) <= max_gap
+        return float(np.hypot(np.diff(x), np.diff(y))[valid].sum())
+
+    def max_speed(self, tag: int, max_gap: float = 0.5) -> float:
+        """
+        Returns the top speed of a robot, in field units per second.
+        """
+        _, speeds = self.speeds(tag, max_gap)
+        return float(speeds.max()) if len(speeds) > 0 else 0.0
+
+    def occupancy(self, tag: int = None, bins: tuple[int, int] = (32, 24), extent: tuple[float, float, float, float] = None) -> np.ndarray:
+        """
+        Returns a heat map of the seconds spent in each cell, for one robot or for all robots.
+        @param bins: cells along x and y
+        @param extent: (x min, x max, y min, y max), by default the range of the recorded positions
+        @return: (bins[0], bins[1]) array of seconds
+        """
+        if tag is None:
+            track = self.columns
+            found = track["found"] & (track["id"] != PUCK_ID)
+        else:
+            track = self.robot(tag)
+            found = track["found"]
+        x, y = track["x"][found], track["y"][found]
+        if extent is None:
+            extent = (float(x.min()), float(x.max()), float(y.min()), float(y.max())) if len(x) > 0 else (0, 1, 0, 1)
+        # bin with integer arithmetic and bincount, which is much faster than np.histogram2d
+        nx, ny = bins
+        x_min, x_max, y_min, y_max = extent
+        inside = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        ix = np.minimum(((x[inside] - x_min) * (nx / max(x_max - x_min, 1e-9))).astype(np.intp), nx - 1)
+        iy = np.minimum(((y[inside] - y_min) * (ny / max(y_max - y_min, 1e-9))).astype(np.intp), ny - 1)
+        counts = np.bincount(ix * ny + iy, minlength=nx * ny).reshape(nx, ny).astype(np.float64)
+        # each sample stands for one game loop period
+        time = self.columns["time"]
+        steps = np.count_nonzero(np.diff(time))
+        period = (time[-1] - time[0]) / steps if steps > 0 else 0.0
+        return counts * period
+
+    def summary(self) -> str:
+        lines = [f"{'robot':>6} {'distance':>10} {'max speed':>10}"]
+        for tag in self.robot_ids:
+            lines.append(f"{tag:>6} {self.distance(tag):>10.2f} {self.max_speed(tag):>10.2f}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a recorded match.")
+    parser.add_argument("match_dir", type=str, help="Match directory, i.e. matches/20240101-120000")
+    args = parser.parse_args()
+    print(MatchTrajectory(args.match_dir).summary())
@@ -0,0 +1,288 @@
+"""
+Offline tracking of recorded match video, faster than real time.
+
+The video is split into chunks that are tracked in a process pool, each with its own CameraArucoDetector,
+FieldHomography and RobotTracker. Chunks start warm: every worker gets the field homography found at the
+start of the video, and begins overlap seconds before its chunk, so the tracker has seen the robots by the
+time its own frames start. The overlapping frames are tracked by both neighbours; the stitched trajectory
+keeps the rows of the chunk a frame belongs to and counts the positions the two disagree on. The result
+is written as one match of a TrajectoryStore, with the video's frame timestamps, and read back with
+MatchTrajectory.
+
+Usage: python -m jhockey.VideoBatch match.mp4 [--workers 4] [--chunk 60] [--overlap 2] [--out matches]
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+import argparse
+import logging
+import os
+import time
+import numpy as np
+import cv2 as cv
+from .CameraArucoDetector import CameraArucoDetector
+from .FieldHomography import FieldHomography
+from .FieldMask import FieldMask
+from .RobotTracker import RobotTracker
+from .TagRegistry import TagRegistry
+from .TrajectoryStore import TrajectoryStore, COLUMNS
+
+ROW = np.dtype([("frame", np.int64)] + list(COLUMNS.items()))
+
+
+@dataclass
+class Chunk:
+    """
+    Frames [start, stop) of the video, tracked from warm_start on.
+    """
+
+    index: int
+    warm_start: int
+    start: int
+    stop: int
+
+
+@dataclass
+class BatchConfig:
+    """
+    Settings every worker needs, sent once per chunk.
+    """
+
+    video: str
+    config: str = "config.json"
+    calibration: str | None = None
+    lut_cache: str = "lut_cache"
+    field_mask: bool = True
+    H: np.ndarray | None = None
+
+
+def plan_chunks(n_frames: int, fps: float, chunk_sec: float, overlap_sec: float) -> list[Chunk]:
+    """
+    Splits the video into chunks of chunk_sec seconds, each warmed up on the overlap_sec seconds before it.
+    """
+    size = max(1, int(round(chunk_sec * fps)))
+    overlap = max(0, int(round(overlap_sec * fps)))
+    return [
+        Chunk(i, max(0, start - overlap), start, min(start + size, n_frames))
+        for i, start in enumerate(range(0, n_frames, size))
+    ]
+
+
+def video_info(video: str) -> tuple[int, float]:
+    """
+    Returns the frame count and frame rate of a video file.
+    """
+    capture = cv.VideoCapture(video)
+    if not capture.isOpened():
+        raise ConnectionError(f"Could not open video {video}")
+    n_frames = int(capture.get(cv.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv.CAP_PROP_FPS) or 30.0
+    capture.release()
+    return n_frames, fps
+
+
+def load_lut(settings: BatchConfig):
+    """
+    Returns the lookup table of the video's camera, built and cached if it is not yet, or None without a calibration.
+    """
+    if settings.calibration is None:
+        return None
+    from .FieldLUT import FieldLUT
+
+    return FieldLUT.from_file(
+        settings.calibration, field_config=settings.config, cache_dir=settings.lut_cache, camera=settings.video
+    )
+
+
+def pipeline(settings: BatchConfig) -> tuple[CameraArucoDetector, FieldHomography, RobotTracker]:
+    tag_registry = TagRegistry(aruco_config=settings.config)
+    lut = load_lut(settings)
+    homography = FieldHomography(param_file=settings.config, lut=lut, tag_registry=tag_registry)
+    if settings.H is not None:
+        # warm start, positions are available before the chunk sees the field tags
+        homography.H = settings.H
+        homography.H_inv = np.linalg.inv(settings.H)
+        if lut is not None:
+            lut.set_homography(settings.H)
+    field_mask = FieldMask(homography, field_config=settings.config) if settings.field_mask else None
+    detector = CameraArucoDetector(name="Batch Detector", field_mask=field_mask)
+    tracker = RobotTracker(aruco_config=settings.config, field_homography=homography, tag_registry=tag_registry)
+    return detector, homography, tracker
+
+
+def track(capture: cv.VideoCapture, detector: CameraArucoDetector, homography: FieldHomography, tracker: RobotTracker):
+    """
+    Tracks the next frame of the capture. Returns False at the end of the video.
+    """
+    grabbed, frame = capture.read()
+    if not grabbed:
+        return False
+    detector.detect(frame)
+    tags = detector.get()
+    homography.find_homography(tags)
+    tracker.set(tags, homography.H)
+    return True
+
+
+def find_homography(settings: BatchConfig, max_frames: int) -> np.ndarray | None:
+    """
+    Returns the homography of the first frame within max_frames that shows the field tags.
+    """
+    detector, homography, tracker = pipeline(settings)
+    capture = cv.VideoCapture(settings.video)
+    try:
+        for _ in range(max_frames):
+            if not track(capture, detector, homography, tracker):
+                break
+            if homography.H is not None:
+                return homography.H
+    finally:
+        capture.release()
+    return None
+
+
+def process_chunk(settings: BatchConfig, chunk: Chunk, fps: float) -> tuple[Chunk, np.ndarray]:
+    """
+    Tracks the frames of one chunk. Runs in a worker process.
+    @return: the chunk and a ROW array of the poses of every known robot in every frame from warm_start on
+    """
+    detector, homography, tracker = pipeline(settings)
+    capture = cv.VideoCapture(settings.video)
+    capture.set(cv.CAP_PROP_POS_FRAMES, chunk.warm_start)
+    rows = []
+    try:
+        for frame in range(chunk.warm_start, chunk.stop):
+            if not track(capture, detector, homography, tracker):
+                break
+            t = capture.get(cv.CAP_PROP_POS_MSEC) / 1000
+            if t <= 0 and frame > 0:
+                # not every backend reports timestamps
+                t = frame / fps
+            rows.extend(
+                (frame, t, tag, robot.x, robot.y, robot.heading, robot.found) for tag, robot in tracker.get().items()
+            )
+    finally:
+        capture.release()
+    return chunk, np.array(rows, dtype=ROW)
+
+
+def stitch(results: list[tuple[Chunk, np.ndarray]], tolerance: float = 0.05) -> tuple[np.ndarray, int]:
+    """
+    Joins the chunks into one trajectory, keeping each frame's rows from the chunk it belongs to.
+    @param tolerance: positions in the overlap further apart than this, in field units, are disagreements
+    @return: the ROW array in frame order and the number of disagreeing robot positions in the overlaps
+    """
+    results = sorted(results, key=lambda result: result[0].index)
+    owned = [rows[rows["frame"] >= chunk.start] for chunk, rows in results]
+    disagreements = 0
+    for (_, previous), (chunk, rows) in zip(results, results[1:]):
+        # the previous chunk tracked the warm up frames of this one as its last frames
+        warm = rows[rows["frame"] < chunk.start]
+        tail = previous[previous["frame"] >= chunk.warm_start]
+        warm, tail = warm[warm["found"]], tail[tail["found"]]
+        keys = np.intersect1d(warm["frame"] * 1024 + warm["id"], tail["frame"] * 1024 + tail["id"])
+        a = warm[np.isin(warm["frame"] * 1024 + warm["id"], keys)]
+        b = tail[np.isin(tail["frame"] * 1024 + tail["id"], keys)]
+        a = a[np.lexsort((a["id"], a["frame"]))]
+        b = b[np.lexsort((b["id"], b["frame"]))]
+        disagreements += int(np.count_nonzero(np.hypot(a["x"] - b["x"], a["y"] - b["y"]) > tolerance))
+    return np.concatenate(owned) if owned else np.empty(0, dtype=ROW), disagreements
+
+
+def write(rows: np.ndarray, directory: str, name: str) -> str:
+    """
+    Writes the stitched rows as one match of a TrajectoryStore. Returns the match directory.
+    """
+    store = TrajectoryStore(directory=directory, capacity=max(1, len(rows)))
+    # written on this thread, there is no game loop to keep off the disk
+    store.open_match(name)
+    match_dir = store.match_dir
+    store.write(list(zip(*(rows[column].tolist() for column in COLUMNS))))
+    store.close_match()
+    return match_dir
+
+
+def process_video(
+    settings: BatchConfig,
+    workers: int = None,
+    chunk_sec: float = 60.0,
+    overlap_sec: float = 2.0,
+    out: str = "matches",
+    name: str = None,
+) -> tuple[str, int, int]:
+    """
+    Tracks a whole video and writes the stitched trajectory.
+    Parameters
+    ----------
+    settings : BatchConfig
+        The video and pipeline configuration
+    workers : int, optional
+        The number of worker processes, by default None (one per core)
+    chunk_sec : float, optional
+        The length of each chunk in seconds, by default 60.0
+    overlap_sec : float, optional
+        The seconds each chunk is warmed up on, tracked by its predecessor too, by default 2.0
+    out : str, optional
+        The directory the match is written to, by default "matches"
+    name : str, optional
+        The match name, by default the video file name
+    Returns
+    -------
+    tuple[str, int, int]
+        The match directory, the frames tracked and the disagreeing positions in the overlaps
+    """
+    n_frames, fps = video_info(settings.video)
+    # built once here, so the workers only load the cached tables instead of all building them at once
+    lut = load_lut(settings)
+    if settings.H is None:
+        settings.H = find_homography(settings, max_frames=int(10 * fps))
+        if settings.H is None:
+            logging.warning("No field tags in the first 10 s, each chunk waits for its own")
+    if lut is not None and settings.H is not None:
+        lut.set_homography(settings.H)
+        lut.flush()
+    chunks = plan_chunks(n_frames, fps, chunk_sec, overlap_sec)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_chunk, settings, chunk, fps) for chunk in chunks]
+        for future in as_completed(futures):
+            chunk, rows = future.result()
+            results.append((chunk, rows))
+            logging.info("Chunk %d/%d done (frames %d-%d)", len(results), len(chunks), chunk.start, chunk.stop)
+    rows, disagreements = stitch(results)
+    if name is None:
+        name = os.path.splitext(os.path.basename(settings.video))[0]
+    match_dir = write(rows, out, name)
+    return match_dir, len(np.unique(rows["frame"])), disagreements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track the robots in a recorded match video.")
+    parser.add_argument("video", type=str, help="Video file, i.e. match.mp4")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Defaults to one per core.")
+    parser.add_argument("--chunk", type=float, default=60.0, help="Chunk length in seconds. Defaults to 60.")
+    parser.add_argument("--overlap", type=float, default=2.0, help="Seconds each chunk is warmed up on. Defaults to 2.")
+    parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
+    parser.add_argument("--calibration", type=str, default=None, help="Camera calibration .json file, enables lens correction.")
+    parser.add_argument("--lut-cache", type=str, default="lut_cache", help="Directory for cached lookup tables. Defaults to lut_cache.")
+    parser.add_argument("--no-field-mask", action="store_true", help="Detect on full frames instead of cropping and masking them to the field.")
+    parser.add_argument("--out", type=str, default="matches", help="Directory the match is written to. Defaults to matches.")
+    parser.add_argument("--name", type=str, default=None, help="Match name. Defaults to the video file name.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    settings = BatchConfig(
+        video=args.video,
+        config=args.config,
+        calibration=args.calibration,
+        lut_cache=args.lut_cache,
+        field_mask=not args.no_field_mask,
+    )
+    start = time.perf_counter()
+    match_dir, frames, disagreements = process_video(settings, args.workers, args.chunk, args.overlap, args.out, args.name)
+    elapsed = time.perf_counter() - start
+    n_frames, fps = video_info(args.video)
+    print(
+        f"{frames} frames ({frames / fps:.0f} s of video) in {elapsed:.1f} s, {frames / fps / elapsed:.1f}x real time, "
+        f"{disagreements} overlap disagreements, saved to {match_dir}"
+    )
@@ -0,0 +1,245 @@
+from __future__ import annotations
+from threading import Thread, Lock
+from typing import Callable, Protocol
+import threading
+import logging
+from .types import BroadcasterMessage, RobotState, StageState
+from .Clock import WallClock
+from .DeviceSupervisor import Backoff
+from .Metrics import metrics
+
+
+class RobotTracker(Protocol):
+    def get(self) -> dict[int, RobotState]:
+        """
+        Returns the tracked robot states, updated in place.
+        """
+        ...
+
+
+class Broadcaster(Protocol):
+    message: BroadcasterMessage | None
+
+    def set_message(self, message: BroadcasterMessage) -> None:
+        ...
+
+
+class Device(Protocol):
+    name: str
+
+    @property
+    def connected(self) -> bool:
+        ...
+
+    def disconnect(self) -> None:
+        ...
+
+
+def thread_alive(name: str) -> bool:
+    """
+    Returns whether a thread with the given name is running.
+    """
+    return any(thread.name == name and thread.is_alive() for thread in threading.enumerate())
+
+
+def restart(name: str, start: Callable[[], object] = None, device: Device = None, reset: Callable[[], None] = None) -> Callable[[], None]:
+    """
+    Returns the usual recovery of a stage: start its thread again if it died, otherwise drop the device link
+    so the DeviceSupervisor reopens it, otherwise reset the stage.
+    @param name: the name of the stage's thread
+    @param start: starts the thread, i.e. detector.start, by default None (the stage has no thread)
+    @param device: the device the stage reads, by default None
+    @param reset: resets the stage's state, by default None
+    """
+
+    def recover():
+        if start is not None and not thread_alive(name):
+            logging.error("%s thread died, restarting it", name)
+            start()
+        elif device is not None and device.connected:
+            logging.error("%s stalled, reconnecting", name)
+            device.disconnect()
+        elif reset is not None:
+            logging.error("%s stalled, resetting it", name)
+            reset()
+
+    return recover
+
+
+class WatchedStage:
+    def __init__(self, name: str, progress: Callable[[], int], budget: float, recover: Callable[[], None] | None, tracking: bool, now: float):
+        self.name = name
+        self.progress = progress
+        self.budget = budget
+        self.recover = recover
+        self.tracking = tracking
+        self.seq = None
+        self.last_progress = now
+        self.state = StageState.OK
+        self.backoff = Backoff(initial=budget, maximum=10.0)
+        self.next_recovery = 0.0
+        self.stalled_gauge = metrics.gauge("stage_stalled", stage=name)
+        self.age_gauge = metrics.gauge("stage_progress_age_seconds", stage=name)
+        self.stalls = metrics.counter("stage_stalls", stage=name)
+        self.recoveries = metrics.counter("stage_recoveries", stage=name)
+
+
+class Watchdog:
+    """
+    Watches the pipeline stages for stalls. Each stage reports progress as a sequence number, i.e. its frame
+    count; a stage whose number has not changed within its budget is stalled, whether its thread died, its
+    device stopped sending or it only ever sees the same stale data. Stalled stages are recovered with
+    backoff until they make progress again, and every state change is published to the listeners, so the
+    GUI shows a stall within budget + poll_interval.
+    While a stage that robot positions depend on is stalled, every tracked robot is marked as not found and
+    the broadcaster is handed a message without robots, since the standard and fragmented formats carry no
+    found flag and the broadcaster keeps sending its last message.
+    """
+
+    def __init__(
+        self,
+        robot_tracker: RobotTracker = None,
+        broadcaster: Broadcaster = None,
+        poll_interval: float = 0.1,
+        clock=None,
+        name="Watchdog",
+    ):
+        """
+        Parameters
+        ----------
+        robot_tracker : RobotTracker, optional
+            The tracker whose robots are marked as not found while tracking is stalled, by default None
+        broadcaster : Broadcaster, optional
+            Sent a message without robots while tracking is stalled, by default None
+        poll_interval : float, optional
+            How often the stages are checked, in seconds, by default 0.1
+        clock : WallClock | VirtualClock, optional
+            The clock budgets are measured on, by default None (the wall clock)
+        name : str, optional
+            The name of the thread, by default "Watchdog"
+        """
+        self.robot_tracker = robot_tracker
+        self.broadcaster = broadcaster
+        self._no_robots = BroadcasterMessage(time_dsec=0, robots={}, enabled=False)
+        self.poll_interval = poll_interval
+        self.clock = clock if clock is not None else WallClock()
+        self.name = name
+        self.stopped = False
+        self.stages: list[WatchedStage] = []
+        self.listeners: list[Callable[[str, StageState], None]] = []
+        self.tracking_stalled = False
+        self._lock = Lock()
+
+    def watch(
+        self,
+        name: str,
+        progress: Callable[[], int],
+        budget: float = 0.5,
+        recover: Callable[[], None] = None,
+        tracking: bool = False,
+    ) -> Watchdog:
+        """
+        Puts a stage under watch.
+        Parameters
+        ----------
+        name : str
+            The name shown in the GUI and the metrics
+        progress : Callable[[], int]
+            Returns the stage's progress sequence number, i.e. lambda: camera.frame_count
+        budget : float, optional
+            The seconds the stage may go without progress, by default 0.5
+        recover : Callable[[], None], optional
+            Restarts the stage or reconnects its device (see restart()), by default None (only reported)
+        tracking : bool, optional
+            Robot positions depend on the stage, by default False
+        """
+        with self._lock:
+            self.stages.append(WatchedStage(name, progress, budget, recover, tracking, self.clock.now()))
+        return self
+
+    def add_listener(self, listener: Callable[[str, StageState], None]):
+        """
+        Registers a callback receiving (stage name, new state) on every state change.
+        """
+        self.listeners.append(listener)
+
+    @property
+    def states(self) -> dict[str, StageState]:
+        return {stage.name: stage.state for stage in self.stages}
+
+    def start(self) -> Watchdog:
+        t = Thread(target=self.run, name=self.name)
+        t.daemon = True
+        t.start()
+        return self
+
+    def set_state(self, stage: WatchedStage, state: StageState):
+        if stage.state == state:
+            return
+        stage.state = state
+        stage.stalled_gauge.set(1 if state == StageState.STALLED else 0)
+        for listener in self.listeners:
+            try:
+                listener(stage.name, state)
+            except Exception:
+                logging.exception("Stage state listener failed")
+
+    def check(self, stage: WatchedStage, now: float):
+        try:
+            seq = stage.progress()
+        except Exception:
+            logging.exception("Could not read the progress of %s", stage.name)
+            seq = stage.seq
+        if seq != stage.seq:
+            stage.seq = seq
+            stage.last_progress = now
+            if stage.state == StageState.STALLED:
+                logging.info("%s recovered", stage.name)
+                stage.backoff.reset()
+            self.set_state(stage, StageState.OK)
+        age = now - stage.last_progress
+        stage.age_gauge.set(age)
+        if age <= stage.budget:
+            return
+        if stage.state == StageState.OK:
+            logging.error("%s stalled, no progress for %.1f s", stage.name, age)
+            stage.stalls.inc()
+            stage.next_recovery = now
+            self.set_state(stage, StageState.STALLED)
+        if stage.recover is None or now < stage.next_recovery:
+            return
+        stage.recoveries.inc()
+        stage.next_recovery = now + stage.backoff.next()
+        try:
+            stage.recover()
+        except Exception:
+            logging.exception("Could not recover %s", stage.name)
+
+    def poll(self):
+        """
+        Checks every stage once.
+        """
+        with self._lock:
+            stages = list(self.stages)
+        for stage in stages:
+            self.check(stage, self.clock.now())
+        self.tracking_stalled = any(stage.tracking and stage.state == StageState.STALLED for stage in stages)
+        if not self.tracking_stalled:
+            return
+        if self.robot_tracker is not None:
+            for robot in list(self.robot_tracker.get().values()):
+                robot.found = False
+        message = self.broadcaster.message if self.broadcaster is not None else None
+        if message is not None and len(message.robots) > 0:
+            # a running game loop already leaves the robots out, a stalled one would keep its last positions
+            self._no_robots.time_dsec = message.time_dsec
+            self._no_robots.enabled = message.enabled
+            self.broadcaster.set_message(self._no_robots)
+
+    def run(self):
+        while not self.stopped:
+            self.poll()
+            self.clock.sleep(self.poll_interval)
+
+    def stop(self):
+        self.stopped = True
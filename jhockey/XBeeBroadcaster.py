@@ -1,9 +1,19 @@
 from __future__ import annotations
-from threading import Thread
+from threading import Thread, Event
+import time
 from typing import Protocol
 from .types import PuckState, RobotState, Team, BroadcasterMessage, GameState
+from .Metrics import metrics
 from digi.xbee.devices import XBeeDevice
+from digi.xbee.models.address import XBee64BitAddress
+from digi.xbee.packets.base import XBeePacket
+from .XBeeTransmitter import XBeeTransmitter
+from .BroadcastEncoder import BroadcastEncoder
+from digi.xbee.exception import XBeeException
 import serial
+import logging
+import json
+import math
 
 class ThreadedNode(Protocol):
     def get(self) -> PuckState | dict[Team, list[RobotState]] | dict[int, RobotState]:
@@ -52,24 +62,345 @@ class PausableTimer(Protocol):
         ...
 
 
+# 802.15.4 PHY bit rate and per-frame overhead (preamble, SFD, length, MAC header, FCS) in bytes
+RADIO_BITRATE = 250_000
+RADIO_FRAME_OVERHEAD_BYTES = 25
+
+
+class RoundRobinScheduler:
+    """
+    Sends the robot set as fragments in round-robin order under an airtime budget.
+    Every robot is carried once per cycle, so each robot is updated at least
+    (budget frame rate) / (fragment count) times per second.
+    """
+
+    def __init__(self, airtime_budget: float = 0.25, max_bytes: int = None):
+        """
+        Parameters
+        ----------
+        airtime_budget : float, optional
+            The fraction of the radio channel the broadcaster may occupy, by default 0.25
+        max_bytes : int, optional
+            The maximum fragment size, by default the XBee payload size
+        """
+        if not 0 < airtime_budget <= 1:
+            raise ValueError("Airtime budget must be in (0, 1]")
+        self.airtime_budget = airtime_budget
+        self.max_bytes = BroadcasterMessage._max_bytes if max_bytes is None else max_bytes
+        self.seq = 0
+        self.index = 0
+        self._next_send = None
+
+    @staticmethod
+    def airtime(n_bytes: int) -> float:
+        """
+        Returns the time in seconds a frame with n_bytes of payload occupies the channel.
+        """
+        return (n_bytes + RADIO_FRAME_OVERHEAD_BYTES) * 8 / RADIO_BITRATE
+
+    def min_update_rate(self, msg: BroadcasterMessage) -> float:
+        """
+        Returns the guaranteed update rate in Hz of every robot in msg that fits in the fragments.
+        """
+        frame_rate = self.airtime_budget / self.airtime(self.max_bytes)
+        return frame_rate / msg.fragment_count(self.max_bytes)
+
+    def next_fragment(self, msg: BroadcasterMessage) -> str:
+        """
+        Returns the next fragment in round-robin order and advances the sequence id.
+        """
+        frame = msg.fragment(self.index, self.seq, self.max_bytes)
+        self.index = (self.index + 1) % msg.fragment_count(self.max_bytes)
+        self.seq = (self.seq + 1) % 256
+        return frame
+
+    def pace(self, n_bytes: int):
+        """
+        Sleeps until the airtime budget allows the next frame after one of n_bytes was sent.
+        """
+        now = time.perf_counter()
+        if self._next_send is None or self._next_send < now:
+            self._next_send = now
+        self._next_send += self.airtime(n_bytes) / self.airtime_budget
+        delay = self._next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptiveRateController:
+    """
+    Chooses the broadcast rate from robot motion, game state and link quality.
+    During a match the rate follows the fastest robot, so no robot moves more than position_tolerance
+    between two updates. Outside a match it drops to min_rate. When sends fail, the rate backs off
+    in proportion to the failure rate.
+    """
+
+    REASONS = ("idle", "stationary", "motion", "max_rate", "link_failures")
+
+    def __init__(
+        self,
+        min_rate: float = 1.0,
+        max_rate: float = 30.0,
+        position_tolerance: float = 1.0,
+        failure_threshold: float = 0.2,
+        alpha: float = 0.3,
+        speed_decay: float = 0.5,
+    ):
+        """
+        Parameters
+        ----------
+        min_rate : float, optional
+            The lowest broadcast rate in Hz, used between matches, by default 1.0
+        max_rate : float, optional
+            The highest broadcast rate in Hz, by default 30.0
+        position_tolerance : float, optional
+            The distance in field units a robot may move between updates, by default 1.0 (the broadcast resolution)
+        failure_threshold : float, optional
+            The fraction of failed sends above which the rate backs off, by default 0.2
+        alpha : float, optional
+            The smoothing factor of the failure rate, by default 0.3
+        speed_decay : float, optional
+            The time constant in seconds with which the speed estimate decays once robots slow down, by default 0.5
+        """
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("Rates must satisfy 0 < min_rate <= max_rate")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.position_tolerance = position_tolerance
+        self.failure_threshold = failure_threshold
+        self.alpha = alpha
+        self.speed_decay = speed_decay
+        self.speed = 0.0
+        self.failure_rate = 0.0
+        self.rate = max_rate
+        self.reason = "max_rate"
+        self._positions: dict[int, tuple[float, float]] = {}
+        self._last_time = None
+        self._sent = 0
+        self._failed = 0
+        self._rate_gauge = metrics.gauge("broadcast_rate_hz")
+        self._speed_gauge = metrics.gauge("broadcast_robot_speed")
+        self._failure_gauge = metrics.gauge("broadcast_failure_rate")
+        self._reason_gauges = {reason: metrics.gauge("broadcast_rate_reason", reason=reason) for reason in self.REASONS}
+
+    def observe_motion(self, msg: BroadcasterMessage, now: float) -> float:
+        """
+        Updates the smoothed top robot speed from the pose deltas since the last call.
+        The robot states are updated in place by the tracker, so positions are copied here.
+        """
+        fastest = 0.0
+        dt = now - self._last_time if self._last_time is not None else 0.0
+        positions = {}
+        # snapshot the robots, which the tracker may add to from its own thread
+        for tag, robot in list(msg.robots.items()):
+            if not robot.found:
+                continue
+            positions[tag] = (robot.x, robot.y)
+            previous = self._positions.get(tag)
+            if previous is not None and dt > 0:
+                fastest = max(fastest, math.hypot(robot.x - previous[0], robot.y - previous[1]) / dt)
+        self._positions = positions
+        self._last_time = now
+        # follow speed-ups immediately, decay slowly so a robot that pauses briefly stays well served
+        self.speed = max(fastest, self.speed * math.exp(-dt / self.speed_decay))
+        return self.speed
+
+    def observe_link(self, sent: int, failed: int) -> float:
+        """
+        Updates the smoothed failure rate from the send totals.
+        """
+        d_sent, d_failed = sent - self._sent, failed - self._failed
+        self._sent, self._failed = sent, failed
+        if d_sent + d_failed > 0:
+            self.failure_rate += self.alpha * (d_failed / (d_sent + d_failed) - self.failure_rate)
+        return self.failure_rate
+
+    def update(self, msg: BroadcasterMessage, sent: int, failed: int, now: float = None) -> float:
+        """
+        Returns the rate in Hz for the next send and records it, with the reason, in the metrics.
+        @param sent: total frames sent so far
+        @param failed: total failed sends so far
+        """
+        now = time.perf_counter() if now is None else now
+        speed = self.observe_motion(msg, now)
+        failure_rate = self.observe_link(sent, failed)
+        if not msg.enabled:
+            rate, reason = self.min_rate, "idle"
+        else:
+            rate = speed / self.position_tolerance
+            if rate <= self.min_rate:
+                rate, reason = self.min_rate, "stationary"
+            elif rate >= self.max_rate:
+                rate, reason = self.max_rate, "max_rate"
+            else:
+                reason = "motion"
+        if failure_rate > self.failure_threshold:
+            rate, reason = max(self.min_rate, rate * (1 - failure_rate)), "link_failures"
+        if reason != self.reason:
+            self._reason_gauges[self.reason].set(0)
+        self._reason_gauges[reason].set(1)
+        self.rate, self.reason = rate, reason
+        self._rate_gauge.set(rate)
+        self._speed_gauge.set(speed)
+        self._failure_gauge.set(failure_rate)
+        return rate
+
+
+def load_robot_addresses(config: str = "config.json") -> dict[int, XBee64BitAddress]:
+    """
+    Loads the robot tag ID to 64-bit XBee address registry used by unicast mode.
+    Robots are listed in the config file as, for example:
+    "robots": [
+        {
+            "id": 4,
+            "address": "0013A20041B1C2D3"
+        }
+    ]
+    """
+    config = json.load(open(config, "r"))
+    return {
+        int(robot["id"]): XBee64BitAddress.from_hex_string(robot["address"])
+        for robot in config.get("robots", [])
+        if "address" in robot
+    }
+
+
 class XBeeBroadcaster:
     """
     Class to broadcast location information to each team via XBee protocol.
     """
 
-    def __init__(self, port="/dev/ttyUSB0"):
+    def __init__(
+        self,
+        port="/dev/ttyUSB0",
+        fragmented: bool = False,
+        airtime_budget: float = 0.25,
+        pipelined: bool = False,
+        queue_size: int = 4,
+        max_age: float = 0.1,
+        robot_addresses: dict[int, XBee64BitAddress] = None,
+        rate_controller: AdaptiveRateController = None,
+    ):
+        """
+        Parameters
+        ----------
+        port : str, optional
+            The serial port of the XBee, by default "/dev/ttyUSB0"
+        fragmented : bool, optional
+            Split the robots into round-robin fragments instead of one truncated message, by default False
+        airtime_budget : float, optional
+            The fraction of the radio channel fragmented mode may occupy, by default 0.25
+        pipelined : bool, optional
+            Write API frames without waiting for each TX status, by default False
+        queue_size : int, optional
+            The transmit queue length in pipelined mode, by default 4
+        max_age : float, optional
+            Messages queued longer than this many seconds are dropped in pipelined mode, by default 0.1
+        robot_addresses : dict[int, XBee64BitAddress], optional
+            Enables unicast mode: each robot only receives a short packet with its own pose, sent to
+            its address through the pipelined transmitter, by default None (broadcast).
+            Raises ValueError if it is empty, as no robot would receive anything
+        rate_controller : AdaptiveRateController, optional
+            Paces sends by robot motion, game state and failures instead of sending as fast as
+            the mode allows, by default None
+        """
+        if robot_addresses is not None and len(robot_addresses) == 0:
+            raise ValueError("Unicast mode needs at least one robot address")
         self.xbee = XBeeDevice(port, 115200)
         # self.xbee = serial.Serial(port, 115200)
-        self.xbee.open()
+        self.port = port
+        self.name = "XBee Broadcaster"
+        self.connected = False
         self.stopped = False
         self.message = None
+        self.encoder = BroadcastEncoder()
+        self._new_message = Event()
+        self.transmitter = None
+        self.robot_addresses = robot_addresses
+        on_status = None
+        if robot_addresses is not None:
+            if not pipelined:
+                logging.info("Unicast mode uses the pipelined transmitter")
+            pipelined = True
+            # every robot gets one packet per message, so the queue must hold a full round
+            queue_size = max(queue_size, len(robot_addresses))
+            on_status = self.on_unicast_status
+            self._robot_ids = {address: tag for tag, address in robot_addresses.items()}
+            self._unicast_latency = {
+                tag: metrics.histogram("unicast_latency_seconds", robot=str(tag)) for tag in robot_addresses
+            }
+            self._unicast_delivered = {
+                tag: metrics.counter("unicast_frames", robot=str(tag), result="delivered") for tag in robot_addresses
+            }
+            self._unicast_failed = {
+                tag: metrics.counter("unicast_frames", robot=str(tag), result="failed") for tag in robot_addresses
+            }
+        if pipelined:
+            self.transmitter = XBeeTransmitter(
+                self.send_packet,
+                queue_size=queue_size,
+                max_age=max_age,
+                on_status=on_status,
+            )
         self.game_state = GameState.STOPPED
         self.threading = False
+        self.scheduler = RoundRobinScheduler(airtime_budget) if fragmented else None
+        self.rate_controller = rate_controller
+        self.frames_sent = 0
+        self._last_send = None
+        self._last_enabled = None
+        self._stage = metrics.stage("broadcast")
+        self._failures = metrics.counter("broadcast_failures", reason="send")
+        self._bytes_out = metrics.counter("serial_bytes", link="xbee", direction="out")
+        self._min_robot_rate = metrics.gauge("broadcast_min_robot_rate_hz")
+        self._dropped_robots = metrics.gauge("broadcast_robots_dropped")
+
+    def connect(self):
+        """
+        Opens the radio once, raising on failure. Called by a DeviceSupervisor.
+        """
+        if self.xbee.is_open():
+            # the port is still held from before the link dropped
+            self.xbee.close()
+        self.xbee.open()
+        if self.transmitter is not None:
+            # the packet listener outlives a close, so drop the callback of an earlier connect
+            # before adding it, or every reconnect would deliver each TX status once more
+            self.xbee.del_packet_received_callback(self.transmitter.on_packet)
+            self.xbee.add_packet_received_callback(self.transmitter.on_packet)
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+        try:
+            self.xbee.close()
+        except (XBeeException, serial.SerialException) as e:
+            logging.warning("Could not close XBee on %s: %s", self.port, e)
+
+    def check_link(self, e: Exception):
+        """
+        Marks the radio disconnected if a failed write was caused by the serial port going away.
+        """
+        if isinstance(e, serial.SerialException) or not self.xbee.is_open() or not self.xbee.serial_port.is_interface_open:
+            logging.error("XBee on %s disconnected: %s", self.port, e)
+            self.connected = False
+
+    def send_packet(self, packet: XBeePacket):
+        """
+        Writes one API packet without waiting for the TX status, used by the pipelined transmitter.
+        """
+        try:
+            self.xbee.send_packet(packet, sync=False)
+        except (XBeeException, serial.SerialException) as e:
+            self.check_link(e)
+            raise
 
     def start(self) -> XBeeBroadcaster:
         """
-        Starts the broadcaster.
+        Starts the broadcaster. Frames are only sent while the radio is connected.
         """
+        if self.transmitter is not None:
+            self.transmitter.start()
         t = Thread(target=self.run, name="XBee Broadcaster")
         t.daemon = True
         t.start()
@@ -83,16 +414,131 @@ class XBeeBroadcaster:
         while True:
             if self.stopped:
                 return
+            if not self.connected:
+                time.sleep(0.05)
+                continue
             if self.message is None:
+                self._new_message.wait(timeout=0.5)
                 continue
-            self.broadcast(self.message)
+            if self.rate_controller is not None:
+                msg = self.wait_for_slot()
+                self._new_message.clear()
+                if self.stopped:
+                    return
+                if self.robot_addresses is not None:
+                    self.unicast(msg)
+                elif self.scheduler is not None:
+                    self.broadcast_fragment(msg)
+                else:
+                    self.broadcast(msg)
+            elif self.robot_addresses is not None:
+                if self._new_message.wait(timeout=0.5):
+                    self._new_message.clear()
+                    self.unicast(self.message)
+            elif self.scheduler is not None:
+                self.broadcast_fragment(self.message)
+            elif self.transmitter is not None:
+                # queueing is instant, so only hand over messages the game manager has not sent yet
+                if self._new_message.wait(timeout=0.5):
+                    self._new_message.clear()
+                    self.broadcast(self.message)
+            else:
+                self.broadcast(self.message)
+
+    def link_totals(self) -> tuple[int, int]:
+        """
+        Returns the total frames sent and failed sends, for the rate controller.
+        """
+        if self.transmitter is not None:
+            return self.transmitter.frames_sent, self.transmitter.failures
+        return self.frames_sent, int(self._failures.value)
+
+    def wait_for_slot(self) -> BroadcasterMessage:
+        """
+        Sleeps until the adaptive rate allows the next send and returns the latest message.
+        A change of the enabled flag (match start or stop) is sent immediately.
+        """
+        while True:
+            # the rate is re-evaluated while waiting, so robots starting to move shorten the wait
+            msg = self.message
+            rate = self.rate_controller.update(msg, *self.link_totals())
+            if self._last_send is None or self.stopped or msg.enabled != self._last_enabled:
+                break
+            # in fragmented mode the rate applies to full cycles over the robot set
+            frames = msg.fragment_count(self.scheduler.max_bytes) if self.scheduler is not None else 1
+            remaining = self._last_send + 1 / (rate * frames) - time.perf_counter()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.05))
+        self._last_send = time.perf_counter()
+        self._last_enabled = msg.enabled
+        return msg
+
+    def unicast(self, msg: BroadcasterMessage):
+        """
+        Queues one short packet per registered robot, interleaved in the transmit pipeline.
+        @param msg: BroadcasterMessage to send
+        """
+        for tag, address in self.robot_addresses.items():
+            self.transmitter.submit(msg.unicast(tag).encode(), address)
+
+    def on_unicast_status(self, address: XBee64BitAddress, latency: float, success: bool):
+        """
+        Records per-robot latency and delivery from the transmit status of a unicast packet.
+        """
+        tag = self._robot_ids.get(address)
+        if tag is None:
+            return
+        self._unicast_latency[tag].observe(latency)
+        if success:
+            self._unicast_delivered[tag].inc()
+        else:
+            self._unicast_failed[tag].inc()
+
+    def broadcast_fragment(self, msg: BroadcasterMessage):
+        """
+        Broadcasts the next round-robin fragment of msg and waits for the airtime budget.
+        @param msg: BroadcasterMessage to broadcast
+        """
+        data = self.scheduler.next_fragment(msg)
+        self._min_robot_rate.set(self.scheduler.min_update_rate(msg))
+        dropped = msg.dropped_robots(self.scheduler.max_bytes)
+        if dropped != self._dropped_robots.value:
+            # logged when the count changes rather than with every fragment
+            if dropped:
+                logging.warning("Broadcast needs more than %d fragments, dropping %d robots", BroadcasterMessage._max_fragments, dropped)
+            self._dropped_robots.set(dropped)
+        self.send(data)
+        self.scheduler.pace(len(data))
 
     def broadcast(self, msg: BroadcasterMessage):
         """
         Broadcasts data to robots.
         @param data: BroadcasterMessage to broadcast
         """
-        self.xbee.send_data_broadcast(str(msg))
+        # copied out of the encoder's buffer, which the next message reuses
+        self.send(bytes(self.encoder.encode(msg)))
+
+    def send(self, data: str | bytes):
+        """
+        Sends one frame to all robots.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        if self.transmitter is not None:
+            self.transmitter.submit(data)
+            return
+        t0 = self._stage.begin()
+        try:
+            self.xbee.send_data_broadcast(data)
+        except (XBeeException, serial.SerialException) as e:
+            self._failures.inc()
+            self.check_link(e)
+            logging.warning("Broadcast failed: %s", e)
+            return
+        self._bytes_out.inc(len(data))
+        self.frames_sent += 1
+        self._stage.end(t0)
         # self.xbee.write(str(msg).encode())
         
     def get(self) -> BroadcasterMessage:
@@ -106,9 +552,12 @@ class XBeeBroadcaster:
         Stops the broadcaster.
         """
         self.stopped = True
+        if self.transmitter is not None:
+            self.transmitter.stop()
 
     def set_message(self, message: BroadcasterMessage):
         """
         Sets the message to be broadcast.
         """
         self.message = message
+        self._new_message.set()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from collections import deque
+from threading import Thread, Event
+from typing import Callable
+from digi.xbee.packets.base import XBeePacket
+from digi.xbee.packets.raw import TX64Packet, TXStatusPacket
+from digi.xbee.models.address import XBee64BitAddress
+from digi.xbee.models.options import TransmitOptions
+from digi.xbee.models.status import TransmitStatus
+from .Metrics import metrics
+import logging
+import time
+
+
+class XBeeTransmitter:
+    """
+    Pipelined XBee transmit path.
+    Payloads are queued in a bounded queue and written as 802.15.4 TX64 API frames by a sender thread
+    without waiting for the TX status. TX status frames are matched to their frame ID as they arrive,
+    off the hot path, and up to max_in_flight frames may be awaiting their status at once.
+    When the queue is full the oldest payload is dropped, and payloads that waited longer than max_age
+    are dropped instead of sent, so the radio only ever carries fresh poses.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[XBeePacket], None],
+        queue_size: int = 4,
+        max_age: float = 0.1,
+        max_in_flight: int = 4,
+        status_timeout: float = 0.5,
+        on_status: Callable[[XBee64BitAddress, float, bool], None] = None,
+        name="XBee Transmitter",
+    ):
+        """
+        Parameters
+        ----------
+        send : Callable[[XBeePacket], None]
+            Writes one API packet without waiting for a response,
+            i.e. partial(XBeeDevice.send_packet, sync=False)
+        queue_size : int, optional
+            The maximum number of queued payloads, by default 4
+        max_age : float, optional
+            Payloads older than this many seconds are dropped as stale, by default 0.1
+        max_in_flight : int, optional
+            The maximum number of frames written but not yet acknowledged by a TX status, by default 4.
+            This keeps frames from piling up in the serial buffers where they can no longer be dropped.
+        status_timeout : float, optional
+            Frames without a TX status after this many seconds are counted as missing, by default 0.5
+        on_status : Callable[[XBee64BitAddress, float, bool], None], optional
+            Called from the status callback with the destination, the time from write to TX status
+            and whether delivery succeeded, by default None
+        name : str, optional
+            The name of the sender thread, by default "XBee Transmitter"
+        """
+        self.send = send
+        self.queue: deque[tuple[float, bytes, XBee64BitAddress]] = deque(maxlen=queue_size)
+        self.max_age = max_age
+        self.max_in_flight = max_in_flight
+        self.status_timeout = status_timeout
+        self.on_status = on_status
+        self.name = name
+        self.stopped = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self._ready = Event()
+        self._acked = Event()
+        self._frame_id = 0
+        # frame ID -> (time sent, destination), written by the sender and popped by the status callback
+        self._pending: dict[int, tuple[float, XBee64BitAddress]] = {}
+        self._stage = metrics.stage("xbee_transmit")
+        self._bytes_out = metrics.counter("serial_bytes", link="xbee", direction="out")
+        self._overflow = metrics.counter("xbee_tx_dropped", reason="overflow")
+        self._stale = metrics.counter("xbee_tx_dropped", reason="stale")
+        self._missing = metrics.counter("xbee_tx_status_missing")
+        self._write_failures = metrics.counter("broadcast_failures", reason="write")
+        self._status_failures = metrics.counter("broadcast_failures", reason="tx_status")
+        self._queue_delay = metrics.histogram("xbee_queue_delay_seconds")
+        self._status_latency = metrics.histogram("xbee_tx_status_latency_seconds")
+
+    def start(self) -> XBeeTransmitter:
+        """
+        Starts the sender thread.
+        """
+        t = Thread(target=self.run, name=self.name)
+        t.daemon = True
+        t.start()
+        return self
+
+    def submit(self, data: bytes, address: XBee64BitAddress = XBee64BitAddress.BROADCAST_ADDRESS):
+        """
+        Queues a payload without blocking. If the queue is full, the oldest payload is dropped.
+        """
+        if len(self.queue) == self.queue.maxlen:
+            self._overflow.inc()
+        self.queue.append((time.perf_counter(), data, address))
+        self._ready.set()
+
+    @property
+    def failures(self) -> int:
+        """
+        Returns the number of failed writes and unsuccessful TX statuses so far.
+        """
+        return int(self._write_failures.value + self._status_failures.value)
+
+    def next_frame_id(self) -> int:
+        # frame ID 0 disables the TX status, so cycle through 1-255
+        self._frame_id = self._frame_id % 255 + 1
+        return self._frame_id
+
+    def wait_for_window(self):
+        """
+        Blocks the sender until fewer than max_in_flight frames await a TX status.
+        """
+        while len(self._pending) >= self.max_in_flight and not self.stopped:
+            self._acked.clear()
+            if self._acked.wait(timeout=self.status_timeout):
+                continue
+            # no status arrived in time, give up on the frames that timed out
+            now = time.perf_counter()
+            for frame_id, (sent_at, _) in list(self._pending.items()):
+                if now - sent_at > self.status_timeout and self._pending.pop(frame_id, None):
+                    self._missing.inc()
+
+    def run(self):
+        while not self.stopped:
+            if not self._ready.wait(timeout=0.5):
+                continue
+            self._ready.clear()
+            while self.queue and not self.stopped:
+                self.wait_for_window()
+                if not self.queue:
+                    break
+                queued_at, data, address = self.queue.popleft()
+                t0 = self._stage.begin()
+                delay = t0 - queued_at
+                if delay > self.max_age:
+                    self._stale.inc()
+                    continue
+                self._queue_delay.observe(delay)
+                frame_id = self.next_frame_id()
+                if frame_id in self._pending:
+                    # wrapped around all 255 frame IDs without a status for this one
+                    self._missing.inc()
+                packet = TX64Packet(frame_id, address, TransmitOptions.NONE.value, rf_data=data)
+                self._pending[frame_id] = (time.perf_counter(), address)
+                try:
+                    self.send(packet)
+                except Exception as e:
+                    self._pending.pop(frame_id, None)
+                    self._write_failures.inc()
+                    logging.warning("XBee transmit failed: %s", e)
+                    continue
+                self.frames_sent += 1
+                self.bytes_sent += len(data)
+                self._bytes_out.inc(len(data))
+                self._stage.end(t0)
+
+    def on_packet(self, packet: XBeePacket):
+        """
+        Packet received callback, i.e. for XBeeDevice.add_packet_received_callback.
+        Ignores everything but TX status frames.
+        """
+        if isinstance(packet, TXStatusPacket):
+            self.on_tx_status(packet.frame_id, packet.transmit_status)
+
+    def on_tx_status(self, frame_id: int, status: TransmitStatus):
+        sent = self._pending.pop(frame_id, None)
+        self._acked.set()
+        if sent is None:
+            return
+        latency = time.perf_counter() - sent[0]
+        self._status_latency.observe(latency)
+        success = status == TransmitStatus.SUCCESS
+        if not success:
+            self._status_failures.inc()
+            logging.info("XBee TX status for frame %d: %s", frame_id, status.description)
+        if self.on_status is not None:
+            self.on_status(sent[1], latency, success)
+
+    def stop(self):
+        self.stopped = True
+        self._ready.set()
+        self._acked.set()
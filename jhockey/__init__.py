@@ -1,11 +1,69 @@
-from .CameraArucoDetector import CameraArucoDetector
-from .ThreadedCamera import ThreadedCamera
-from .RobotTracker import RobotTracker
-from .PuckTracker import PuckTracker
-from .JeVoisArucoDetector import JeVoisArucoDetector
-from .FieldHomography import FieldHomography
-from .GameGUI import GameGUI
-from .GameManager import GameManager
-from .PausableTimer import PausableTimer
-from .XBeeBroadcaster import XBeeBroadcaster
-from .types import *
\ No newline at end of file
+from importlib import import_module
+import sys
+from .types import *
+
+# Submodules pull in heavy dependencies (cv2, nicegui, digi-xbee), so they are only imported
+# when one of their names is first accessed, i.e. once a backend has been chosen.
+_lazy_imports = {
+    "CameraArucoDetector": ".CameraArucoDetector",
+    "ThreadedCamera": ".ThreadedCamera",
+    "RobotTracker": ".RobotTracker",
+    "PuckTracker": ".PuckTracker",
+    "JeVoisArucoDetector": ".JeVoisArucoDetector",
+    "JeVoisSimulator": ".JeVoisSimulator",
+    "FieldHomography": ".FieldHomography",
+    "FieldLUT": ".FieldLUT",
+    "FieldMask": ".FieldMask",
+    "load_field_boundary": ".FieldMask",
+    "MultiCameraFusion": ".MultiCameraFusion",
+    "GameGUI": ".GameGUI",
+    "HeadlessGUI": ".HeadlessGUI",
+    "RemoteGUI": ".GUIProcess",
+    "GUISnapshot": ".GUIProcess",
+    "GameManager": ".GameManager",
+    "PausableTimer": ".PausableTimer",
+    "WallClock": ".Clock",
+    "VirtualClock": ".Clock",
+    "XBeeBroadcaster": ".XBeeBroadcaster",
+    "load_robot_addresses": ".XBeeBroadcaster",
+    "AdaptiveRateController": ".XBeeBroadcaster",
+    "BroadcastEncoder": ".BroadcastEncoder",
+    "DeviceSupervisor": ".DeviceSupervisor",
+    "Backoff": ".DeviceSupervisor",
+    "Watchdog": ".Watchdog",
+    "restart": ".Watchdog",
+    "TrajectoryStore": ".TrajectoryStore",
+    "MatchTrajectory": ".TrajectoryStore",
+    "BatchConfig": ".VideoBatch",
+    "process_video": ".VideoBatch",
+    "GoalDetector": ".GoalDetector",
+    "GoalRegion": ".GoalDetector",
+    "load_goal_regions": ".GoalDetector",
+    "TagRegistry": ".TagRegistry",
+    "TagRole": ".TagRegistry",
+    "TagPartition": ".TagRegistry",
+    "StateStream": ".StateStream",
+    "add_stream_route": ".StateStream",
+    "decode_snapshot": ".StateStream",
+    "SamplingProfiler": ".Profiler",
+    "MetricsRegistry": ".Metrics",
+    "metrics": ".Metrics",
+    "add_metrics_route": ".Metrics",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_imports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import_module(_lazy_imports[name], __name__)
+    # Importing a submodule binds the module object to its name on this package (i.e. jhockey.GameGUI),
+    # which would shadow the class of the same name, so rebind every loaded name to its object.
+    for lazy_name, module in _lazy_imports.items():
+        loaded = sys.modules.get(__name__ + module)
+        if loaded is not None:
+            globals()[lazy_name] = getattr(loaded, lazy_name)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
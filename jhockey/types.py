@@ -5,6 +5,10 @@ from string import ascii_uppercase
 import logging
 
 
+def clamp(value: int, low: int, high: int) -> int:
+    return max(low, min(high, value))
+
+
 @dataclass
 class Point:
     x: float
@@ -34,6 +38,25 @@ class GameState(Enum):
     PAUSED = auto()
 
 
+class ConnectionState(Enum):
+    """
+    Enum to represent the connection state of a supervised device.
+    """
+
+    DISCONNECTED = auto()
+    CONNECTING = auto()
+    CONNECTED = auto()
+
+
+class StageState(Enum):
+    """
+    Enum to represent whether a watched pipeline stage is making progress.
+    """
+
+    OK = auto()
+    STALLED = auto()
+
+
 @dataclass
 class RobotState:
     x: int = 0  # cm
@@ -49,6 +72,14 @@ class PuckState:
     found: bool
 
 
+@dataclass
+class GoalEvent:
+    team: Team  # team that scored
+    crossing_time: float  # interpolated time the puck entered the goal, time.perf_counter()
+    frame_time: float  # time of the frame the goal was detected in
+    detected_time: float  # time the goal was raised
+
+
 @dataclass(kw_only=True)
 class BroadcasterMessage:
     time_dsec: int  # deciseconds until match end
@@ -64,15 +95,86 @@ class BroadcasterMessage:
             "enabled": self.enabled,
         }
 
+    # Fragmented mode: "@" enabled[1] time[4] seq[2, hex] index[1, hex] count[1, hex] ... id[3] x[3] y[3] ... checksum[2] ";"
+    _fragment_header_bytes = 10
+    _fragment_robot_bytes = 9
+    _trailer_bytes = 3
+    _max_fragments = 16
+
     def __str__(self) -> str:
-        message = f">{self.enabled:1}{self.time_dsec:04}" 
-        for i, tag in enumerate(self.robots.copy()):
+        parts = [f">{self.enabled:1}{self.time_dsec:04}"]
+        # snapshot the robots, which the tracker may add to while this runs
+        for i, (tag, robot) in enumerate(list(self.robots.items())):
             if i > 15:
                 logging.warning("Broadcast message is too large, truncating robots list")
                 break
-            message += f"{ascii_uppercase[tag-4]}{self.robots[tag].x_cm:03}{self.robots[tag].y_cm:03}"  
-        
-        message += f'B{0:03}{0:03}'
+            if not 4 <= tag < 4 + len(ascii_uppercase):
+                logging.warning("Robot ID %d cannot be broadcast without fragmented mode", tag)
+                continue
+            parts.append(f"{ascii_uppercase[tag-4]}{int(robot.x):03}{int(robot.y):03}")
+        parts.append(f'B{0:03}{0:03}')
+        message = "".join(parts)
+        # the message is ASCII, so the byte sum equals the sum of the character codes
+        cheksum = (sum(message.encode()) + ord(';')) % 64
+        return f"{message}{cheksum:02};"
+
+    @classmethod
+    def robots_per_fragment(cls, max_bytes: int = None) -> int:
+        """
+        Returns how many robots fit in one fragment of at most max_bytes.
+        """
+        max_bytes = cls._max_bytes if max_bytes is None else max_bytes
+        return (max_bytes - cls._fragment_header_bytes - cls._trailer_bytes) // cls._fragment_robot_bytes
+
+    def fragment_count(self, max_bytes: int = None) -> int:
+        """
+        Returns the number of fragments the robots are sent in, at most _max_fragments.
+        """
+        per_fragment = self.robots_per_fragment(max_bytes)
+        return clamp(-(-len(self.robots) // per_fragment), 1, self._max_fragments)
+
+    def dropped_robots(self, max_bytes: int = None) -> int:
+        """
+        Returns the number of robots with the highest IDs that do not fit in _max_fragments fragments.
+        """
+        return max(0, len(self.robots) - self._max_fragments * self.robots_per_fragment(max_bytes))
+
+    def unicast(self, tag: int) -> str:
+        """
+        Encodes the short packet sent to a single robot in unicast mode.
+        Format: "$" enabled[1] time[4] found[1] x[3] y[3] heading[3] checksum[2] ";" without spaces,
+        with the heading in centiradians wrapped to [0, 628).
+        """
+        robot = self.robots.get(tag)
+        if robot is None:
+            robot = RobotState(found=False)
+        message = (
+            f"${self.enabled:1}{self.time_dsec:04}{robot.found:1}"
+            f"{clamp(int(robot.x), 0, 999):03}{clamp(int(robot.y), 0, 999):03}{int(robot.heading) % 628:03}"
+        )
+        cheksum = sum([ord(c) for c in message] + [ord(';')]) % 64
+        message += f"{cheksum:02};"
+        return message
+
+    def fragment(self, index: int, seq: int, max_bytes: int = None) -> str:
+        """
+        Encodes one frame-sized chunk of the robot set for the fragmented broadcast mode.
+        Robots are chunked in ID order with 3-digit IDs, so any tag ID up to 999 can be sent.
+        @param index: index of the fragment, modulo the fragment count
+        @param seq: sequence id (mod 256) that lets receivers discard stale fragments
+        @param max_bytes: maximum frame size, by default the XBee payload size
+        """
+        per_fragment = self.robots_per_fragment(max_bytes)
+        # robots beyond the last fragment are dropped, see dropped_robots
+        count = self.fragment_count(max_bytes)
+        index %= count
+        # snapshot the robots, which the tracker may add to while this runs
+        robots = sorted(list(self.robots.items()), key=lambda item: item[0])[index * per_fragment : (index + 1) * per_fragment]
+        message = f"@{self.enabled:1}{self.time_dsec:04}{seq % 256:02X}{index:1X}{count:1X}"
+        message += "".join(
+            f"{tag:03}{clamp(int(robot.x), 0, 999):03}{clamp(int(robot.y), 0, 999):03}"
+            for tag, robot in robots
+        )
         cheksum = sum([ord(c) for c in message] + [ord(';')]) % 64
         message += f"{cheksum:02};"
         return message
@@ -88,4 +190,6 @@ class GUIData:
     robot_states: dict[int:RobotState]
     aruco_tags: list[AruCoTag]
     cam_connected: bool
-    broadcast_msg: BroadcasterMessage
\ No newline at end of file
+    broadcast_msg: BroadcasterMessage
+    radio_connected: Optional[bool] = None  # None when running without a radio
+    pending_goal: Optional[GoalEvent] = None  # detected goal awaiting confirmation
\ No newline at end of file
@@ -1,18 +1,49 @@
-from jhockey import GameGUI, FieldHomography, RobotTracker, PausableTimer, XBeeBroadcaster, GameManager
-from nicegui import ui
+import time
+
+start_time = time.perf_counter()
+
 import argparse
 import logging
+import sys
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--camera", type=int, default=None, help="Camera port, if not using JeVois.")
+parser.add_argument("--camera", type=int, nargs="+", default=None, help="Camera port(s), if not using JeVois. Detections from several cameras are fused.")
 parser.add_argument("--match-length", type=int, default=180, help="Match length in seconds. Defaults to 180 seconds.")
-parser.add_argument("--puck_tracking", action="store_true", help="Enable puck tracking.")
+parser.add_argument("--puck_tracking", action="store_true", help="Enable puck tracking, and goal detection if the config file lists goals.")
+parser.add_argument("--goal-debounce", type=float, default=2.0, help="Minimum seconds between detected goals. Defaults to 2 seconds.")
 parser.add_argument("--config", type=str, default="config.json", help="ArUco config .json file. Defaults to config.json.")
 parser.add_argument("--debug", action="store_true", help="Enable debug logging.")
 parser.add_argument("--debug-info", action="store_true", help="Enable debug logging at info level.")
 parser.add_argument("--radio_port", type=str, default=None,  help="Radio port (i.e., if using Zigbee).")
 parser.add_argument("--threaded", action="store_true", help="Enable threaded camera.")
+parser.add_argument("--jevois_port", type=str, nargs="+", default=["/dev/ttyACM0"], help="JeVois serial port(s). Detections from several cameras are fused. Defaults to /dev/ttyACM0.")
+parser.add_argument("--jevois_format", type=str, default="normal", choices=["normal", "compact", "binary"], help="JeVois output format, selected on the camera at connect. Defaults to normal.")
+parser.add_argument("--simulate", type=int, default=None, metavar="ROBOTS", help="Replace the JeVois with a simulator moving the given number of robots.")
+parser.add_argument("--simulate-cameras", type=int, default=1, help="Number of simulated JeVois cameras. Defaults to 1.")
+parser.add_argument("--fragmented", action="store_true", help="Broadcast robots in round-robin fragments (more than 16 robots, IDs up to 999).")
+parser.add_argument("--airtime_budget", type=float, default=0.25, help="Fraction of the radio channel used by fragmented broadcasts. Defaults to 0.25.")
+parser.add_argument("--pipelined", action="store_true", help="Write XBee frames without waiting for each transmit status.")
+parser.add_argument("--unicast", action="store_true", help="Send each robot only its own pose, using the XBee addresses in the config file.")
+parser.add_argument("--adaptive_rate", action="store_true", help="Adapt the broadcast rate to robot motion, game state and send failures.")
+parser.add_argument("--min_rate", type=float, default=1.0, help="Lowest adaptive broadcast rate in Hz. Defaults to 1.")
+parser.add_argument("--max_rate", type=float, default=30.0, help="Highest adaptive broadcast rate in Hz. Defaults to 30.")
+parser.add_argument("--position_tolerance", type=float, default=1.0, help="Distance a robot may move between adaptive broadcasts, in field units. Defaults to 1.")
+parser.add_argument("--calibration", type=str, nargs="+", default=None, help="Camera calibration .json file(s), one per --camera, enables lens correction of detected points.")
+parser.add_argument("--no-field-mask", action="store_true", help="Detect on full camera frames instead of cropping and masking them to the field.")
+parser.add_argument("--lut-cache", type=str, default="lut_cache", help="Directory for cached pixel-to-field lookup tables. Defaults to lut_cache.")
+parser.add_argument("--record", type=str, nargs="?", const="matches", default=None, help="Record robot and puck trajectories of every match to the given directory. Defaults to matches.")
+parser.add_argument("--headless", action="store_true", help="Run without the web UI, playing matches back to back (i.e. for soak tests).")
+parser.add_argument("--gui-process", action="store_true", help="Run the web UI in a separate process, so it cannot slow down tracking.")
+parser.add_argument("--stream", action="store_true", help="Stream robot, puck, time and score snapshots to WebSocket clients at /stream.")
+parser.add_argument("--stall-budget", type=float, default=0.5, help="Seconds a camera, detector or the game loop may go without progress before it is restarted and robots are marked not found. Defaults to 0.5.")
+parser.add_argument("--puck-stall-budget", type=float, default=2.0, help="Seconds the puck may go untracked before the tracker searches for it again. Defaults to 2.")
+parser.add_argument("--metrics", action="store_true", help="Serve pipeline metrics at /metrics.")
+parser.add_argument("--profile", type=float, nargs="?", const=10.0, default=None, help="Profile all threads for the given number of seconds at startup. Defaults to 10 seconds.")
+parser.add_argument("--profile-dir", type=str, default="profiles", help="Directory for profiler captures. Defaults to profiles.")
 args = parser.parse_args()
+if args.stream and (args.headless or args.gui_process):
+    # checked before any device or simulator is started
+    parser.error("--stream is served by the in-process web UI, so it cannot be combined with --headless or --gui-process")
 
 if args.debug_info:
     logging.basicConfig(level=logging.INFO)
@@ -21,26 +52,155 @@ elif args.debug:
 else:
     logging.basicConfig(level=logging.ERROR)
 
-gui = GameGUI()
+# heavy dependencies (cv2, nicegui, digi-xbee) are only imported once the backends are chosen below
+from jhockey import FieldHomography, RobotTracker, PausableTimer, GameManager, SamplingProfiler, DeviceSupervisor, TagRegistry, Watchdog, restart, metrics
+
+if args.radio_port is not None and args.unicast:
+    from jhockey import load_robot_addresses
+    # checked before any device is started, unicast cannot reach robots without an address
+    robot_addresses = load_robot_addresses(args.config)
+    if not robot_addresses:
+        parser.error("--unicast needs a \"robots\" list with XBee addresses in %s" % args.config)
+else:
+    robot_addresses = None
+
+profiler = SamplingProfiler(output_dir=args.profile_dir)
+if args.headless:
+    from jhockey import HeadlessGUI
+    gui = HeadlessGUI()
+elif args.gui_process:
+    from jhockey import RemoteGUI
+    gui = RemoteGUI(profiler=profiler, profile_window=args.profile or 10.0, serve_metrics=args.metrics)
+else:
+    from jhockey import GameGUI
+    gui = GameGUI(profiler=profiler, profile_window=args.profile or 10.0)
+# devices are opened and reopened in the background, so the UI comes up while they are missing
+supervisor = DeviceSupervisor()
+supervisor.add_listener(gui.on_device_state)
+# tag roles are loaded once and shared, so each frame is partitioned once
+tag_registry = TagRegistry(aruco_config=args.config)
+# one detector and field homography per camera, fused when there are several
+detectors = []
+homographies = []
+cameras = []
 if args.camera is None:
     from jhockey import JeVoisArucoDetector
-    aruco = JeVoisArucoDetector() if not args.threaded else JeVoisArucoDetector().start()
+    jevois_ports = args.jevois_port
+    if args.simulate is not None:
+        from jhockey import JeVoisSimulator
+        jevois_ports = [JeVoisSimulator(n_robots=args.simulate).start().port for _ in range(args.simulate_cameras)]
+    for i, port in enumerate(jevois_ports):
+        name = "JeVois ArUco Detector" if len(jevois_ports) == 1 else f"JeVois ArUco Detector {i}"
+        detector = JeVoisArucoDetector(name=name, port=port, output_mode=args.jevois_format)
+        supervisor.add(detector)
+        if args.threaded:
+            detector.start()
+        detectors.append(detector)
+        homographies.append(FieldHomography(param_file=args.config, tag_registry=tag_registry, name=name))
+else:
+    from jhockey import ThreadedCamera, CameraArucoDetector, FieldMask
+    calibrations = args.calibration or [None] * len(args.camera)
+    if len(calibrations) != len(args.camera):
+        parser.error("--calibration needs one file per --camera")
+    for src, calibration in zip(args.camera, calibrations):
+        cam = ThreadedCamera(src=src, name=f"Camera {src}").start()
+        supervisor.add(cam)
+        cameras.append(cam)
+        if calibration is not None:
+            from jhockey import FieldLUT
+            lut = FieldLUT.from_file(calibration, field_config=args.config, cache_dir=args.lut_cache, camera=src)
+        else:
+            lut = None
+        homography = FieldHomography(param_file=args.config, lut=lut, tag_registry=tag_registry, name=cam.name)
+        homographies.append(homography)
+        # frames are cropped and masked to the field once its tags have been seen
+        field_mask = None if args.no_field_mask else FieldMask(homography, field_config=args.config, name=f"detector {src}")
+        detectors.append(CameraArucoDetector(name=f"ArUco Detector {src}", field_mask=field_mask).start(cam))
+if len(detectors) == 1:
+    aruco, field_homography = detectors[0], homographies[0]
 else:
-    from jhockey import ThreadedCamera, CameraArucoDetector
-    cam = ThreadedCamera(src=args.camera).start()
-    aruco = CameraArucoDetector().start(cam)
-field_homography = FieldHomography()
-rob_track = RobotTracker(aruco_config=args.config) if not args.threaded else RobotTracker(aruco_config=args.config).start()
+    from jhockey import MultiCameraFusion
+    aruco = MultiCameraFusion(aruco_config=args.config, tag_registry=tag_registry)
+    for i, (detector, homography) in enumerate(zip(detectors, homographies)):
+        aruco.add(detector, homography, name=str(i))
+    field_homography = aruco.start()
+rob_track = RobotTracker(aruco_config=args.config, field_homography=field_homography, tag_registry=tag_registry)
+if args.threaded:
+    rob_track.start()
+if args.puck_tracking and len(cameras) == 0:
+    parser.error("--puck_tracking needs --camera")
 if args.puck_tracking:
-    from jhockey import PuckTracker
-    puck_track = PuckTracker(field_homography).start(aruco)
+    from jhockey import PuckTracker, GoalDetector, load_goal_regions
+    # the puck is tracked in the first camera's frames
+    if args.no_field_mask:
+        puck_mask = None
+    else:
+        # the puck tracker thread gets its own mask, which reuses a frame buffer
+        puck_mask = FieldMask(homographies[0], field_config=args.config, full_frame_interval=0, name="puck")
+    puck_track = PuckTracker(homographies[0], field_mask=puck_mask).start(cameras[0])
+    goals = load_goal_regions(args.config)
+    goal_detector = GoalDetector(goals, debounce=args.goal_debounce) if goals else None
 else:
     puck_track = None
+    goal_detector = None
 if args.radio_port is not None:
-    broadcaster = XBeeBroadcaster(port=args.radio_port).start()
+    from jhockey import XBeeBroadcaster, AdaptiveRateController
+    if args.adaptive_rate:
+        rate_controller = AdaptiveRateController(
+            min_rate=args.min_rate, max_rate=args.max_rate, position_tolerance=args.position_tolerance
+        )
+    else:
+        rate_controller = None
+    broadcaster = XBeeBroadcaster(
+        port=args.radio_port,
+        fragmented=args.fragmented,
+        airtime_budget=args.airtime_budget,
+        pipelined=args.pipelined,
+        robot_addresses=robot_addresses,
+        rate_controller=rate_controller,
+    ).start()
+    supervisor.add(broadcaster)
 else:
     broadcaster = None
-timer = PausableTimer()    
+supervisor.start()
+if args.record is not None:
+    from jhockey import TrajectoryStore
+    trajectory_store = TrajectoryStore(directory=args.record).start()
+else:
+    trajectory_store = None
+timer = PausableTimer()
+if args.stream:
+    from jhockey import StateStream
+    state_stream = StateStream()
+else:
+    state_stream = None
+# stalled stages are restarted and shown in the GUI, robots are not found while tracking is stalled
+watchdog = Watchdog(robot_tracker=rob_track, broadcaster=broadcaster)
+watchdog.add_listener(gui.on_stage_state)
+for cam in cameras:
+    watchdog.watch(cam.name, lambda cam=cam: cam.frame_count, args.stall_budget, restart(cam.name, start=cam.start, device=cam), tracking=True)
+for detector in detectors:
+    if args.camera is None:
+        start_detector = detector.start if args.threaded else None
+    else:
+        start_detector = lambda detector=detector: detector.start(detector.camera)
+    # with several cameras the fusion drops a stalled camera's detections by itself
+    watchdog.watch(
+        detector.name,
+        lambda detector=detector: detector.frame_count,
+        args.stall_budget,
+        restart(detector.name, start=start_detector, device=detector if args.camera is None else None),
+        tracking=len(detectors) == 1,
+    )
+if puck_track is not None:
+    watchdog.watch(
+        "Puck Tracker",
+        lambda: puck_track.frames_tracked,
+        args.puck_stall_budget,
+        restart("Puck Tracker", start=lambda: puck_track.start(puck_track.camera), reset=puck_track.reset),
+    )
+game_loop = metrics.stage("game_manager")
+watchdog.watch("Game Manager", lambda: game_loop.rate.count, args.stall_budget, tracking=True)
 gm = GameManager(
     match_length_sec=args.match_length,
     broadcaster=broadcaster,
@@ -50,6 +210,53 @@ gm = GameManager(
     aruco_detector=aruco,
     gui=gui,
     timer=timer,
+    trajectory_store=trajectory_store,
+    goal_detector=goal_detector,
+    tag_registry=tag_registry,
+    state_stream=state_stream,
+    watchdog=watchdog,
 ).start()
+watchdog.start()
+if args.profile is not None:
+    profiler.capture(args.profile)
+if args.headless:
+    print(f"Running headless after {time.perf_counter() - start_time:.2f} s")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if trajectory_store is not None:
+            trajectory_store.stop()
+    sys.exit(0)
+if args.gui_process:
+    print(f"Pipeline running after {time.perf_counter() - start_time:.2f} s")
+    # the GUI process exits on Ctrl+C like the in-process UI, the pipeline follows it
+    gui.wait()
+    if trajectory_store is not None:
+        trajectory_store.stop()
+    sys.exit(0)
+from nicegui import app, ui
+
+if args.metrics:
+    from jhockey import add_metrics_route
+    add_metrics_route(app)
+if state_stream is not None:
+    from jhockey import add_stream_route
+    add_stream_route(app, state_stream)
+
+
+def report_startup():
+    startup_seconds = time.perf_counter() - start_time
+    from jhockey import metrics
+    metrics.gauge("startup_seconds").set(startup_seconds)
+    print(f"UI ready after {startup_seconds:.2f} s")
+
+
+app.on_startup(report_startup)
+if trajectory_store is not None:
+    # finalize the match being recorded
+    app.on_shutdown(trajectory_store.stop)
 print("Starting UI...")
 ui.run(title="JHockey", reload=False, host="0.0.0.0", port=8080, show=False)
@@ -1,6 +1,90 @@
 #include <SoftwareSerial.h>
 SoftwareSerial XBee(A0, A1);
 
+// Set to 1 when the XBee runs main.py with PUSH_MODE = True. In push mode the XBee streams a
+// fixed-size binary record for every packet it receives, so the robot never polls with "?".
+// With 0 the sketch passes bytes through in both directions, as before.
+#define PUSH_MODE 0
+
+// Push record: sync[2] seq[1] flags[1] time[2] x[2] y[2] angle[2] age_ms[2] checksum[1], little-endian
+const uint8_t RECORD_SYNC_0 = 0xA5;
+const uint8_t RECORD_SYNC_1 = 0x5A;
+const uint8_t RECORD_BODY_LEN = 12;
+const uint8_t FLAG_MATCH = 1;
+const uint8_t FLAG_FOUND = 2;
+
+struct Pose {
+  uint8_t seq;
+  bool matchEnabled;
+  bool found;
+  uint16_t timeDeciseconds;
+  uint16_t x;
+  uint16_t y;
+  uint16_t angle;
+  uint16_t ageMs;          // age of the pose when the XBee sent the record
+  unsigned long receivedAt; // millis() when the record was read
+};
+
+Pose pose;
+unsigned long lostRecords = 0;
+
+uint16_t readU16(const uint8_t *buf) {
+  return (uint16_t)buf[0] | ((uint16_t)buf[1] << 8);
+}
+
+// Reads push records without blocking. Returns true when a new, valid record was stored in out.
+bool readPose(Pose &out) {
+  static uint8_t state = 0;  // 0: wait for sync 0, 1: wait for sync 1, 2: body, 3: checksum
+  static uint8_t body[RECORD_BODY_LEN];
+  static uint8_t len = 0;
+  static bool haveSeq = false;
+
+  while (XBee.available()) {
+    uint8_t b = XBee.read();
+    switch (state) {
+      case 0:
+        if (b == RECORD_SYNC_0) state = 1;
+        break;
+      case 1:
+        if (b == RECORD_SYNC_1) {
+          state = 2;
+          len = 0;
+        } else if (b != RECORD_SYNC_0) {
+          state = 0;
+        }
+        break;
+      case 2:
+        body[len++] = b;
+        if (len == RECORD_BODY_LEN) state = 3;
+        break;
+      case 3: {
+        state = 0;
+        uint8_t sum = 0;
+        for (uint8_t i = 0; i < RECORD_BODY_LEN; i++) sum += body[i];
+        if (sum != b) break;  // corrupted, resynchronize on the next sync bytes
+        if (haveSeq) lostRecords += (uint8_t)(body[0] - out.seq - 1);
+        haveSeq = true;
+        out.seq = body[0];
+        out.matchEnabled = body[1] & FLAG_MATCH;
+        out.found = body[1] & FLAG_FOUND;
+        out.timeDeciseconds = readU16(body + 2);
+        out.x = readU16(body + 4);
+        out.y = readU16(body + 6);
+        out.angle = readU16(body + 8);
+        out.ageMs = readU16(body + 10);
+        out.receivedAt = millis();
+        return true;
+      }
+    }
+  }
+  return false;
+}
+
+// Age of the current pose, including the time since the record was read.
+unsigned long poseAgeMs(const Pose &p) {
+  return p.ageMs + (millis() - p.receivedAt);
+}
+
 void setup() {
   XBee.begin(115200);
   Serial.begin(115200);
@@ -9,6 +93,27 @@ void setup() {
 
 void loop() {
 
+#if PUSH_MODE
+  if (readPose(pose)) {
+    Serial.print(pose.timeDeciseconds);
+    Serial.print(",");
+    Serial.print(pose.matchEnabled);
+    Serial.print(",");
+    if (pose.found) {
+      Serial.print(pose.x);
+      Serial.print(",");
+      Serial.print(pose.y);
+      Serial.print(",");
+      Serial.print(pose.angle);
+    } else {
+      Serial.print("not found");
+    }
+    Serial.print(" age ");
+    Serial.print(poseAgeMs(pose));
+    Serial.print(" ms, lost ");
+    Serial.println(lostRecords);
+  }
+#else
   if (Serial.available()) {
     XBee.write(Serial.read());
   }
@@ -16,5 +121,6 @@ void loop() {
   if (XBee.available()) {
     Serial.write(XBee.read());
   }
-  
-}
\ No newline at end of file
+#endif
+
+}
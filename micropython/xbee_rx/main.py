@@ -10,12 +10,24 @@ Date: 01/23/2024
 """
 
 import xbee
-from parse_string import parse_string
+import struct
+import time
+from parse_string import parse_string, parse_unicast, parse_fragment
 from sys import stdin, stdout
 
 # Unique ID for each robot
 ROBOT_ID = "BA"
 
+# 3-digit ArUco tag ID of this robot, used by the fragmented broadcast
+ROBOT_TAG = "004"
+
+# Push mode: instead of waiting for "?" from the robot, parse every packet once on arrival and stream
+# a fixed-size binary record to the UART (see README.md). Poll mode is kept for existing robot code.
+PUSH_MODE = False
+
+# In push mode, the last record is repeated with a growing age when no packet arrives for this long
+HEARTBEAT_MS = 100
+
 # Parsing parameters
 startLen = 1
 timeLen = 4
@@ -26,60 +38,160 @@ angleLen = 3
 # Store the parameters (Start Length, Time Length, Robot ID Length, Coordinate Length, Angle Length) in a list
 parsingParameters = [startLen, timeLen, robotIDLen, coordLen, angleLen]
 
-# Variable to store the last payload received
-last_payload = None
-
-while True:
-    # Check if there is any data to be received in a non-blocking way
-    payload = xbee.receive()
-
-    # If there is data, store it in last_payload
-    if payload:
-        last_payload = payload
-
-    # Read data from stdin
-    data = stdin.buffer.read()
-
-    # If data is received, start processing it
-    if data and data.decode() == "?":
-
-        if last_payload is not None:
-            # Decode the payload
-            receivedMsg = last_payload["payload"].decode("utf-8")
-
-            # If the payload is not empty, parse it
-            if receivedMsg:
-                # Find the start and end of the payload
-                start = receivedMsg.find(">")
-                end = receivedMsg.find(";") + 1
-
-                # If the start and end are found, parse the payload
-                if start != -1 and end != -1:
-                    # Extract the string from the payload
-                    string = receivedMsg[start:end]
+# Push record: sync[2] seq[1] flags[1] time[2] x[2] y[2] angle[2] age_ms[2] checksum[1], little-endian
+RECORD_SYNC = b"\xa5\x5a"
+RECORD_FORMAT = "<BBHHHHH"
+FLAG_MATCH = 1
+FLAG_FOUND = 2
+
+# Last fragment sequence id and the fragments received without this robot since
+fragmentState = {"seq": None, "missed": 0}
+
+
+def parse_payload(receivedMsg):
+    """
+    Parses one payload into (time, match bit, robot coordinates) strings, or None if it is incomplete.
+    Robot coordinates are "xxx,yyy,aaa", or all 9s if this robot is not in the payload.
+    """
+    # Find the start and end of the payload
+    start = receivedMsg.find(">")
+    end = receivedMsg.find(";") + 1
+    unicastStart = receivedMsg.find("$")
+    fragmentStart = receivedMsg.find("@")
+
+    # Fragments carry only some of the robots, so most of them do not change this robot's pose
+    if fragmentStart != -1 and end != 0:
+        parsedDict = parse_fragment(receivedMsg[fragmentStart:end], ROBOT_TAG, fragmentState, parsingParameters)
+        if parsedDict is None:
+            return None
+
+        if parsedDict["found"]:
+            robotCoords = parsedDict["robot"]
+        else:
+            robotCoords = "9" * (coordLen * 2) + "9" * angleLen
 
-                    # Parse the string
-                    parsedDict = parse_string(string, parsingParameters)
+        return parsedDict["time"], parsedDict["matchbit"], robotCoords
 
-                    # Check if the robot ID is a key in the dictionary
-                    if ROBOT_ID in parsedDict:
-                        # If the robot ID is a key in the dictionary, set the match time, match bit, and robot coordinates
-                        matchTime = parsedDict["time"]
-                        matchBit = parsedDict["matchbit"]
-                        robotCoords = parsedDict[ROBOT_ID]
+    # Unicast packets (addressed to this robot only) need no ROBOT_ID lookup
+    if unicastStart != -1 and end != 0:
+        parsedDict = parse_unicast(receivedMsg[unicastStart:end], parsingParameters)
 
+        if parsedDict["found"]:
+            robotCoords = parsedDict["robot"]
+        else:
+            robotCoords = "9" * (coordLen * 2) + "9" * angleLen
+
+        return parsedDict["time"], parsedDict["matchbit"], robotCoords
+
+    # If the start and end are found, parse the payload
+    if start != -1 and end != 0:
+        # Extract the string from the payload and parse it
+        parsedDict = parse_string(receivedMsg[start:end], parsingParameters)
+
+        # Check if the robot ID is a key in the dictionary
+        if ROBOT_ID in parsedDict:
+            return parsedDict["time"], parsedDict["matchbit"], parsedDict[ROBOT_ID]
+
+        # If the robot ID is not a key in the dictionary, set everything to 9s
+        return "9" * timeLen, "9", "9" * (coordLen * 2) + "9" * angleLen
+
+    return None
+
+
+def pack_record(seq, parsed, age_ms):
+    """
+    Packs a parsed payload into the fixed-size binary push record.
+    """
+    matchTime, matchBit, robotCoords = parsed
+    flags = FLAG_MATCH if matchBit == "1" else 0
+    coords = robotCoords.split(",")
+    try:
+        x, y, angle = int(coords[0]), int(coords[1]), int(coords[2])
+        flags |= FLAG_FOUND
+    except (ValueError, IndexError):
+        x, y, angle = 0, 0, 0
+    try:
+        matchTime = int(matchTime)
+    except ValueError:
+        matchTime = 0
+    body = struct.pack(RECORD_FORMAT, seq & 0xFF, flags, matchTime, x, y, angle, min(age_ms, 0xFFFF))
+    return RECORD_SYNC + body + bytes([sum(body) & 0xFF])
+
+
+def run_push():
+    seq = 0
+    parsed = None
+    received_at = 0
+    sent_at = 0
+    while True:
+        payload = xbee.receive()
+        now = time.ticks_ms()
+        if payload:
+            # parse once on arrival, not on every request
+            result = parse_payload(payload["payload"].decode("utf-8"))
+            if result is not None:
+                parsed = result
+                received_at = now
+                stdout.buffer.write(pack_record(seq, parsed, 0))
+                seq += 1
+                sent_at = now
+        elif parsed is not None and time.ticks_diff(now, sent_at) >= HEARTBEAT_MS:
+            stdout.buffer.write(pack_record(seq, parsed, time.ticks_diff(now, received_at)))
+            seq += 1
+            sent_at = now
+
+
+def run_poll():
+    # Variable to store the last payload received
+    last_payload = None
+
+    # Last pose parsed from a fragment, most fragments do not carry this robot
+    last_fragment = None
+
+    while True:
+        # Check if there is any data to be received in a non-blocking way
+        payload = xbee.receive()
+
+        # If there is data, store it in last_payload
+        if payload:
+            last_payload = payload
+
+            # Fragments are parsed on arrival, so the sequence ids and the robot's last pose are kept
+            receivedMsg = payload["payload"].decode("utf-8")
+            if receivedMsg.find("@") != -1:
+                parsed = parse_payload(receivedMsg)
+                if parsed is not None:
+                    last_fragment = parsed
+
+        # Read data from stdin
+        data = stdin.buffer.read()
+
+        # If data is received, start processing it
+        if data and data.decode() == "?":
+
+            if last_payload is not None:
+                # Decode the payload
+                receivedMsg = last_payload["payload"].decode("utf-8")
+
+                # If the payload is not empty, parse it
+                if receivedMsg:
+                    if receivedMsg.find("@") != -1:
+                        parsed = last_fragment
                     else:
-                        # If the robot ID is not a key in the dictionary, set everything to 9s
-                        matchTime = "9" * timeLen
-                        matchBit = "9"
-                        robotCoords = "9" * (coordLen * 2) + "9" * angleLen
+                        parsed = parse_payload(receivedMsg)
+                    if parsed is not None:
+                        # Create output string for stdout (Arduino/UART interface)
+                        out = parsed[0] + "," + parsed[1] + "," + parsed[2] + "\n"
 
-                    # Create output string for stdout (Arduino/UART interface)
-                    out = matchTime + "," + matchBit + "," + robotCoords + "\n"
+                        # Write the output string to stdout
+                        stdout.buffer.write(out.encode())
 
-                    # Write the output string to stdout
-                    stdout.buffer.write(out.encode())
+            else:
+                out = "no active tx found\n"
+                stdout.buffer.write(out.encode())
 
-        else:
-            out = "no active tx found\n"
-            stdout.buffer.write(out.encode())
\ No newline at end of file
+
+if PUSH_MODE:
+    run_push()
+else:
+    run_poll()
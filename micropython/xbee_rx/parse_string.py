@@ -3,6 +3,10 @@ Function to parse the string of data received from the robot.
 """
 
 
+# Fragments this far behind the last sequence id, or less, are dropped as duplicates or late arrivals
+STALE_WINDOW = 16
+
+
 def parse_string(data, parsingParameters):
     # Get the parsing parameters from the list
     startLen = parsingParameters[0]
@@ -46,3 +50,90 @@ def parse_string(data, parsingParameters):
             break
 
     return parsedData
+
+
+def parse_unicast(data, parsingParameters):
+    # Unicast packets only carry this robot's pose:
+    # $ matchbit[1] time[4] found[1] x[3] y[3] angle[3] checksum[2] ;
+    startLen = parsingParameters[0]
+    timeLen = parsingParameters[1]
+    coordLen = parsingParameters[3]
+    angleLen = parsingParameters[4]
+
+    parsedData = {}
+    parsedData["start"] = data[0:startLen]
+    parsedData["matchbit"] = data[startLen]
+    i = startLen + 1
+    parsedData["time"] = data[i : i + timeLen]
+    i = i + timeLen
+    parsedData["found"] = data[i] == "1"
+    i = i + 1
+    parsedData["robot"] = (
+        data[i : i + coordLen]
+        + ","
+        + data[i + coordLen : i + (coordLen * 2)]
+        + ","
+        + data[i + (coordLen * 2) : i + (coordLen * 2) + angleLen]
+    )
+
+    return parsedData
+
+
+def parse_fragment(data, robotTag, state, parsingParameters):
+    # Fragments carry a chunk of the robots with 3-digit IDs and no angle:
+    # @ matchbit[1] time[4] seq[2] index[1] count[1] (id[3] x[3] y[3])* checksum[2] ;
+    # Returns None if the fragment is corrupt, stale or does not settle this robot's pose.
+    # state keeps the last sequence id and the fragments received since this robot was last in one.
+    startLen = parsingParameters[0]
+    timeLen = parsingParameters[1]
+    coordLen = parsingParameters[3]
+    angleLen = parsingParameters[4]
+    idLen = 3
+    headerLen = startLen + 1 + timeLen + 4
+
+    if len(data) < headerLen + 3 or (len(data) - headerLen - 3) % (idLen + coordLen * 2) != 0:
+        return None
+
+    # The checksum covers everything before it, plus the ";"
+    try:
+        checksum = int(data[-3:-1])
+        seq = int(data[startLen + 1 + timeLen : startLen + 3 + timeLen], 16)
+        count = int(data[headerLen - 1], 16)
+    except ValueError:
+        return None
+    if (sum([ord(c) for c in data[:-3]]) + ord(";")) % 64 != checksum:
+        return None
+
+    # Drop duplicates and late fragments up to STALE_WINDOW behind the last one, the sequence id wraps at 256.
+    # Anything further back is taken as a new sequence (a long dropout or a restarted server), so the
+    # receiver resynchronizes at once instead of waiting for the sequence to wrap past the old value.
+    if state.get("seq") is not None and (state["seq"] - seq) % 256 < STALE_WINDOW:
+        return None
+    state["seq"] = seq
+
+    parsedData = {}
+    parsedData["start"] = data[0:startLen]
+    parsedData["matchbit"] = data[startLen]
+    parsedData["time"] = data[startLen + 1 : startLen + 1 + timeLen]
+
+    i = headerLen
+    while i < len(data) - 3:
+        if data[i : i + idLen] == robotTag:
+            state["missed"] = 0
+            parsedData["found"] = True
+            parsedData["robot"] = (
+                data[i + idLen : i + idLen + coordLen]
+                + ","
+                + data[i + idLen + coordLen : i + idLen + coordLen * 2]
+                + ","
+                + "9" * angleLen
+            )
+            return parsedData
+        i = i + idLen + coordLen * 2
+
+    # The robot is only missing once a whole round of fragments went by without it
+    state["missed"] = state.get("missed", 0) + 1
+    if state["missed"] < max(1, count):
+        return None
+    parsedData["found"] = False
+    return parsedData